@@ -1,4 +1,5 @@
 from fastapi import Depends, HTTPException, status
+from typing import Optional
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from app.core.config import get_settings
@@ -8,26 +9,33 @@ from app.models.user import UserRead
 settings = get_settings()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserRead:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+async def get_user_from_token(token: str) -> Optional[UserRead]:
+    """Resolve a bearer token to its user, or None if it is invalid"""
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id: str = payload.get("sub")
         if user_id is None:
-            raise credentials_exception
+            return None
     except JWTError:
-        raise credentials_exception
+        return None
     
     db = await get_database()
     user = await db.users.find_one({"user_id": user_id})
     if user is None:
-        raise credentials_exception
+        return None
     return UserRead(**user)
 
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> UserRead:
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = await get_user_from_token(token)
+    if user is None:
+        raise credentials_exception
+    return user
+
 async def get_current_admin(current_user: UserRead = Depends(get_current_user)) -> UserRead:
     if current_user.role != "admin":
         raise HTTPException(
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, UploadFile, File
+from fastapi import APIRouter, UploadFile, File, Form, Request, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import sys
-import os
-import importlib.util
+from app.services.upload_staging_service import upload_staging_service
+from app.core.admission import admission_registry
+from app.core.inference import run_inference, inference_stats
+from app.core.ml_runtime import ml_runtime
 
 router = APIRouter()
 
@@ -15,71 +16,31 @@ class MLResponse(BaseModel):
     exists: bool
     existing_product: Optional[dict] = None
 
-# Load predict module dynamically
-def load_predict_module():
-    """Dynamically load the predict module and its dependencies from ml/"""
-    # Get path to ml directory
-    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    project_root = os.path.dirname(backend_dir)
-    ml_dir = os.path.join(project_root, 'ml')
-    
-    print(f"🔍 Loading ML modules from: {ml_dir}")
-    
-    if not os.path.exists(ml_dir):
-        raise FileNotFoundError(f"ml directory not found at {ml_dir}")
-    
-    # Add ml directory to path so imports work
-    if ml_dir not in sys.path:
-        sys.path.insert(0, ml_dir)
-    
-    # Load config module first (required by predict)
-    config_path = os.path.join(ml_dir, 'config.py')
-    if os.path.exists(config_path):
-        spec = importlib.util.spec_from_file_location("config", config_path)
-        config_module = importlib.util.module_from_spec(spec)
-        sys.modules["config"] = config_module
-        spec.loader.exec_module(config_module)
-        print(f"✅ Loaded config module")
-    
-    # Load data_loader module (required by predict)
-    data_loader_path = os.path.join(ml_dir, 'data_loader.py')
-    if os.path.exists(data_loader_path):
-        spec = importlib.util.spec_from_file_location("data_loader", data_loader_path)
-        data_loader_module = importlib.util.module_from_spec(spec)
-        sys.modules["data_loader"] = data_loader_module
-        spec.loader.exec_module(data_loader_module)
-        print(f"✅ Loaded data_loader module")
-    
-    # Load predict module
-    predict_path = os.path.join(ml_dir, 'predict.py')
-    if not os.path.exists(predict_path):
-        raise FileNotFoundError(f"predict.py not found at {predict_path}")
-    
-    spec = importlib.util.spec_from_file_location("predict", predict_path)
-    predict_module = importlib.util.module_from_spec(spec)
-    sys.modules["predict"] = predict_module
-    spec.loader.exec_module(predict_module)
-    print(f"✅ Loaded predict module")
-    
-    return predict_module
+def _classify_upload(cancel_token, upload):
+    """Inference-pool job: classify a staged upload"""
+    return upload.classify(ml_runtime.predict_module, cancel_token)
 
 @router.post("/classify-and-predict", response_model=MLResponse)
-async def classify_and_predict(file: UploadFile = File(...)):
+async def classify_and_predict(
+    request: Request,
+    file: Optional[UploadFile] = File(None),
+    upload_token: Optional[str] = Form(None)
+):
     """
     Classify pet image and predict breed using trained TensorFlow model
+    Accepts either the image file or an `upload_token` from POST /uploads/
     Falls back to stub if model not available
+    Answers 503 "warming" until the ML stack has finished loading
     """
+    ml_runtime.require_ready()
+
+    # Resolve the image first so a missing/expired token is reported as such
+    upload = await upload_staging_service.resolve(file, upload_token)
+
     try:
-        # Load predict module
-        predict_module = load_predict_module()
-        
-        # Read image bytes
-        image_bytes = await file.read()
-        
-        # Get classifier and make prediction
-        # Get classifier and make prediction
-        classifier = predict_module.get_classifier()
-        result = classifier.predict_from_bytes(image_bytes)
+        # Classify off the event loop; dropped if the client disconnects
+        # (cached on staged uploads)
+        result = await run_inference(request, _classify_upload, upload)
         
         confidence = result.get('confidence', 0.0)
         print(f"✅ Prediction: {result['product_type']} - {result['product_name']} (confidence: {confidence:.2f})")
@@ -104,6 +65,8 @@ async def classify_and_predict(file: UploadFile = File(...)):
             exists=False,
             existing_product=None
         )
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the actual error for debugging
         print(f"❌ Model prediction error: {type(e).__name__}: {str(e)}")
@@ -119,3 +82,23 @@ async def classify_and_predict(file: UploadFile = File(...)):
             exists=False,
             existing_product=None
         )
+
+
+@router.get("/status")
+async def get_ml_status():
+    """Whether the ML stack is cold, warming, ready or failed, with per-module import times"""
+    return ml_runtime.get_status()
+
+@router.get("/metrics")
+async def get_ml_metrics():
+    """
+    Load metrics for the ML endpoints: per-endpoint queue depth, in-flight
+    requests and shed counts, cancelled inference work and the staged
+    upload store size
+    """
+    return {
+        "runtime": ml_runtime.get_status(),
+        "admission": admission_registry.get_metrics(),
+        "inference": inference_stats.get_metrics(),
+        "uploads": upload_staging_service.get_stats()
+    }
@@ -1,17 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, UploadFile, File, Form, Request, HTTPException
 from pydantic import BaseModel
 from typing import Optional
-import sys
-import os
-
-# Add ml directory to path
-backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-project_root = os.path.dirname(backend_dir)
-ml_dir = os.path.join(project_root, 'ml')
-if ml_dir not in sys.path:
-    sys.path.insert(0, ml_dir)
-
-from predict_price import predict_price_from_bytes
+from app.services.upload_staging_service import upload_staging_service
+from app.core.inference import run_inference
+from app.core.ml_runtime import ml_runtime
 
 router = APIRouter()
 
@@ -19,9 +11,33 @@ class PricePredictionResponse(BaseModel):
     predicted_price: float
     metadata: dict
 
+def _price_upload(cancel_token, upload, *metadata):
+    """Inference-pool job: predict the price of a staged upload"""
+    return upload.predict_price(ml_runtime.predict_price_module.predict_price, *metadata)
+
+def _classify_and_price_upload(cancel_token, upload, age_months, weight_kg, health_status, vaccinated, country):
+    """
+    Inference-pool job: classify, then price the predicted breed
+
+    Returns (breed_result, predicted_price); price is None below the
+    confidence threshold. Stops between stages once cancelled.
+    """
+    breed_result = upload.classify(ml_runtime.predict_module, cancel_token)
+    if breed_result.get('confidence', 0.0) < 0.40:
+        return breed_result, None
+    cancel_token.check()
+    predicted_price = upload.predict_price(
+        ml_runtime.predict_price_module.predict_price,
+        breed_result['product_type'], breed_result['product_name'],
+        age_months, weight_kg, health_status, vaccinated, country
+    )
+    return breed_result, predicted_price
+
 @router.post("/predict-price", response_model=PricePredictionResponse)
 async def predict_price(
-    image: UploadFile = File(...),
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    upload_token: Optional[str] = Form(None),
     pet_type: str = Form(...),
     breed: str = Form(...),
     age_months: int = Form(...),
@@ -34,7 +50,8 @@ async def predict_price(
     Predict pet price based on image and metadata
     
     Args:
-        image: Pet image file
+        image: Pet image file (optional when upload_token is given)
+        upload_token: Token from POST /uploads/ instead of the image file
         pet_type: 'Dog' or 'Cat'
         breed: Breed name (e.g., 'Golden Retriever')
         age_months: Age in months (2-60)
@@ -46,23 +63,17 @@ async def predict_price(
     Returns:
         PricePredictionResponse with predicted price
     """
+    ml_runtime.require_ready()
+    upload = await upload_staging_service.resolve(image, upload_token)
+
     try:
-        # Read image bytes
-        image_bytes = await image.read()
-        
         # Convert vaccinated to int
         vaccinated_int = 1 if vaccinated else 0
         
-        # Predict price
-        predicted_price = predict_price_from_bytes(
-            image_bytes=image_bytes,
-            pet_type=pet_type,
-            breed=breed,
-            age_months=age_months,
-            weight_kg=weight_kg,
-            health_status=health_status,
-            vaccinated=vaccinated_int,
-            country=country
+        # Predict price off the event loop (cached on staged uploads)
+        predicted_price = await run_inference(
+            request, _price_upload, upload,
+            pet_type, breed, age_months, weight_kg, health_status, vaccinated_int, country
         )
         
         print(f"✅ Price prediction: ${predicted_price:.2f} for {breed} from {country} ({age_months}mo, {weight_kg}kg)")
@@ -80,6 +91,8 @@ async def predict_price(
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Price prediction error: {type(e).__name__}: {str(e)}")
         import traceback
@@ -112,7 +125,9 @@ async def predict_price(
 
 @router.post("/classify-and-price", response_model=dict)
 async def classify_and_price(
-    image: UploadFile = File(...),
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    upload_token: Optional[str] = Form(None),
     age_months: int = Form(...),
     weight_kg: float = Form(...),
     health_status: int = Form(...),
@@ -129,7 +144,8 @@ async def classify_and_price(
     4. Gets price prediction
     
     Args:
-        image: Pet image
+        image: Pet image (optional when upload_token is given)
+        upload_token: Token from POST /uploads/ instead of the image file
         age_months: Age in months
         weight_kg: Weight in kg
         health_status: 0, 1, or 2
@@ -138,20 +154,21 @@ async def classify_and_price(
     Returns:
         dict with breed classification and price prediction
     """
+    ml_runtime.require_ready()
+    upload = await upload_staging_service.resolve(image, upload_token)
+
     try:
-        # Read image
-        image_bytes = await image.read()
-        
-        # First, classify the breed
-        # Import breed classifier
-        from routes_ml_stub import load_predict_module
-        predict_module = load_predict_module()
-        classifier = predict_module.get_classifier()
-        breed_result = classifier.predict_from_bytes(image_bytes)
+        # Classify then price in the inference pool (reused if the upload was
+        # already classified); dropped if the client disconnects
+        vaccinated_int = 1 if vaccinated else 0
+        breed_result, predicted_price = await run_inference(
+            request, _classify_and_price_upload, upload,
+            age_months, weight_kg, health_status, vaccinated_int, country
+        )
         
         confidence = breed_result.get('confidence', 0.0)
         
-        if confidence < 0.40:
+        if predicted_price is None:
              print(f"⚠️ Low confidence ({confidence:.2f}). Returning empty prediction.")
              return {
                 "classification": {
@@ -169,19 +186,6 @@ async def classify_and_price(
         pet_type = breed_result['product_type']
         breed = breed_result['product_name']
         
-        # Now predict price
-        vaccinated_int = 1 if vaccinated else 0
-        predicted_price = predict_price_from_bytes(
-            image_bytes=image_bytes,
-            pet_type=pet_type,
-            breed=breed,
-            age_months=age_months,
-            weight_kg=weight_kg,
-            health_status=health_status,
-            vaccinated=vaccinated_int,
-            country=country
-        )
-        
         return {
             "classification": {
                 "type": pet_type,
@@ -199,6 +203,8 @@ async def classify_and_price(
             }
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Combined prediction error: {e}")
         import traceback
@@ -4,6 +4,7 @@ from app.models.product import ProductRead, ProductCreate, ProductUpdate
 from app.models.user import UserRead
 from app.services.product_service import ProductService
 from app.api.deps import get_current_user, get_current_admin
+from app.services.upload_staging_service import upload_staging_service
 
 router = APIRouter()
 product_service = ProductService()
@@ -15,7 +16,8 @@ async def create_product(
     price_predicted: float = Form(...),
     price_modified: Optional[float] = Form(None),
     quantity: int = Form(...),
-    image: UploadFile = File(...),
+    image: Optional[UploadFile] = File(None),
+    upload_token: Optional[str] = Form(None),
     age_months: Optional[int] = Form(None),
     weight_kg: Optional[float] = Form(None),
     health_status: Optional[int] = Form(None),
@@ -25,6 +27,13 @@ async def create_product(
     prediction_confidence: Optional[float] = Form(None),
     current_user: UserRead = Depends(get_current_user)
 ):
+    # Reuse a staged upload (and its classification); the image file is the fallback
+    # when the token expired
+    upload = await upload_staging_service.resolve(image, upload_token)
+    if upload.classification and predicted_breed is None:
+        predicted_breed = upload.classification.get('product_name')
+        prediction_confidence = upload.classification.get('confidence')
+
     product_data = ProductCreate(
         product_name=product_name,
         product_type=product_type,
@@ -39,7 +48,10 @@ async def create_product(
         predicted_breed=predicted_breed,
         prediction_confidence=prediction_confidence
     )
-    return await product_service.create_product(product_data, image)
+    product = await product_service.create_product(product_data, upload.image_bytes)
+    if upload.token:
+        upload_staging_service.discard(upload.token)
+    return product
 
 @router.get("/shop/published", response_model=List[ProductRead])
 async def get_shop_products(
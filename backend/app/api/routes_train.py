@@ -1,12 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Request
+from fastapi.responses import StreamingResponse
 from typing import Optional
-import shutil
 import os
-import zipfile
-import subprocess
-import sys
+import json
+import time
+import asyncio
+from app.core.config import get_settings
+from app.core.ml_runtime import ml_runtime, STATE_READY
+from app.core.inference import inference_executor
+from app.services.training_job_service import training_jobs, FileFollower
+from app.services.breed_ingest_service import ingest_archive, validate_name
+from app.services.chunked_upload_service import chunked_uploads
 
 router = APIRouter()
+settings = get_settings()
 
 # Base path for ML data
 # Current file: backend/app/api/routes_train.py
@@ -14,182 +21,236 @@ router = APIRouter()
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 ML_DIR = os.path.join(BASE_DIR, "ml")
 TRAIN_DIR = os.path.join(ML_DIR, "data", "train")
-VAL_DIR = os.path.join(ML_DIR, "data", "val")
 
-def run_training_script(script_name: str):
+def _build_prototype(class_name: str, image_paths: list):
     """
-    Runs the python training script in a subprocess
+    Inference-pool job: compute the few-shot prototype of a new breed with the
+    served model, so it is recognised before the full retrain finishes
     """
-    script_path = os.path.join(ML_DIR, script_name)
-    
-    # Use the same python interpreter as the running process
-    python_executable = sys.executable
-    
-    # Ensure logs directory exists
-    os.makedirs(os.path.join(ML_DIR, "logs"), exist_ok=True)
-    
-    # Run in background
-    with open(os.path.join(ML_DIR, "logs", "training.log"), "a", encoding="utf-8") as log_file:
-        subprocess.Popen(
-            [python_executable, script_path],
-            cwd=ML_DIR,
-            stdout=log_file,
-            stderr=log_file
-        )
+    classifier = ml_runtime.predict_module.get_classifier()
+    if classifier.model is None:
+        return None
+    prototypes = ml_runtime.import_module("prototypes")
+    return prototypes.add_prototype(classifier.model, class_name, image_paths)
 
 @router.post("/add-breed")
 async def add_new_breed(
-    background_tasks: BackgroundTasks,
     breed_name: str = Form(...),
     product_type: str = Form(...),
     images_zip: UploadFile = File(...)
 ):
     """
     Uploads a zip of images for a new breed and triggers model training.
+    For multi-GB archives use the resumable /train/uploads protocol instead.
     """
     # 1. Validate inputs
     if not images_zip.filename.endswith('.zip'):
         raise HTTPException(status_code=400, detail="File must be a ZIP archive")
     
-    # Normalize names
-    breed_name = breed_name.strip()
-    product_type = product_type.strip() # e.g., "Dog", "Cat"
+    return await _ingest_and_queue(images_zip.file, product_type, breed_name)
+
+async def _ingest_and_queue(source, product_type: str, breed_name: str) -> dict:
+    """Shared by /add-breed and chunked upload finalize: ingest the ZIP, then queue training"""
+    # Normalize names (they become directory names)
+    breed_name = validate_name(breed_name, "breed name")
+    product_type = validate_name(product_type, "product type") # e.g., "Dog", "Cat"
     
-    # 2. Prepare directories
-    train_target_dir = os.path.join(TRAIN_DIR, product_type, breed_name)
-    val_target_dir = os.path.join(VAL_DIR, product_type, breed_name)
+    # 2. Existing breed -> Fine Tuning, new breed -> Model Surgery
+    mode = "fine_tune" if os.path.exists(os.path.join(TRAIN_DIR, product_type, breed_name)) else "add_breed"
     
-    if os.path.exists(train_target_dir):
-        # If breed exists, we are just adding more data -> Fine Tuning
-        mode = "fine_tune"
-    else:
-        # New breed -> Model Surgery
-        mode = "add_breed"
-        os.makedirs(train_target_dir, exist_ok=True)
-        os.makedirs(val_target_dir, exist_ok=True)
-        
-    # 3. Save and Extract Zip
-    zip_path = os.path.join(ML_DIR, "zips", f"{breed_name}.zip")
-    os.makedirs(os.path.dirname(zip_path), exist_ok=True)
+    # 3-4. Stream members from the archive, validate in a process pool and
+    # write each image straight to its hash-assigned split (off the event loop)
+    loop = asyncio.get_running_loop()
+    ingest = await loop.run_in_executor(None, ingest_archive, source, product_type, breed_name)
+    train_paths = ingest["train_paths"]
     
-    with open(zip_path, "wb") as buffer:
-        shutil.copyfileobj(images_zip.file, buffer)
-        
-    # Extract to a temp folder first
-    temp_extract_dir = os.path.join(ML_DIR, "temp_extract", breed_name)
-    if os.path.exists(temp_extract_dir):
-        shutil.rmtree(temp_extract_dir)
-    os.makedirs(temp_extract_dir, exist_ok=True)
+    # 5. Few-shot prototype: the new breed is predictable right away
+    prototype = None
+    if mode == "add_breed" and train_paths and ml_runtime.state == STATE_READY:
+        try:
+            prototype = await loop.run_in_executor(
+                inference_executor, _build_prototype, f"{product_type}/{breed_name}", train_paths
+            )
+        except Exception as e:
+            print(f"⚠️ Could not build prototype for '{breed_name}': {e}")
 
-    try:
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(temp_extract_dir)
-            
-        # 4. Distribute Images (80% Train, 20% Val)
-        import random
-        
-        # Find all images recursively in temp folder
-        all_images = []
-        for root, dirs, files in os.walk(temp_extract_dir):
-            for file in files:
-                if file.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    all_images.append(os.path.join(root, file))
-        
-        if not all_images:
-            raise HTTPException(status_code=400, detail="No images found in ZIP file")
-            
-        random.shuffle(all_images)
-        split_idx = int(len(all_images) * 0.8)
-        train_images = all_images[:split_idx]
-        val_images = all_images[split_idx:]
-        
-        # Move files
-        for img_path in train_images:
-            shutil.move(img_path, os.path.join(train_target_dir, os.path.basename(img_path)))
-            
-        for img_path in val_images:
-            shutil.move(img_path, os.path.join(val_target_dir, os.path.basename(img_path)))
-            
-        # Cleanup temp
-        shutil.rmtree(temp_extract_dir)
-        
-    except zipfile.BadZipFile:
-        raise HTTPException(status_code=400, detail="Invalid ZIP file")
-    except Exception as e:
-        # Cleanup on error
-        if os.path.exists(temp_extract_dir):
-            shutil.rmtree(temp_extract_dir)
-        raise HTTPException(status_code=500, detail=f"Error processing images: {str(e)}")
-        
-    # 5. Trigger Training in Background
+    # 6. Queue Training (one job at a time per model; see training_job_service).
+    # Uploads within the quiet period, or while a run is in progress, share one follow-up run
+    reason = f"{mode}: {product_type}/{breed_name}"
     if mode == "add_breed":
-        background_tasks.add_task(run_training_script, "add_breed.py")
-        message = f"New breed '{breed_name}' added ({len(train_images)} train, {len(val_images)} val). Model training started in background."
+        job = training_jobs.submit("add_breed.py", reason=reason, coalesce=True)
+        message = f"New breed '{breed_name}' added ({ingest['train']} train, {ingest['val']} val). Model training queued."
+        if prototype:
+            message += " The breed can already be recognised from its uploaded images."
     else:
-        background_tasks.add_task(run_training_script, "fine_tune.py")
-        message = f"Images added to existing breed '{breed_name}' ({len(train_images)} train, {len(val_images)} val). Fine-tuning started."
+        # Only the new images plus a replay sample: cost scales with the upload, not the dataset
+        job = training_jobs.submit("fine_tune.py", ("--incremental",), reason=reason, coalesce=True)
+        message = f"Images added to existing breed '{breed_name}' ({ingest['train']} train, {ingest['val']} val). Fine-tuning queued."
+    merged = len(job.get("requests") or []) - 1
+    if merged > 0:
+        message += f" Merged with {merged} earlier upload(s) into one {job['script']} run."
         
     return {
         "status": "success",
         "message": message,
         "mode": mode,
+        "job_id": job["id"],
+        "ingest": {k: v for k, v in ingest.items() if k != "train_paths"},
+        "prototype": prototype,
         "breed": breed_name,
         "type": product_type
     }
 
+@router.post("/uploads")
+async def create_chunked_upload(
+    filename: str = Form(...),
+    total_size: int = Form(...),
+    breed_name: str = Form(...),
+    product_type: str = Form(...)
+):
+    """
+    Start a resumable upload. Send the archive with PUT /uploads/{upload_id}
+    in chunks of at most `chunk_size` bytes, then POST .../finalize.
+    """
+    breed_name = validate_name(breed_name, "breed name")
+    product_type = validate_name(product_type, "product type")
+    return chunked_uploads.create(filename, total_size, product_type, breed_name)
+
+@router.get("/uploads/{upload_id}")
+async def get_chunked_upload(upload_id: str):
+    """Current offset of an upload, to resume after a failed or interrupted chunk"""
+    return chunked_uploads.describe(chunked_uploads.get(upload_id))
+
+@router.put("/uploads/{upload_id}")
+async def put_upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int,
+    x_chunk_sha256: Optional[str] = Header(None)
+):
+    """
+    Append the raw request body at `offset`. The X-Chunk-SHA256 header (hex
+    SHA-256 of the chunk) is required; 409 returns the offset to resume from.
+    """
+    return await chunked_uploads.write_chunk(upload_id, offset, x_chunk_sha256, request.stream())
+
+@router.post("/uploads/{upload_id}/finalize")
+async def finalize_chunked_upload(upload_id: str):
+    """
+    Ingest a complete upload exactly like /add-breed and queue training.
+    The session is deleted afterwards, whether or not the archive was valid.
+    """
+    loop = asyncio.get_running_loop()
+    meta = await loop.run_in_executor(None, chunked_uploads.complete, upload_id)
+    try:
+        return await _ingest_and_queue(chunked_uploads.data_path(upload_id), meta["product_type"], meta["breed_name"])
+    finally:
+        await loop.run_in_executor(None, chunked_uploads.discard, upload_id)
+
+@router.delete("/uploads/{upload_id}")
+async def abort_chunked_upload(upload_id: str):
+    """Abort an upload and free its share of the upload budget"""
+    if not await asyncio.get_running_loop().run_in_executor(None, chunked_uploads.discard, upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found or expired")
+    return {"message": "Upload discarded"}
+
 @router.get("/status")
 async def get_training_status():
     """
-    Check if a training process is running
+    Current training job (running, else oldest queued, else latest) from the job manager
     """
-    # Simple check: see if python process with our script is running
-    # This is a basic implementation. For production, use Redis/Celery.
-    # For now, we can check the log file's last modification time or lock file.
-    
-    log_file = os.path.join(ML_DIR, "logs", "training.log")
-    if not os.path.exists(log_file):
-        return {"status": "idle", "logs": []}
-        
-    # Read last 50 lines of log
-    try:
-        with open(log_file, "r", encoding="utf-8", errors="replace") as f:
-            # Efficiently read last N lines
-            lines = f.readlines()
-            last_lines = lines[-50:] if lines else []
-            
-        # Determine status based on last log line
-        status = "running"
-        if last_lines:
-            last_line = last_lines[-1].strip()
-            # Check for various completion messages
-            if ("Training Complete" in last_line or 
-                "Fine-Tuning Complete" in last_line or 
-                "SUCCESS: New breed added" in last_line or
-                "Error" in last_line):
-                status = "completed"
-            elif "Epoch" in last_line:
-                status = "training"
-                
-        return {
-            "status": status,
-            "logs": [line.strip() for line in last_lines]
-        }
-    except Exception as e:
-        return {"status": "error", "logs": [str(e)]}
+    return {**training_jobs.get_status(), "logs": training_jobs.tail_log(50)}
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _training_event_stream(request: Request, job_id: Optional[str]):
+    """
+    Push status changes, progress events and new log lines as they are written.
+    Each tick costs a couple of stat() calls plus reading only the new bytes.
+    """
+    snapshot = training_jobs.get_status(job_id)
+    yield _sse("status", {**snapshot, "logs": training_jobs.tail_log(50)})
+
+    log_follower = FileFollower(training_jobs.log_path)
+    events_follower = None
+    followed_job = None
+    last_key = None
+    last_sent = time.monotonic()
+
+    while not await request.is_disconnected():
+        job = training_jobs.find_job(job_id) if job_id else training_jobs.current_job()
+        key = (job["id"], job["status"]) if job else None
+        chunks = []
+
+        lines = log_follower.read_new()
+        if lines:
+            chunks.append(_sse("log", {"lines": lines}))
+
+        if job is not None and job["id"] != followed_job:
+            # A newly followed job: its events are all new, except those already in the snapshot
+            followed_job = job["id"]
+            events_follower = FileFollower(job["events_path"], from_end=last_key is None)
+        if events_follower is not None:
+            for line in events_follower.read_new():
+                try:
+                    chunks.append(_sse("progress", json.loads(line)))
+                except ValueError:
+                    continue
+
+        if key != last_key:
+            if last_key is not None:
+                chunks.append(_sse("status", training_jobs.get_status(job_id)))
+            last_key = key
+
+        if chunks:
+            yield "".join(chunks)
+            last_sent = time.monotonic()
+        elif time.monotonic() - last_sent > 15:
+            yield ": keepalive\n\n"
+            last_sent = time.monotonic()
+        await asyncio.sleep(settings.TRAINING_EVENTS_POLL_SECONDS)
+
+@router.get("/events")
+async def stream_training_events(request: Request, job_id: Optional[str] = None):
+    """
+    Server-sent events: `status` (on connect and on every job state change),
+    `progress` (epoch events from the training callback) and `log` (new lines)
+    """
+    if job_id is not None:
+        training_jobs.get_job(job_id)  # 404 for unknown jobs
+    return StreamingResponse(
+        _training_event_stream(request, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/jobs")
+async def list_training_jobs(limit: int = 20):
+    """Recent training jobs, newest first"""
+    return {"jobs": training_jobs.list_jobs(limit)}
+
+@router.get("/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """One job with its full progress event history"""
+    job = training_jobs.get_job(job_id)
+    return {**job, "events": training_jobs.read_events(training_jobs.find_job(job_id) or {})}
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str):
+    """Cancel a queued job or stop a running one"""
+    return training_jobs.cancel(job_id)
+
+def get_train_manifest():
+    """Cached manifest of ml/data/train (refreshed incrementally from directory mtimes)"""
+    return ml_runtime.import_module("dataset_manifest").get_manifest(TRAIN_DIR)
+
 @router.get("/breeds/{product_type}")
 async def get_existing_breeds(product_type: str):
     """
     List all existing breeds for a given product type
     """
-    type_dir = os.path.join(TRAIN_DIR, product_type)
-    if not os.path.exists(type_dir):
-        return {"breeds": []}
-        
-    breeds = []
-    for item in os.listdir(type_dir):
-        if os.path.isdir(os.path.join(type_dir, item)):
-            breeds.append(item)
-            
+    breeds = get_train_manifest().breeds_by_type().get(product_type, [])
     return {"breeds": sorted(breeds)}
 
 @router.get("/all-breeds")
@@ -197,18 +258,7 @@ async def get_all_breeds():
     """
     List all existing breeds grouped by product type
     """
-    all_breeds = {}
-    
-    if not os.path.exists(TRAIN_DIR):
-        return all_breeds
-        
-    for product_type in os.listdir(TRAIN_DIR):
-        type_dir = os.path.join(TRAIN_DIR, product_type)
-        if os.path.isdir(type_dir):
-            breeds = []
-            for item in os.listdir(type_dir):
-                if os.path.isdir(os.path.join(type_dir, item)):
-                    breeds.append(item)
-            all_breeds[product_type] = sorted(breeds)
-            
-    return all_breeds
+    return {
+        product_type: sorted(breeds)
+        for product_type, breeds in get_train_manifest().breeds_by_type().items()
+    }
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, UploadFile, File, HTTPException
+from app.services.upload_staging_service import upload_staging_service
+
+router = APIRouter()
+
+@router.post("/")
+async def stage_upload(image: UploadFile = File(...)):
+    """
+    Upload an image once and get a short-lived token.
+
+    The token can be passed as `upload_token` to /ml/classify-and-predict,
+    /ml/classify-and-price, /ml/predict-price and POST /products/ instead of
+    sending the file again.
+    """
+    upload = await upload_staging_service.stage(image)
+    return {
+        "upload_token": upload.token,
+        "expires_at": upload.expires_at_utc,
+        "size": upload.size
+    }
+
+@router.delete("/{upload_token}")
+async def discard_upload(upload_token: str):
+    """Release a staged upload that will not be used"""
+    if not upload_staging_service.discard(upload_token):
+        raise HTTPException(status_code=404, detail="Upload token not found or expired")
+    return {"message": "Upload discarded"}
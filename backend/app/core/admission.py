@@ -0,0 +1,226 @@
+"""
+Admission control and load shedding for the ML endpoints.
+
+Each guarded endpoint gets a concurrency limit and a bounded, prioritised
+wait queue. A request is rejected up front when the queue is full (429) or
+when its estimated wait would exceed its deadline (503), both with a
+Retry-After header, instead of piling up until it times out.
+
+The middleware runs before the request body is read, so shed requests never
+buffer their image upload.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import time
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+from app.core.config import get_settings
+from app.api.deps import get_user_from_token
+
+settings = get_settings()
+
+# Lower value = served first
+PRIORITY_ADMIN = 0
+PRIORITY_DEFAULT = 1
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded priority queue and wait estimation"""
+
+    def __init__(self, name: str, max_concurrency: int, max_queue: int,
+                 initial_service_time: float = 1.0, ewma_alpha: float = 0.2):
+        self.name = name
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.ewma_alpha = ewma_alpha
+        self.avg_service_time = initial_service_time
+        self.active = 0
+        self._waiters = []  # heap of (priority, seq, future)
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.completed = 0
+        self.shed_queue_full = 0
+        self.shed_deadline = 0
+        self.timed_out = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    def estimate_wait(self, priority: int) -> float:
+        """Seconds until a new request with this priority would get a slot"""
+        if self.active < self.max_concurrency and not self.queue_depth:
+            return 0.0
+        ahead = sum(1 for p, _, fut in self._waiters if p <= priority and not fut.done())
+        # Every max_concurrency completions free one "round" of the queue
+        rounds = (ahead // self.max_concurrency) + 1
+        return rounds * self.avg_service_time
+
+    async def acquire(self, priority: int, deadline: float):
+        """
+        Wait for a slot or raise AdmissionRejected.
+
+        Args:
+            priority: PRIORITY_ADMIN or PRIORITY_DEFAULT
+            deadline: Absolute time.monotonic() by which the request must finish
+        """
+        if self.active < self.max_concurrency and not self.queue_depth:
+            self.active += 1
+            self.admitted += 1
+            return
+
+        estimated_wait = self.estimate_wait(priority)
+        # Admin traffic is never shed for queue length, only for its deadline
+        if priority != PRIORITY_ADMIN and self.queue_depth >= self.max_queue:
+            self.shed_queue_full += 1
+            raise AdmissionRejected(429, f"{self.name} is overloaded, try again later", estimated_wait)
+
+        remaining = deadline - time.monotonic()
+        # The request still needs its own service time after the wait
+        if estimated_wait + self.avg_service_time > remaining:
+            self.shed_deadline += 1
+            raise AdmissionRejected(503, f"{self.name} cannot serve this request before its deadline", estimated_wait)
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=max(0.0, remaining - self.avg_service_time))
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Slot was handed over just as we timed out; give it back
+                self.release(None)
+            future.cancel()
+            self.timed_out += 1
+            raise AdmissionRejected(503, f"{self.name} queue wait exceeded the request deadline", self.avg_service_time)
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(None)
+            future.cancel()
+            raise
+        self.admitted += 1
+
+    def release(self, service_time: Optional[float]):
+        """Free a slot, handing it directly to the next waiter if any"""
+        if service_time is not None:
+            self.completed += 1
+            self.avg_service_time = (
+                (1 - self.ewma_alpha) * self.avg_service_time + self.ewma_alpha * service_time
+            )
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # Slot ownership moves to the waiter, active count unchanged
+                future.set_result(True)
+                return
+        self.active -= 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "avg_service_time": round(self.avg_service_time, 4),
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_deadline": self.shed_deadline,
+            "timed_out": self.timed_out
+        }
+
+
+class AdmissionRegistry:
+    """One AdmissionController per guarded path"""
+
+    def __init__(self, limits: dict, max_queue: int):
+        self.controllers = {
+            path: AdmissionController(path, concurrency, max_queue)
+            for path, concurrency in limits.items()
+        }
+
+    def get(self, path: str) -> Optional[AdmissionController]:
+        return self.controllers.get(path.rstrip("/") or path)
+
+    def get_metrics(self) -> dict:
+        return {path: controller.get_metrics() for path, controller in self.controllers.items()}
+
+
+admission_registry = AdmissionRegistry(settings.ML_CONCURRENCY_LIMITS, settings.ML_MAX_QUEUE)
+
+
+def get_request_deadline(headers: dict) -> float:
+    """
+    Absolute monotonic deadline for a request.
+
+    Clients may shorten (never extend) the server default with an
+    `X-Request-Timeout` header in seconds.
+    """
+    timeout = settings.ML_REQUEST_DEADLINE_SECONDS
+    raw = headers.get("x-request-timeout")
+    if raw:
+        try:
+            timeout = min(timeout, max(0.0, float(raw)))
+        except ValueError:
+            pass
+    return time.monotonic() + timeout
+
+
+async def get_request_priority(headers: dict) -> int:
+    """Authenticated admins jump ahead of everyone else in the wait queue"""
+    authorization = headers.get("authorization", "")
+    if not authorization.lower().startswith("bearer "):
+        return PRIORITY_DEFAULT
+    user = await get_user_from_token(authorization[7:])
+    if user is not None and user.role == "admin":
+        return PRIORITY_ADMIN
+    return PRIORITY_DEFAULT
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the registry's limits before the body is read"""
+
+    def __init__(self, app, registry: AdmissionRegistry = admission_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        controller = self.registry.get(scope["path"])
+        if controller is None or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]}
+        deadline = get_request_deadline(headers)
+        priority = await get_request_priority(headers)
+
+        try:
+            await controller.acquire(priority, deadline)
+        except AdmissionRejected as e:
+            response = JSONResponse(
+                status_code=e.status_code,
+                content={"detail": e.detail},
+                headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))}
+            )
+            return await response(scope, receive, send)
+
+        # Downstream handlers can read the deadline from the scope
+        scope.setdefault("state", {})["deadline"] = deadline
+        started = time.monotonic()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            controller.release(time.monotonic() - started)
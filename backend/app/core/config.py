@@ -18,6 +18,61 @@ class Settings(BaseSettings):
     # CORS
     BACKEND_CORS_ORIGINS: list[str] = ["*"]
 
+    # Staged uploads (image sent once, reused by classify/price/create)
+    UPLOAD_STAGING_DIR: str = os.getenv("UPLOAD_STAGING_DIR", "")  # Default: ml/staged_uploads
+    UPLOAD_TOKEN_TTL_SECONDS: int = int(os.getenv("UPLOAD_TOKEN_TTL_SECONDS", "900"))
+    UPLOAD_STAGING_MAX_ITEMS: int = int(os.getenv("UPLOAD_STAGING_MAX_ITEMS", "256"))
+    UPLOAD_STAGING_MAX_BYTES: int = int(os.getenv("UPLOAD_STAGING_MAX_BYTES", str(512 * 1024 * 1024)))
+    # Per image; same as the per-image limit of breed ZIP ingest (INGEST_MAX_MEMBER_BYTES)
+    UPLOAD_STAGING_MAX_ITEM_BYTES: int = int(os.getenv("UPLOAD_STAGING_MAX_ITEM_BYTES", str(50 * 1024 * 1024)))
+
+    # ML admission control (per-endpoint concurrency, shared queue bound and deadline)
+    ML_CONCURRENCY_LIMITS: dict[str, int] = {
+        "/ml/classify-and-predict": 2,
+        "/ml/classify-and-price": 2,
+        "/ml/predict-price": 4,
+    }
+    ML_MAX_QUEUE: int = int(os.getenv("ML_MAX_QUEUE", "16"))
+    ML_REQUEST_DEADLINE_SECONDS: float = float(os.getenv("ML_REQUEST_DEADLINE_SECONDS", "20"))
+
+    # ML inference pool (runs off the event loop so disconnects are noticed)
+    ML_INFERENCE_WORKERS: int = int(os.getenv("ML_INFERENCE_WORKERS", "2"))
+    ML_DISCONNECT_POLL_SECONDS: float = 0.1
+
+    # ML stack loading: imported in a background thread after startup so
+    # non-ML routes are served immediately
+    ML_WARMUP_ON_STARTUP: bool = os.getenv("ML_WARMUP_ON_STARTUP", "true").lower() == "true"
+    ML_PRELOAD_MODELS: bool = os.getenv("ML_PRELOAD_MODELS", "true").lower() == "true"
+    # A failed load is retried by the next ML request after this backoff (doubling, capped)
+    ML_LOAD_RETRY_SECONDS: float = float(os.getenv("ML_LOAD_RETRY_SECONDS", "10"))
+    ML_LOAD_RETRY_MAX_SECONDS: float = float(os.getenv("ML_LOAD_RETRY_MAX_SECONDS", "300"))
+
+    # Training jobs (queued, single-flight per model; see training_job_service)
+    TRAINING_JOB_TIMEOUT_SECONDS: int = int(os.getenv("TRAINING_JOB_TIMEOUT_SECONDS", str(6 * 3600)))
+    TRAINING_JOBS_HISTORY: int = int(os.getenv("TRAINING_JOBS_HISTORY", "50"))
+    TRAINING_LOG_MAX_BYTES: int = int(os.getenv("TRAINING_LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+    TRAINING_LOG_BACKUPS: int = int(os.getenv("TRAINING_LOG_BACKUPS", "3"))
+    TRAINING_EVENTS_POLL_SECONDS: float = 0.5  # /train/events checks the log and progress files this often
+    # Upload-triggered runs start after this long without further uploads (merged into one run)
+    TRAINING_QUIET_SECONDS: float = float(os.getenv("TRAINING_QUIET_SECONDS", "60"))
+    TRAINING_COALESCE_MAX_WAIT_SECONDS: float = float(os.getenv("TRAINING_COALESCE_MAX_WAIT_SECONDS", "900"))
+
+    # Breed archive ingest (/train/add-breed; see breed_ingest_service)
+    INGEST_WORKERS: int = int(os.getenv("INGEST_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+    INGEST_VAL_PERCENT: int = int(os.getenv("INGEST_VAL_PERCENT", "20"))
+    INGEST_MAX_MEMBER_BYTES: int = int(os.getenv("INGEST_MAX_MEMBER_BYTES", str(50 * 1024 * 1024)))
+    INGEST_MAX_TOTAL_BYTES: int = int(os.getenv("INGEST_MAX_TOTAL_BYTES", str(20 * 1024 * 1024 * 1024)))
+    # dHash bits (of 64) within which an upload counts as a near-duplicate of an existing image; -1 disables
+    INGEST_NEAR_DUPLICATE_DISTANCE: int = int(os.getenv("INGEST_NEAR_DUPLICATE_DISTANCE", "4"))
+    TRAIN_ARCHIVE_KEEP: int = int(os.getenv("TRAIN_ARCHIVE_KEEP", "0"))  # Uploaded ZIPs kept in ml/zips
+    TRAIN_ARCHIVE_MAX_AGE_DAYS: float = float(os.getenv("TRAIN_ARCHIVE_MAX_AGE_DAYS", "30"))
+
+    # Resumable chunked uploads (/train/uploads; see chunked_upload_service)
+    CHUNKED_UPLOAD_DIR: str = os.getenv("CHUNKED_UPLOAD_DIR", "")  # Default: ml/uploads
+    CHUNKED_UPLOAD_CHUNK_BYTES: int = int(os.getenv("CHUNKED_UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+    CHUNKED_UPLOAD_BUDGET_BYTES: int = int(os.getenv("CHUNKED_UPLOAD_BUDGET_BYTES", str(50 * 1024 * 1024 * 1024)))
+    CHUNKED_UPLOAD_TTL_SECONDS: int = int(os.getenv("CHUNKED_UPLOAD_TTL_SECONDS", str(24 * 3600)))
+
     class Config:
         case_sensitive = True
 
@@ -0,0 +1,114 @@
+"""
+Import-time profiling report.
+
+Runs a target in a fresh interpreter with `python -X importtime` and
+summarises what each module and top-level package costs, so regressions in
+API startup (e.g. TensorFlow creeping back into a module-level import) are
+easy to spot.
+
+Usage (from the backend directory):
+    python -m app.core.import_profile                 # API startup (app.main)
+    python -m app.core.import_profile --ml            # background ML warm-up
+    python -m app.core.import_profile app.seeds.seed_admin --top 15
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+ML_WARMUP_SNIPPET = "from app.core.ml_runtime import ml_runtime; ml_runtime.load()"
+
+
+def profile_imports(code: str, cwd: str) -> dict:
+    """
+    Run `code` under -X importtime and parse the report.
+
+    Returns:
+        dict: wall time, and per-module rows (self_us, cumulative_us, depth)
+    """
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=cwd,
+        capture_output=True,
+        text=True
+    )
+    wall_seconds = time.perf_counter() - started
+
+    modules = []
+    for line in proc.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        modules.append({
+            "module": name,
+            "self_us": int(self_us),
+            "cumulative_us": int(cumulative_us),
+            "depth": len(indent) // 2
+        })
+
+    return {
+        "returncode": proc.returncode,
+        "wall_seconds": wall_seconds,
+        "modules": modules,
+        "errors": [l for l in proc.stderr.splitlines() if not l.startswith("import time:")]
+    }
+
+
+def summarise_by_package(modules: list) -> list:
+    """Sum self time per top-level package (e.g. all of tensorflow.*)"""
+    totals = {}
+    for row in modules:
+        package = row["module"].split(".")[0]
+        totals[package] = totals.get(package, 0) + row["self_us"]
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def print_report(title: str, result: dict, top: int):
+    modules = result["modules"]
+    total_us = sum(row["self_us"] for row in modules)
+
+    print("=" * 70)
+    print(f"Import profile: {title}")
+    print("=" * 70)
+    print(f"Process wall time: {result['wall_seconds']:.2f}s")
+    print(f"Total import time: {total_us / 1e6:.2f}s across {len(modules)} modules")
+    if result["returncode"] != 0:
+        print(f"⚠️  Target exited with code {result['returncode']}")
+        for line in result["errors"][-10:]:
+            print(f"   {line}")
+
+    print(f"\nTop {top} packages by self time:")
+    for package, self_us in summarise_by_package(modules)[:top]:
+        share = (self_us / total_us * 100) if total_us else 0
+        print(f"  {package:<40} {self_us / 1000:>10.1f} ms  {share:5.1f}%")
+
+    print(f"\nTop {top} modules by cumulative time:")
+    for row in sorted(modules, key=lambda r: r["cumulative_us"], reverse=True)[:top]:
+        print(f"  {row['module']:<50} {row['cumulative_us'] / 1000:>10.1f} ms")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile module import cost")
+    parser.add_argument("modules", nargs="*", default=["app.main"], help="Modules to import")
+    parser.add_argument("--ml", action="store_true", help="Also profile the background ML warm-up")
+    parser.add_argument("--top", type=int, default=20, help="Rows to show per table")
+    args = parser.parse_args()
+
+    backend_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    for module in args.modules:
+        print_report(module, profile_imports(f"import {module}", backend_dir), args.top)
+
+    if args.ml:
+        print_report("ML warm-up (ml_runtime.load)", profile_imports(ML_WARMUP_SNIPPET, backend_dir), args.top)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Cancellable execution of ML inference off the event loop.
+
+Inference runs in a small thread pool so the event loop stays free to notice
+client disconnects. Every job carries a CancellationToken that trips when the
+client goes away or the request deadline passes:
+
+- jobs still queued in the pool are dropped before they start,
+- multi-stage pipelines check the token between decode, classify and price,
+- results that finish after cancellation are discarded without formatting.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+inference_executor = ThreadPoolExecutor(
+    max_workers=settings.ML_INFERENCE_WORKERS,
+    thread_name_prefix="ml-inference"
+)
+
+
+class InferenceCancelled(Exception):
+    pass
+
+
+class CancellationToken:
+    """Thread-safe cancellation flag shared between the handler and the worker"""
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self.reason: Optional[str] = None
+        self.started = False
+
+    def cancel(self, reason: str):
+        if self.reason is None:
+            self.reason = reason
+
+    def is_cancelled(self) -> bool:
+        if self.reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.reason = "deadline"
+        return self.reason is not None
+
+    def check(self):
+        """Raise InferenceCancelled if the work is no longer wanted"""
+        if self.is_cancelled():
+            raise InferenceCancelled(self.reason)
+
+
+class InferenceStats:
+    def __init__(self):
+        self.started = 0
+        self.completed = 0
+        self.dropped_before_start = 0
+        self.cancelled_in_pipeline = 0
+        self.results_discarded = 0
+        self.cancelled_by_reason = {"client_disconnected": 0, "deadline": 0}
+
+    def record_cancel(self, token: CancellationToken, finished: bool):
+        if not token.started:
+            self.dropped_before_start += 1
+        elif finished:
+            self.results_discarded += 1
+        else:
+            self.cancelled_in_pipeline += 1
+        if token.reason in self.cancelled_by_reason:
+            self.cancelled_by_reason[token.reason] += 1
+
+    def get_metrics(self) -> dict:
+        return {
+            "started": self.started,
+            "completed": self.completed,
+            "dropped_before_start": self.dropped_before_start,
+            "cancelled_in_pipeline": self.cancelled_in_pipeline,
+            "results_discarded": self.results_discarded,
+            "cancelled_by_reason": dict(self.cancelled_by_reason)
+        }
+
+
+inference_stats = InferenceStats()
+
+
+async def _watch_disconnect(request: Request, token: CancellationToken):
+    while not token.is_cancelled():
+        if await request.is_disconnected():
+            token.cancel("client_disconnected")
+            return
+        await asyncio.sleep(settings.ML_DISCONNECT_POLL_SECONDS)
+
+
+async def run_inference(request: Request, fn, *args):
+    """
+    Run `fn(token, *args)` in the inference pool, tied to the request's lifetime.
+
+    `fn` should call `token.check()` between expensive stages. Raises a 503
+    HTTPException when the work was cancelled, so nothing downstream formats
+    or logs a result no one is waiting for.
+    """
+    deadline = getattr(request.state, "deadline", None)
+    if deadline is None:
+        deadline = time.monotonic() + settings.ML_REQUEST_DEADLINE_SECONDS
+    token = CancellationToken(deadline)
+
+    def job():
+        # Dropped here if the client left while the job sat in the pool queue
+        token.check()
+        token.started = True
+        inference_stats.started += 1
+        return fn(token, *args)
+
+    watcher = asyncio.create_task(_watch_disconnect(request, token))
+    finished = False
+    try:
+        result = await asyncio.get_running_loop().run_in_executor(inference_executor, job)
+        finished = True
+        token.check()
+    except InferenceCancelled:
+        inference_stats.record_cancel(token, finished)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Inference cancelled ({token.reason})",
+            headers={"Retry-After": "1"}
+        )
+    finally:
+        watcher.cancel()
+
+    inference_stats.completed += 1
+    return result
@@ -0,0 +1,187 @@
+"""
+Lazy, background loading of the ML stack (TensorFlow, predict, predict_price).
+
+Importing TensorFlow costs seconds and hundreds of MB, so nothing in the API
+imports it at module load. The worker starts serving /auth, /products etc.
+immediately while a background thread imports the ML modules and (optionally)
+loads the models. Until that finishes, ML routes answer 503 "warming".
+A failed load (e.g. a model file read while a promotion renames it) is retried
+by the next ML request after ML_LOAD_RETRY_SECONDS, doubling per consecutive
+failure up to ML_LOAD_RETRY_MAX_SECONDS.
+
+Only the classifier is required: if the price model fails to preload the
+stack is still ready, and /ml/predict-price answers with its breed-based
+fallback price (each request tries to load the model again).
+"""
+import importlib.util
+import os
+import sys
+import threading
+import time
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import get_settings
+
+settings = get_settings()
+
+# backend/app/core/ml_runtime.py -> project root
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+ML_DIR = os.path.join(PROJECT_ROOT, "ml")
+
+STATE_COLD = "cold"
+STATE_WARMING = "warming"
+STATE_READY = "ready"
+STATE_FAILED = "failed"
+
+
+class MLRuntime:
+    """Owns the ML modules for this worker process and their load state"""
+
+    def __init__(self, ml_dir: str = ML_DIR):
+        self.ml_dir = ml_dir
+        self.state = STATE_COLD
+        self.error: Optional[str] = None
+        self.price_error: Optional[str] = None
+        self.timings: dict = {}
+        self.predict_module = None
+        self.predict_price_module = None
+        self.failures = 0
+        self.failed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_module(self, name: str):
+        """Import ml/<name>.py under its plain name (the ml scripts import each other that way)"""
+        if name in sys.modules:
+            return sys.modules[name]
+        path = os.path.join(self.ml_dir, f"{name}.py")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{name}.py not found at {path}")
+        started = time.perf_counter()
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[name] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception:
+            del sys.modules[name]
+            raise
+        self.timings[name] = round(time.perf_counter() - started, 3)
+        return module
+
+    def import_module(self, name: str):
+        """
+        Import a lightweight ml/ module (no TensorFlow, e.g. dataset_manifest)
+        without warming the whole stack
+        """
+        if self.ml_dir not in sys.path:
+            sys.path.insert(0, self.ml_dir)
+        return self._load_module(name)
+
+    def load(self):
+        """Import the ML stack (and preload models if configured). Idempotent, blocking."""
+        with self._lock:
+            if self.state == STATE_READY:
+                return
+            self.state = STATE_WARMING
+            self.error = None
+            started = time.perf_counter()
+            try:
+                print(f"🔍 Loading ML modules from: {self.ml_dir}")
+                if not os.path.exists(self.ml_dir):
+                    raise FileNotFoundError(f"ml directory not found at {self.ml_dir}")
+                if self.ml_dir not in sys.path:
+                    sys.path.insert(0, self.ml_dir)
+
+                # Order matters: predict imports config and data_loader by name
+                self._load_module("config")
+                self._load_module("data_loader")
+                self.predict_module = self._load_module("predict")
+                self.predict_price_module = self._load_module("predict_price")
+
+                if settings.ML_PRELOAD_MODELS:
+                    t = time.perf_counter()
+                    self.predict_module.get_classifier()
+                    self.timings["classifier_model"] = round(time.perf_counter() - t, 3)
+                    self._preload_price_model()
+
+                self.timings["total"] = round(time.perf_counter() - started, 3)
+                self.state = STATE_READY
+                self.failures = 0
+                print(f"✅ ML stack ready in {self.timings['total']:.1f}s")
+            except Exception as e:
+                self.failures += 1
+                self.failed_at = time.monotonic()
+                self.state = STATE_FAILED
+                self.error = f"{type(e).__name__}: {e}"
+                print(f"❌ ML stack failed to load: {self.error} (retry in {self.retry_delay():.0f}s)")
+
+    def _preload_price_model(self):
+        """Non-fatal: price routes fall back to breed-based prices without the model"""
+        t = time.perf_counter()
+        try:
+            predictor = self.predict_price_module.PricePredictorSingleton()
+            predictor.get_model()
+            predictor.get_encoders()
+        except Exception as e:
+            self.price_error = f"{type(e).__name__}: {e}"
+            print(f"⚠️  Price model failed to preload: {self.price_error} (serving fallback prices)")
+            return
+        self.price_error = None
+        self.timings["price_model"] = round(time.perf_counter() - t, 3)
+
+    def retry_delay(self) -> float:
+        """Backoff before the next load attempt after consecutive failures"""
+        delay = settings.ML_LOAD_RETRY_SECONDS * 2 ** max(0, self.failures - 1)
+        return min(delay, settings.ML_LOAD_RETRY_MAX_SECONDS)
+
+    def _retry_in(self) -> float:
+        """Seconds until a failed load may be retried (0 = now)"""
+        if self.failed_at is None:
+            return 0.0
+        return max(0.0, self.failed_at + self.retry_delay() - time.monotonic())
+
+    def start_warmup(self):
+        """Begin loading in a daemon thread; returns immediately"""
+        if self.state == STATE_READY or (self._thread is not None and self._thread.is_alive()):
+            return
+        self.state = STATE_WARMING
+        self._thread = threading.Thread(target=self.load, name="ml-warmup", daemon=True)
+        self._thread.start()
+
+    def require_ready(self):
+        """
+        Guard for ML routes. Starts warming on first use if it wasn't started,
+        retries a failed load once its backoff has passed, and answers 503
+        until the stack is ready.
+        """
+        if self.state == STATE_READY:
+            return
+        if self.state == STATE_COLD or (self.state == STATE_FAILED and self._retry_in() == 0):
+            self.start_warmup()
+        if self.state == STATE_FAILED:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail={"status": STATE_FAILED, "error": self.error},
+                headers={"Retry-After": str(max(1, int(self._retry_in() + 0.999)))}
+            )
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={"status": STATE_WARMING, "message": "ML models are warming up"},
+            headers={"Retry-After": "5"}
+        )
+
+    def get_status(self) -> dict:
+        return {
+            "status": self.state,
+            "error": self.error,
+            "price_error": self.price_error,
+            "failures": self.failures,
+            "retry_in_seconds": round(self._retry_in(), 1) if self.state == STATE_FAILED else None,
+            "import_seconds": dict(self.timings)
+        }
+
+
+ml_runtime = MLRuntime()
@@ -0,0 +1,310 @@
+"""
+Catalog-wide re-classify / re-price job.
+
+After a new classifier (train.py, fine_tune.py, add_breed.py) or price model
+(train_price_model.py) is produced, the stored predicted_breed,
+prediction_confidence and price_predicted of existing products are stale.
+This job streams products from Mongo in _id order, decodes their stored images
+in parallel, runs batched classifier + price inference and writes the results
+back with unordered bulk writes.
+
+It checkpoints the last processed _id after every batch, so an interrupted
+run resumes where it stopped. The checkpoint is tied to the model files it was
+started with; if the models change, the next run starts over.
+
+Usage (from the backend directory):
+    python -m app.jobs.reclassify_catalog
+    python -m app.jobs.reclassify_catalog --max-rate 20 --threads 2     # gentle, alongside the live API
+    python -m app.jobs.reclassify_catalog --only price                   # price model changed only
+    python -m app.jobs.reclassify_catalog --reset --dry-run
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from app.core.ml_runtime import ml_runtime, PROJECT_ROOT, STATE_READY
+from app.db.mongo import mongo_db
+
+DEFAULT_CHECKPOINT = os.path.join(PROJECT_ROOT, "ml", "logs", "reclassify_checkpoint.json")
+
+# Same cut-off as /ml/classify-and-price: below it the breed is not trusted for pricing
+MIN_PRICE_CONFIDENCE = 0.40
+
+PRICE_FIELDS = ("age_months", "weight_kg", "health_status", "vaccinated")
+PROJECTION = {
+    "image": 1, "product_type": 1, "predicted_breed": 1, "country": 1, **{f: 1 for f in PRICE_FIELDS}
+}
+
+
+def model_signature(config) -> dict:
+    """Size and mtime of every model artifact the job's results depend on"""
+    signature = {}
+    for path in (
+        config.SERVED_POINTER_PATH,  # Replaced on every classifier promotion
+        config.MODEL_PATH,
+        os.path.join(config.MODEL_DIR, "class_mapping.json"),
+        config.PRICE_MODEL_PATH,
+        config.PRICE_ENCODERS_PATH,
+    ):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[os.path.basename(path)] = [stat.st_size, int(stat.st_mtime)]
+    return signature
+
+
+class Checkpoint:
+    """Progress of one run, persisted atomically after every batch"""
+
+    def __init__(self, path: str, signature: dict, only: str):
+        self.path = path
+        self.signature = signature
+        self.only = only
+        self.last_id = None
+        self.processed = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started_at = datetime.utcnow().isoformat()
+
+    def load(self) -> bool:
+        """Resume from disk if the saved run used the same models; True if resumed"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        if data.get("signature") != self.signature or data.get("only") != self.only:
+            print("⚠️  Models or --only changed since the saved checkpoint, starting over")
+            return False
+        self.last_id = ObjectId(data["last_id"]) if data.get("last_id") else None
+        for key in ("processed", "updated", "skipped", "failed", "started_at"):
+            setattr(self, key, data.get(key, getattr(self, key)))
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "signature": self.signature,
+                "only": self.only,
+                "last_id": str(self.last_id) if self.last_id else None,
+                "processed": self.processed,
+                "updated": self.updated,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "started_at": self.started_at,
+                "saved_at": datetime.utcnow().isoformat(),
+            }, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RateLimiter:
+    """Keeps the long-run average at or below max_rate products/second"""
+
+    def __init__(self, max_rate: float):
+        self.max_rate = max_rate
+        self.started = time.monotonic()
+        self.count = 0
+
+    async def wait(self, n: int):
+        self.count += n
+        if self.max_rate <= 0:
+            return
+        ahead = self.count / self.max_rate - (time.monotonic() - self.started)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+
+
+def decode_image(predict_module, image_bytes):
+    """Decode-pool job; returns None for a missing or undecodable image"""
+    if not image_bytes:
+        return None
+    try:
+        return predict_module.preprocess_image_from_bytes(image_bytes)
+    except Exception:
+        return None
+
+
+def infer_batch(predict_module, predict_price_module, docs, arrays, only):
+    """
+    Inference for one batch; runs in a worker thread.
+
+    Returns a list of (doc, $set fields) for the products that should be updated.
+    """
+    classifications = [None] * len(docs)
+    if only in ("both", "classify"):
+        indices = [i for i, arr in enumerate(arrays) if arr is not None]
+        results = predict_module.get_classifier().predict_batch([arrays[i] for i in indices])
+        for i, result in zip(indices, results):
+            if result.get("confidence", 0.0) > 0.0:  # 0.0 means the stub model answered
+                classifications[i] = result
+
+    fields_per_doc = [{} for _ in docs]
+    price_rows, price_indices = [], []
+    for i, doc in enumerate(docs):
+        result = classifications[i]
+        if result is not None:
+            fields_per_doc[i]["predicted_breed"] = result["product_name"]
+            fields_per_doc[i]["prediction_confidence"] = result["confidence"]
+
+        if only == "classify" or any(doc.get(f) is None for f in PRICE_FIELDS):
+            continue
+        if result is not None:
+            if result["confidence"] < MIN_PRICE_CONFIDENCE:
+                continue
+            pet_type, breed = result["product_type"], result["product_name"]
+        elif only == "price" and doc.get("predicted_breed"):
+            pet_type, breed = doc.get("product_type"), doc["predicted_breed"]
+        else:
+            continue
+        price_rows.append((
+            pet_type, breed, doc["age_months"], doc["weight_kg"], doc["health_status"],
+            1 if doc["vaccinated"] else 0, doc.get("country") or "USA"
+        ))
+        price_indices.append(i)
+
+    if price_rows:
+        prices = predict_price_module.predict_prices_batch(price_rows)
+        for i, price in zip(price_indices, prices):
+            fields_per_doc[i]["price_predicted"] = round(price, 2)
+
+    return [(doc, fields) for doc, fields in zip(docs, fields_per_doc) if fields]
+
+
+async def fetch_batch(db, last_id, batch_size):
+    query = {"_id": {"$gt": last_id}} if last_id else {}
+    cursor = db.products.find(query, PROJECTION).sort("_id", 1).limit(batch_size)
+    return await cursor.to_list(length=batch_size)
+
+
+async def run(args):
+    if args.threads:
+        # Cap TensorFlow's thread pools so the job doesn't starve the live API
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(args.threads)
+        os.environ["TF_NUM_INTEROP_THREADS"] = "1"
+
+    ml_runtime.load()
+    if ml_runtime.state != STATE_READY:
+        print(f"❌ ML stack not available: {ml_runtime.error}")
+        return 1
+    predict_module = ml_runtime.predict_module
+    predict_price_module = ml_runtime.predict_price_module
+
+    checkpoint = Checkpoint(args.checkpoint, model_signature(sys.modules["config"]), args.only)
+    if args.reset:
+        checkpoint.clear()
+    elif checkpoint.load():
+        print(f"🔁 Resuming after _id {checkpoint.last_id} ({checkpoint.processed} products done)")
+
+    await mongo_db.connect_to_mongo()
+    db = mongo_db.db
+    loop = asyncio.get_running_loop()
+    decode_pool = ThreadPoolExecutor(max_workers=args.decode_workers, thread_name_prefix="reclassify-decode")
+    infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reclassify-infer")
+    limiter = RateLimiter(args.max_rate)
+
+    try:
+        remaining = await db.products.count_documents(
+            {"_id": {"$gt": checkpoint.last_id}} if checkpoint.last_id else {}
+        )
+        total = checkpoint.processed + remaining
+        print("=" * 60)
+        print(f"Re-{'classifying and pricing' if args.only == 'both' else args.only + 'ing'} {remaining} products")
+        print("=" * 60)
+
+        run_started = time.monotonic()
+        run_processed = 0
+        batch = await fetch_batch(db, checkpoint.last_id, args.batch_size)
+
+        while batch:
+            batch_started = time.monotonic()
+            # Fetch the next chunk while this one is decoded and classified
+            next_batch = asyncio.ensure_future(fetch_batch(db, batch[-1]["_id"], args.batch_size))
+
+            if args.only == "price":
+                arrays = [None] * len(batch)
+            else:
+                arrays = await asyncio.gather(*[
+                    loop.run_in_executor(decode_pool, decode_image, predict_module, doc.get("image"))
+                    for doc in batch
+                ])
+            failed = sum(1 for arr in arrays if arr is None) if args.only != "price" else 0
+
+            updates = await loop.run_in_executor(
+                infer_pool, infer_batch, predict_module, predict_price_module, batch, arrays, args.only
+            )
+
+            if updates and not args.dry_run:
+                await db.products.bulk_write(
+                    [UpdateOne({"_id": doc["_id"]}, {"$set": fields}) for doc, fields in updates],
+                    ordered=False
+                )
+
+            checkpoint.last_id = batch[-1]["_id"]
+            checkpoint.processed += len(batch)
+            checkpoint.updated += len(updates)
+            checkpoint.failed += failed
+            checkpoint.skipped += len(batch) - len(updates) - failed
+            if not args.dry_run:
+                checkpoint.save()
+
+            run_processed += len(batch)
+            elapsed = time.monotonic() - run_started
+            rate = run_processed / elapsed if elapsed > 0 else 0.0
+            eta = (total - checkpoint.processed) / rate if rate > 0 else 0.0
+            print(
+                f"  {checkpoint.processed}/{total} | batch {len(batch)} in {time.monotonic() - batch_started:.2f}s"
+                f" | {rate:.1f} products/s | updated {checkpoint.updated}, skipped {checkpoint.skipped},"
+                f" failed {checkpoint.failed} | ETA {eta:.0f}s"
+            )
+
+            await limiter.wait(len(batch))
+            if args.pause_ms:
+                await asyncio.sleep(args.pause_ms / 1000)
+            batch = await next_batch
+
+        elapsed = time.monotonic() - run_started
+        print(f"\n✅ Done: {checkpoint.processed} products, {checkpoint.updated} updated in {elapsed:.1f}s"
+              f" ({run_processed / elapsed if elapsed > 0 else 0.0:.1f} products/s)")
+        if args.dry_run:
+            print("   (dry run, nothing written)")
+        else:
+            checkpoint.clear()
+        return 0
+    finally:
+        decode_pool.shutdown(wait=False)
+        infer_pool.shutdown(wait=False)
+        await mongo_db.close_mongo_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-classify and re-price the whole product catalog")
+    parser.add_argument("--only", choices=["both", "classify", "price"], default="both",
+                        help="Which predictions to refresh (price uses the stored predicted_breed)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Products per Mongo chunk and forward pass")
+    parser.add_argument("--decode-workers", type=int, default=4, help="Threads decoding images")
+    parser.add_argument("--threads", type=int, default=0, help="TensorFlow intra-op threads (0 = TF default)")
+    parser.add_argument("--max-rate", type=float, default=0, help="Max products per second (0 = unlimited)")
+    parser.add_argument("--pause-ms", type=int, default=0, help="Extra pause between batches")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file")
+    parser.add_argument("--reset", action="store_true", help="Ignore any saved checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Run inference but write nothing")
+    args = parser.parse_args()
+
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,19 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import get_settings
 from app.db.mongo import mongo_db
-from app.api import routes_auth, routes_products, routes_stats, routes_ml_stub, routes_product_types, routes_price, routes_train
+from app.core.admission import AdmissionMiddleware
+from app.core.ml_runtime import ml_runtime
+from app.services.training_job_service import training_jobs
+from app.services.chunked_upload_service import chunked_uploads
+from app.api import routes_auth, routes_products, routes_stats, routes_ml_stub, routes_product_types, routes_price, routes_train, routes_uploads
 
 settings = get_settings()
 
 app = FastAPI(title=settings.PROJECT_NAME)
 
+# Admission control for /ml/* (added before CORS so shed responses get CORS headers)
+app.add_middleware(AdmissionMiddleware)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +29,22 @@ app.add_middleware(
 async def startup_db_client():
     await mongo_db.connect_to_mongo()
 
+@app.on_event("startup")
+async def startup_ml_warmup():
+    # Never block startup on TensorFlow; ML routes report "warming" meanwhile
+    if settings.ML_WARMUP_ON_STARTUP:
+        ml_runtime.start_warmup()
+
+@app.on_event("startup")
+async def startup_training_jobs():
+    # Resume queued training jobs and keep watching jobs that survived a restart
+    training_jobs.start()
+
+@app.on_event("startup")
+async def startup_purge_uploads():
+    # Chunked uploads abandoned while the backend was down
+    chunked_uploads.purge_expired()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     await mongo_db.close_mongo_connection()
@@ -30,6 +53,7 @@ async def shutdown_db_client():
 app.include_router(routes_auth.router, prefix="/auth", tags=["auth"])
 app.include_router(routes_products.router, prefix="/products", tags=["products"])
 app.include_router(routes_stats.router, prefix="/stats", tags=["stats"])
+app.include_router(routes_uploads.router, prefix="/uploads", tags=["uploads"])
 app.include_router(routes_ml_stub.router, prefix="/ml", tags=["ml"])
 app.include_router(routes_product_types.router, prefix="/product-types", tags=["product-types"])
 app.include_router(routes_price.router, prefix="/ml", tags=["price-prediction"])
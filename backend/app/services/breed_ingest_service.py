@@ -0,0 +1,290 @@
+"""
+Streaming ingest of breed image archives (ZIP) into ml/data/train and ml/data/val.
+
+Members are read straight from the uploaded archive (the spooled upload file
+or a finished chunked upload), never extracted to a temp folder:
+
+1. Non-image members (by extension), macOS metadata and oversized members are skipped
+2. Every image is verified and fully decoded in a process pool; corrupt files
+   and formats the training pipeline cannot read are rejected
+3. The SHA-1 of the image bytes picks the split (INGEST_VAL_PERCENT go to val)
+   and the file name suffix, so re-uploading an image (under any name) is a
+   no-op and the split never changes between uploads. With USE_SPLIT_MANIFEST
+   in ml/config.py every image goes to train: the split manifest assigns
+   train/val/test over data/train and never reads data/val
+4. Images within INGEST_NEAR_DUPLICATE_DISTANCE bits (dHash) of an image
+   already in ml/data, or earlier in the same upload, are skipped; the lookup
+   uses the perceptual-hash index of ml/near_duplicates.py, not a scan
+5. Accepted images are written once, atomically, to their final location
+   and added to that index
+
+Archives are only kept if TRAIN_ARCHIVE_KEEP > 0 (in ml/zips, pruned by
+count and TRAIN_ARCHIVE_MAX_AGE_DAYS).
+
+ingest_archive is blocking; call it from a thread (run_in_executor).
+"""
+import hashlib
+import io
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import get_settings
+from app.core.ml_runtime import ML_DIR, ml_runtime
+
+settings = get_settings()
+
+DATA_DIR = os.path.join(ML_DIR, "data")
+TRAIN_DIR = os.path.join(DATA_DIR, "train")
+VAL_DIR = os.path.join(DATA_DIR, "val")
+ARCHIVE_DIR = os.path.join(ML_DIR, "zips")
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+FORMAT_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png"}
+MAX_REJECTIONS_REPORTED = 20
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=settings.INGEST_WORKERS)
+        return _pool
+
+
+def check_image(data: bytes) -> dict:
+    """
+    Process-pool job: verify and fully decode one image
+
+    Returns:
+        dict: {"ok": True, "format", "width", "height", "dhash"} or {"ok": False, "error"}
+    """
+    from PIL import Image
+    if ML_DIR not in sys.path:
+        sys.path.insert(0, ML_DIR)
+    from near_duplicates import dhash
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+        # verify() does not decode pixel data; load() catches truncated files
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            if img.format not in FORMAT_EXTENSIONS:
+                return {"ok": False, "error": f"Unsupported format {img.format}"}
+            return {"ok": True, "format": img.format, "width": img.width, "height": img.height, "dhash": dhash(img)}
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+
+def validate_name(value: str, field: str) -> str:
+    """Breed/type names become directory names: no separators, no dot-names"""
+    value = value.strip()
+    if not value or value in (".", "..") or re.search(r'[\\/:*?"<>|\x00]', value):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid {field}: '{value}'")
+    return value
+
+
+def split_for(content_hash: str, val_percent: int) -> str:
+    """Deterministic train/val assignment from the content hash"""
+    return "val" if int(content_hash[:8], 16) % 100 < val_percent else "train"
+
+
+def _target_name(member_name: str, content_hash: str, image_format: str) -> str:
+    stem = os.path.splitext(os.path.basename(member_name))[0]
+    stem = re.sub(r'[^A-Za-z0-9_.-]+', '_', stem).strip('._')[:60] or "image"
+    return f"{stem}-{content_hash[:12]}{FORMAT_EXTENSIONS[image_format]}"
+
+
+def _write_atomic(path: str, data: bytes):
+    """Write next to the target and rename, so readers never see a partial image"""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _iter_members(archive: zipfile.ZipFile, result: dict):
+    """Yield (name, bytes) of candidate image members, enforcing the size limits"""
+    total = 0
+    for info in archive.infolist():
+        name = info.filename
+        base = os.path.basename(name)
+        if info.is_dir() or not base:
+            continue
+        if name.startswith("__MACOSX/") or base.startswith("."):
+            continue
+        if not base.lower().endswith(IMAGE_EXTENSIONS):
+            result["skipped_non_images"] += 1
+            continue
+        if info.file_size > settings.INGEST_MAX_MEMBER_BYTES:
+            _reject(result, name, f"Larger than {settings.INGEST_MAX_MEMBER_BYTES} bytes")
+            continue
+        total += info.file_size
+        if total > settings.INGEST_MAX_TOTAL_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Archive expands to more than {settings.INGEST_MAX_TOTAL_BYTES} bytes"
+            )
+        yield name, archive.read(info)
+
+
+def _reject(result: dict, name: str, reason: str):
+    result["rejected_count"] += 1
+    if len(result["rejected"]) < MAX_REJECTIONS_REPORTED:
+        result["rejected"].append({"name": name, "reason": reason})
+
+
+def ingest_archive(source, product_type: str, breed_name: str,
+                   val_percent: Optional[int] = None) -> dict:
+    """
+    Validate the images of a ZIP archive and write them to train/val
+
+    Args:
+        source: Path or seekable binary file object of the ZIP
+        product_type: e.g. "Dog"
+        breed_name: Breed folder name
+        val_percent: Share of images (by content hash) that go to validation
+            (default INGEST_VAL_PERCENT, or 0 when the split manifest is used)
+
+    Returns:
+        dict: train/val/duplicate/rejected counts, train_paths, timing, archive path
+    """
+    product_type = validate_name(product_type, "product type")
+    breed_name = validate_name(breed_name, "breed name")
+    if val_percent is None:
+        use_split_manifest = ml_runtime.import_module("config").USE_SPLIT_MANIFEST
+        val_percent = 0 if use_split_manifest else settings.INGEST_VAL_PERCENT
+    target_dirs = {
+        "train": os.path.join(TRAIN_DIR, product_type, breed_name),
+        "val": os.path.join(VAL_DIR, product_type, breed_name),
+    }
+    started = time.perf_counter()
+    result = {
+        "train": 0, "val": 0, "duplicates": 0, "near_duplicates": 0, "near_duplicate_matches": [],
+        "skipped_non_images": 0, "rejected_count": 0, "rejected": [],
+        "train_paths": [], "archive": None,
+    }
+
+    try:
+        archive = zipfile.ZipFile(source)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid ZIP file")
+
+    pool = _get_pool()
+    in_flight = deque()
+    seen = set()
+    # Hashes already on disk for this breed (the 12 hex chars before the extension)
+    existing = {
+        os.path.splitext(name)[0].rsplit("-", 1)[-1]
+        for target_dir in target_dirs.values() if os.path.isdir(target_dir)
+        for name in os.listdir(target_dir)
+    }
+    # Perceptual-hash lookup: the saved index (all splits) plus this upload's accepted images
+    near_duplicates = ml_runtime.import_module("near_duplicates")
+    max_distance = settings.INGEST_NEAR_DUPLICATE_DISTANCE
+    lookups = []
+    if max_distance >= 0:
+        lookups = [near_duplicates.get_lookup(DATA_DIR, max_distance), near_duplicates.HashIndex(max_distance)]
+    indexed = []
+
+    def finish(name, data, content_hash, future):
+        check = future.result()
+        if not check["ok"]:
+            _reject(result, name, check["error"])
+            return
+        for lookup in lookups:
+            matches = lookup.query(check["dhash"])
+            if matches:
+                result["near_duplicates"] += 1
+                if len(result["near_duplicate_matches"]) < MAX_REJECTIONS_REPORTED:
+                    match, distance = matches[0]
+                    result["near_duplicate_matches"].append({"name": name, "match": match, "distance": distance})
+                return
+        split = split_for(content_hash, val_percent)
+        target_dir = target_dirs[split]
+        target = os.path.join(target_dir, _target_name(name, content_hash, check["format"]))
+        os.makedirs(target_dir, exist_ok=True)
+        _write_atomic(target, data)
+        if lookups:
+            rel = os.path.relpath(target, DATA_DIR).replace(os.sep, "/")
+            lookups[-1].add(rel, check["dhash"])
+            indexed.append((target, check["dhash"]))
+        result[split] += 1
+        if split == "train":
+            result["train_paths"].append(target)
+
+    with archive:
+        try:
+            for name, data in _iter_members(archive, result):
+                content_hash = hashlib.sha1(data).hexdigest()
+                if content_hash in seen or content_hash[:12] in existing:
+                    result["duplicates"] += 1
+                    continue
+                seen.add(content_hash)
+                in_flight.append((name, data, content_hash, pool.submit(check_image, data)))
+                # Bound memory: at most a few images per worker are held at once
+                while len(in_flight) >= settings.INGEST_WORKERS * 4:
+                    finish(*in_flight.popleft())
+            while in_flight:
+                finish(*in_flight.popleft())
+        except zipfile.BadZipFile as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Corrupt ZIP file: {e}")
+
+    if indexed:
+        near_duplicates.add_to_index(DATA_DIR, indexed)
+
+    if result["train"] + result["val"] + result["duplicates"] + result["near_duplicates"] == 0:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="No valid images found in ZIP file")
+
+    if settings.TRAIN_ARCHIVE_KEEP > 0:
+        result["archive"] = _keep_archive(source, product_type, breed_name)
+    prune_archives()
+
+    result["seconds"] = round(time.perf_counter() - started, 2)
+    print(f"📦 Ingested {product_type}/{breed_name}: {result['train']} train, {result['val']} val, "
+          f"{result['duplicates']} duplicates, {result['near_duplicates']} near-duplicates, "
+          f"{result['rejected_count']} rejected in {result['seconds']}s")
+    return result
+
+
+def _keep_archive(source, product_type: str, breed_name: str) -> str:
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(ARCHIVE_DIR, f"{product_type}_{breed_name}_{time.strftime('%Y%m%d-%H%M%S')}.zip")
+    if isinstance(source, (str, os.PathLike)):
+        shutil.copyfile(source, path)
+    else:
+        source.seek(0)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(source, f, 1024 * 1024)
+    return path
+
+
+def prune_archives(keep: int = settings.TRAIN_ARCHIVE_KEEP,
+                   max_age_days: float = settings.TRAIN_ARCHIVE_MAX_AGE_DAYS) -> list:
+    """Delete archives beyond the newest `keep` or older than `max_age_days`; returns removed paths"""
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    archives = sorted(
+        (entry for entry in os.scandir(ARCHIVE_DIR) if entry.is_file() and entry.name.endswith(".zip")),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True
+    )
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for i, entry in enumerate(archives):
+        if i >= keep or entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+            removed.append(entry.path)
+    return removed
@@ -0,0 +1,295 @@
+"""
+Resumable chunked uploads for large breed archives.
+
+Protocol (routes in routes_train):
+
+1. POST   /train/uploads                 -> session with upload_id, chunk_size, offset 0
+2. PUT    /train/uploads/{id}?offset=N   -> raw chunk bytes + X-Chunk-SHA256 header
+3. GET    /train/uploads/{id}            -> current offset, to resume after a failure
+4. POST   /train/uploads/{id}/finalize   -> ingest (breed_ingest_service) and queue training
+
+Sessions live on disk (<CHUNKED_UPLOAD_DIR, default ml/uploads>/<id>/meta.json
+and data.part), so an interrupted upload can also be resumed after a backend
+restart. A chunk is only accepted at the current end of the file and only if
+its SHA-256 matches; a rejected chunk is never written and the offset does
+not move. Each session has a lock file, so concurrent requests for it on
+different API workers cannot interleave.
+
+Declared sizes of open sessions count against CHUNKED_UPLOAD_BUDGET_BYTES, and
+sessions not touched for CHUNKED_UPLOAD_TTL_SECONDS are deleted.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import time
+from datetime import datetime
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import get_settings
+from app.core.ml_runtime import ML_DIR
+from app.services.training_job_service import ModelLock
+
+settings = get_settings()
+
+META_FILE = "meta.json"
+DATA_FILE = "data.part"
+LOCK_FILE = "session.lock"
+
+
+class ChunkedUploadService:
+    """
+    Disk-backed upload sessions with per-chunk checksums, a byte budget and expiry.
+
+    Writes, finalize and deletion of one session are serialised by a lock file in
+    the session directory, so any API worker can serve any request of a session.
+    File I/O runs in a worker thread, off the event loop.
+    """
+
+    def __init__(self, root: str = settings.CHUNKED_UPLOAD_DIR or os.path.join(ML_DIR, "uploads"),
+                 chunk_size: int = settings.CHUNKED_UPLOAD_CHUNK_BYTES,
+                 budget_bytes: int = settings.CHUNKED_UPLOAD_BUDGET_BYTES,
+                 ttl_seconds: int = settings.CHUNKED_UPLOAD_TTL_SECONDS):
+        self.root = root
+        self.chunk_size = chunk_size
+        self.budget_bytes = budget_bytes
+        self.ttl_seconds = ttl_seconds
+
+    # ------------------------------------------------------------------ sessions
+
+    def create(self, filename: str, total_size: int, product_type: str, breed_name: str) -> dict:
+        if not filename.endswith(".zip"):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a ZIP archive")
+        if total_size <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="total_size must be positive")
+        if total_size > settings.INGEST_MAX_TOTAL_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Archive is larger than {settings.INGEST_MAX_TOTAL_BYTES} bytes"
+            )
+
+        self.purge_expired()
+        reserved = sum(meta["total_size"] for meta in self._iter_sessions())
+        if reserved + total_size > self.budget_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_507_INSUFFICIENT_STORAGE,
+                detail=f"Upload budget exhausted ({reserved} of {self.budget_bytes} bytes reserved by open uploads)"
+            )
+
+        upload_id = secrets.token_urlsafe(16)
+        session_dir = os.path.join(self.root, upload_id)
+        os.makedirs(session_dir)
+        open(os.path.join(session_dir, DATA_FILE), "wb").close()
+        meta = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "product_type": product_type,
+            "breed_name": breed_name,
+            "total_size": total_size,
+            "offset": 0,
+            "chunks": 0,
+            "created_at": datetime.utcnow().isoformat(),
+            "updated_at": time.time(),
+        }
+        self._save(meta)
+        print(f"📦 Upload session {upload_id}: {filename} ({total_size} bytes) for {product_type}/{breed_name}")
+        return self.describe(meta)
+
+    def get(self, upload_id: str) -> dict:
+        meta = self._load(upload_id)
+        if meta is None or self._is_expired(meta):
+            if meta is not None:
+                # No lock: get() also runs under the session lock, and nothing writes to an expired session
+                shutil.rmtree(self._session_dir(upload_id), ignore_errors=True)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found or expired")
+        return meta
+
+    def describe(self, meta: dict) -> dict:
+        return {
+            **{k: v for k, v in meta.items() if k != "updated_at"},
+            "chunk_size": self.chunk_size,
+            "complete": meta["offset"] == meta["total_size"],
+            "expires_at": datetime.utcfromtimestamp(meta["updated_at"] + self.ttl_seconds).isoformat(),
+        }
+
+    def discard(self, upload_id: str) -> bool:
+        """Delete a session, waiting for a chunk write in progress (blocking)"""
+        session_dir = self._session_dir(upload_id)
+        if not os.path.isdir(session_dir):
+            return False
+        try:
+            with self._session_lock(upload_id):
+                shutil.rmtree(session_dir, ignore_errors=True)
+        except HTTPException:
+            return False
+        return True
+
+    def data_path(self, upload_id: str) -> str:
+        return os.path.join(self._session_dir(upload_id), DATA_FILE)
+
+    # ------------------------------------------------------------------ chunks
+
+    async def write_chunk(self, upload_id: str, offset: int, checksum: Optional[str],
+                          body: AsyncIterator[bytes]) -> dict:
+        """
+        Append one chunk at `offset` (must equal the bytes received so far)
+
+        The chunk is received into memory (at most chunk_size bytes); checking
+        and writing it happen in a worker thread under the session's lock file.
+
+        Raises:
+            HTTPException: 409 on an offset mismatch (detail carries the current
+                offset), 422 on a checksum mismatch, 413 past total_size
+        """
+        if not checksum:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="X-Chunk-SHA256 header is required")
+
+        # Fail fast before receiving the body; checked again under the lock
+        meta = self.get(upload_id)
+        self._check_offset(meta, offset)
+
+        data = bytearray()
+        async for piece in body:
+            data += piece
+            if len(data) > self.chunk_size or offset + len(data) > meta["total_size"]:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"Chunk exceeds chunk_size ({self.chunk_size}) or the declared total_size"
+                )
+        if not data:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Empty chunk")
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._append, upload_id, offset, checksum, bytes(data)
+        )
+
+    def _append(self, upload_id: str, offset: int, checksum: str, data: bytes) -> dict:
+        """Verify and write one received chunk (blocking; runs in a worker thread)"""
+        if hashlib.sha256(data).hexdigest() != checksum.lower():
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail={"message": "Chunk checksum mismatch", "offset": offset}
+            )
+
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            self._check_offset(meta, offset)
+            with open(self.data_path(upload_id), "r+b") as f:
+                # Bytes past the recorded offset (a crash between write and meta save) are stale
+                f.truncate(offset)
+                f.seek(offset)
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+
+            meta["offset"] = offset + len(data)
+            meta["chunks"] += 1
+            meta["updated_at"] = time.time()
+            self._save(meta)
+            return self.describe(meta)
+
+    def complete(self, upload_id: str) -> dict:
+        """
+        Claim a session for finalize (blocking on the session lock; call it off the event loop)
+
+        Raises:
+            HTTPException: 409 if bytes are still missing or another finalize is running
+        """
+        with self._session_lock(upload_id):
+            meta = self.get(upload_id)
+            if meta["offset"] != meta["total_size"]:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail={"message": "Upload is incomplete", "offset": meta["offset"],
+                            "total_size": meta["total_size"]}
+                )
+            if meta.get("finalizing"):
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is already being finalized")
+            meta["finalizing"] = True
+            self._save(meta)
+            return meta
+
+    def _check_offset(self, meta: dict, offset: int):
+        if meta.get("finalizing"):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is already being finalized")
+        if offset != meta["offset"]:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Offset does not match received bytes", "offset": meta["offset"]}
+            )
+
+    @contextmanager
+    def _session_lock(self, upload_id: str):
+        """Exclusive lock on one session across threads and API worker processes (blocking)"""
+        lock = ModelLock(os.path.join(self._session_dir(upload_id), LOCK_FILE))
+        try:
+            acquired = lock.acquire(blocking=True)
+        except FileNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found or expired")
+        if not acquired:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload is busy, retry")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    # ------------------------------------------------------------------ housekeeping
+
+    def purge_expired(self) -> int:
+        expired = [meta["upload_id"] for meta in self._iter_sessions() if self._is_expired(meta)]
+        for upload_id in expired:
+            self.discard(upload_id)
+        if expired:
+            print(f"🧹 Removed {len(expired)} expired upload session(s)")
+        return len(expired)
+
+    def get_stats(self) -> dict:
+        self.purge_expired()
+        sessions = list(self._iter_sessions())
+        return {
+            "open_uploads": len(sessions),
+            "reserved_bytes": sum(meta["total_size"] for meta in sessions),
+            "received_bytes": sum(meta["offset"] for meta in sessions),
+            "budget_bytes": self.budget_bytes,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+    def _is_expired(self, meta: dict) -> bool:
+        return time.time() - meta["updated_at"] > self.ttl_seconds
+
+    def _session_dir(self, upload_id: str) -> str:
+        # Ids are token_urlsafe; anything else cannot name a session
+        if not upload_id or not all(c.isalnum() or c in "-_" for c in upload_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found or expired")
+        return os.path.join(self.root, upload_id)
+
+    def _iter_sessions(self):
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.scandir(self.root):
+            if entry.is_dir():
+                meta = self._load(entry.name)
+                if meta is not None:
+                    yield meta
+
+    def _load(self, upload_id: str) -> Optional[dict]:
+        try:
+            with open(os.path.join(self._session_dir(upload_id), META_FILE), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _save(self, meta: dict):
+        path = os.path.join(self._session_dir(meta["upload_id"]), META_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+
+chunked_uploads = ChunkedUploadService()
@@ -1,13 +1,12 @@
 from app.db.mongo import get_database
 from app.models.product import ProductCreate, ProductInDB, ProductUpdate, ProductRead
-from fastapi import UploadFile, HTTPException, status
+from fastapi import HTTPException, status
 from bson import ObjectId
 from typing import List, Optional
 
 class ProductService:
-    async def create_product(self, product_data: ProductCreate, image: UploadFile) -> ProductRead:
+    async def create_product(self, product_data: ProductCreate, image_bytes: bytes) -> ProductRead:
         db = await get_database()
-        image_bytes = await image.read()
         
         db_product = ProductInDB(
             **product_data.model_dump(),
@@ -0,0 +1,589 @@
+"""
+Training job manager for the ml/ training scripts.
+
+Replaces fire-and-forget subprocess launches:
+
+- Every job has a persistent record in ml/logs/training_jobs.json
+  (queued, running, succeeded, failed, cancelled, timed_out, lost)
+- Jobs are single-flight per model: one running job per model key, guarded
+  in-process and by a lock file, so a second backend process cannot write
+  the same MODEL_PATH concurrently
+- The record is shared by all API worker processes: every read and change
+  re-reads it under an exclusive file lock (training_jobs.lock) and writes it
+  back before releasing, so any worker can submit, merge, cancel or start
+  jobs without overwriting another worker's changes
+- Pending jobs wait in a FIFO queue
+- Coalescing submits (the upload routes) are debounced: they wait for a quiet
+  period of TRAINING_QUIET_SECONDS, and further requests for the same model
+  that arrive while a run is pending or in progress are merged into that one
+  pending follow-up run instead of queueing a retrain each
+- Queued and running jobs can be cancelled; running jobs are killed after
+  TRAINING_JOB_TIMEOUT_SECONDS
+- The scripts append JSON progress events (epoch, loss, val_accuracy,
+  images/sec) to ml/logs/jobs/<job_id>.events.jsonl through
+  model.TrainingEventsCallback; status reads them instead of guessing
+  from log lines
+- ml/logs/training.log is rotated when a job starts and it is larger than
+  TRAINING_LOG_MAX_BYTES; readers only ever seek from the end (tail_lines,
+  FileFollower), so their cost does not grow with the log
+
+Each API process runs one worker thread that starts queued jobs and watches
+running processes; a job started by another process is watched through its pid.
+"""
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+
+from fastapi import HTTPException, status
+
+from app.core.config import get_settings
+from app.core.ml_runtime import ML_DIR
+
+settings = get_settings()
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_TIMED_OUT = "timed_out"
+JOB_LOST = "lost"  # Backend restarted while the job ran; exit status unknown
+FINISHED_STATES = {JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED, JOB_TIMED_OUT, JOB_LOST}
+
+DEFAULT_MODEL = "classifier"
+# When coalesced requests ask for different scripts, the earlier entry covers the later ones:
+# a full retrain and add_breed (model surgery + all directories) include every new image
+COALESCE_PRECEDENCE = ("train.py", "add_breed.py", "fine_tune.py")
+KILL_GRACE_SECONDS = 10
+POLL_SECONDS = 0.5
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    """True if a process with this pid exists (always False on Windows, where os.kill would terminate it)"""
+    if not pid or os.name == "nt":
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def tail_lines(path: str, lines: int, block_size: int = 8192) -> list:
+    """Last `lines` lines of a text file, reading backwards from the end in blocks"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END)
+        data = b""
+        while end > 0 and data.count(b"\n") <= lines:
+            start = max(0, end - block_size)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    return data.decode("utf-8", errors="replace").splitlines()[-lines:]
+
+
+class FileFollower:
+    """
+    Incrementally read complete lines appended to a file (like tail -f)
+
+    Survives rotation/truncation: if the file was replaced or shrank, reading
+    restarts at the beginning of the new file. Each read is capped at max_bytes.
+    """
+
+    def __init__(self, path: str, from_end: bool = True, max_bytes: int = 256 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offset = 0
+        self.inode = None
+        self._partial = b""
+        if from_end and os.path.exists(path):
+            stat = os.stat(path)
+            self.offset, self.inode = stat.st_size, stat.st_ino
+
+    def read_new(self) -> list:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.offset, self.inode, self._partial = 0, stat.st_ino, b""
+        if stat.st_size == self.offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(self.max_bytes)
+        self.offset += len(data)
+        data = self._partial + data
+        lines = data.split(b"\n")
+        self._partial = lines.pop()
+        return [line.decode("utf-8", errors="replace") for line in lines]
+
+
+class ModelLock:
+    """Non-blocking, cross-process lock file (fcntl/msvcrt); released when the holder exits"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self, blocking: bool = False) -> bool:
+        if self._file is not None:
+            return True
+        f = open(self.path, "a+")
+        try:
+            if os.name == "nt":
+                import msvcrt
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        if not blocking:
+                            raise
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if os.name == "nt":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+
+class TrainingJobManager:
+    """FIFO queue of training jobs with a persistent record, single-flight per model"""
+
+    def __init__(self, ml_dir: str = ML_DIR, timeout_seconds: int = settings.TRAINING_JOB_TIMEOUT_SECONDS,
+                 history_size: int = settings.TRAINING_JOBS_HISTORY,
+                 quiet_seconds: float = settings.TRAINING_QUIET_SECONDS,
+                 max_wait_seconds: float = settings.TRAINING_COALESCE_MAX_WAIT_SECONDS):
+        self.ml_dir = ml_dir
+        self.logs_dir = os.path.join(ml_dir, "logs")
+        self.events_dir = os.path.join(self.logs_dir, "jobs")
+        self.jobs_path = os.path.join(self.logs_dir, "training_jobs.json")
+        self.log_path = os.path.join(self.logs_dir, "training.log")
+        self.timeout_seconds = timeout_seconds
+        self.history_size = history_size
+        self.quiet_seconds = quiet_seconds
+        self.max_wait_seconds = max_wait_seconds
+
+        self.jobs: dict = {}  # job_id -> record, in submission order
+        self._processes: dict = {}  # job_id -> Popen
+        self._log_files: dict = {}
+        self._locks: dict = {}  # model -> ModelLock
+        self._record_lock = ModelLock(os.path.join(self.logs_dir, "training_jobs.lock"))
+        self._depth = 0
+        self._lock = threading.RLock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ----- Persistence -----
+
+    @contextmanager
+    def _shared(self):
+        """
+        Work on the current record: hold the cross-process record lock and
+        re-read training_jobs.json first (other worker processes may have
+        changed it). Changes are written with _save() before the lock is released.
+        """
+        with self._lock:
+            outermost = self._depth == 0
+            if outermost:
+                os.makedirs(self.events_dir, exist_ok=True)
+                self._record_lock.acquire(blocking=True)
+            self._depth += 1
+            try:
+                if outermost:
+                    self._reload()
+                yield
+            finally:
+                self._depth -= 1
+                if outermost:
+                    self._record_lock.release()
+
+    def _reload(self):
+        """Replace the in-memory jobs with the record on disk"""
+        if not os.path.exists(self.jobs_path):
+            self.jobs = {}
+            return
+        try:
+            with open(self.jobs_path, "r", encoding="utf-8") as f:
+                jobs = json.load(f).get("jobs", [])
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read training job record: {e}")
+            return
+        self.jobs = {job["id"]: job for job in jobs}
+
+    def _save(self):
+        finished = [j for j in self.jobs.values() if j["status"] in FINISHED_STATES]
+        for job in finished[:-self.history_size] if len(finished) > self.history_size else []:
+            del self.jobs[job["id"]]
+            if job.get("events_path") and os.path.exists(job["events_path"]):
+                os.remove(job["events_path"])
+        tmp_path = f"{self.jobs_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"jobs": list(self.jobs.values())}, f, indent=2)
+        os.replace(tmp_path, self.jobs_path)
+
+    # ----- Public API -----
+
+    def start(self):
+        """Start the worker thread (idempotent); queued jobs from a previous run resume"""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="training-jobs", daemon=True)
+                self._thread.start()
+
+    def submit(self, script: str, args: tuple = (), model: str = DEFAULT_MODEL, reason: Optional[str] = None,
+               coalesce: bool = False) -> dict:
+        """
+        Queue a training script
+
+        Args:
+            script: Script in ml/ (e.g. "fine_tune.py")
+            args: Command line arguments
+            model: Single-flight key; jobs for the same model never overlap
+            reason: Free text shown in status (e.g. the upload that triggered it)
+            coalesce: Debounce by the quiet period and merge into a pending
+                coalescing job of the same model, if there is one
+
+        Returns:
+            dict: The job record (the existing one when merged)
+        """
+        if not os.path.exists(os.path.join(self.ml_dir, script)):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unknown training script '{script}'")
+        with self._shared():
+            now = time.time()
+            job = self._pending_coalescing_job(model) if coalesce else None
+            if job is not None:
+                self._merge(job, script, list(args), reason, now)
+            else:
+                job = {
+                    "id": uuid.uuid4().hex[:12],
+                    "script": script,
+                    "args": list(args),
+                    "model": model,
+                    "reason": reason,
+                    "status": JOB_QUEUED,
+                    "created_at": now,
+                    "started_at": None,
+                    "finished_at": None,
+                    "pid": None,
+                    "returncode": None,
+                    "error": None,
+                }
+                if coalesce:
+                    job["requests"] = [reason]
+                    job["not_before"] = now + self.quiet_seconds
+                job["events_path"] = os.path.join(self.events_dir, f"{job['id']}.events.jsonl")
+                self.jobs[job["id"]] = job
+            self._save()
+            described = self.describe(job)
+        self.start()
+        self._wakeup.set()
+        return described
+
+    def _pending_coalescing_job(self, model: str) -> Optional[dict]:
+        for job in self.jobs.values():
+            if job["model"] == model and job["status"] == JOB_QUEUED and "requests" in job:
+                return job
+        return None
+
+    def _merge(self, job: dict, script: str, args: list, reason: Optional[str], now: float):
+        """Fold a request into a pending job and restart its quiet period (capped by max_wait_seconds)"""
+        rank = {name: i for i, name in enumerate(COALESCE_PRECEDENCE)}
+        if script != job["script"] and rank.get(script, len(rank)) < rank.get(job["script"], len(rank)):
+            job["script"], job["args"] = script, args
+        elif script == job["script"]:
+            job["args"] += [arg for arg in args if arg not in job["args"]]
+        job["requests"].append(reason)
+        job["reason"] = f"{len(job['requests'])} requests: " + "; ".join(r for r in job["requests"] if r)
+        job["not_before"] = min(now + self.quiet_seconds, job["created_at"] + self.max_wait_seconds)
+        print(f"🔗 Merged into training job {job['id']} ({len(job['requests'])} requests, {job['script']})")
+
+    def cancel(self, job_id: str) -> dict:
+        """Cancel a queued job, or terminate a running one (killed after a grace period)"""
+        with self._shared():
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Training job not found")
+            if job["status"] in FINISHED_STATES:
+                raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                    detail=f"Training job already {job['status']}")
+            if job["status"] == JOB_QUEUED:
+                self._finish(job, JOB_CANCELLED)
+            else:
+                job["cancel_requested_at"] = time.time()
+                self._terminate(job)
+                self._save()
+            described = self.describe(job)
+        self._wakeup.set()
+        return described
+
+    def find_job(self, job_id: str) -> Optional[dict]:
+        """The current record of a job (None if unknown)"""
+        with self._shared():
+            return self.jobs.get(job_id)
+
+    def get_job(self, job_id: str) -> dict:
+        with self._shared():
+            job = self.jobs.get(job_id)
+            if job is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Training job not found")
+            return self.describe(job)
+
+    def list_jobs(self, limit: int = 20) -> list:
+        with self._shared():
+            return [self.describe(job) for job in list(self.jobs.values())[-limit:]][::-1]
+
+    def current_job(self) -> Optional[dict]:
+        """The running job, else the oldest queued one, else the most recent one"""
+        with self._shared():
+            jobs = list(self.jobs.values())
+        for wanted in (JOB_RUNNING, JOB_QUEUED):
+            for job in jobs:
+                if job["status"] == wanted:
+                    return job
+        return jobs[-1] if jobs else None
+
+    def queued_jobs(self) -> list:
+        with self._shared():
+            return [self.describe(job) for job in self.jobs.values() if job["status"] == JOB_QUEUED]
+
+    def read_events(self, job: dict, limit: Optional[int] = None) -> list:
+        """Progress events of a job (the last `limit` ones)"""
+        path = job.get("events_path")
+        if not path or not os.path.exists(path):
+            return []
+        events = []
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except ValueError:
+                    continue  # Partially written last line
+        return events[-limit:] if limit else events
+
+    def describe(self, job: dict) -> dict:
+        """Job record plus its latest epoch progress"""
+        summary = {k: v for k, v in job.items() if k != "events_path"}
+        progress = None
+        for event in reversed(self.read_events(job)):
+            if event.get("event") == "epoch_end":
+                metrics = event.get("metrics", {})
+                progress = {
+                    "epoch": event.get("epoch"),
+                    "epochs": event.get("epochs"),
+                    "loss": metrics.get("loss"),
+                    "accuracy": metrics.get("accuracy"),
+                    "val_loss": metrics.get("val_loss"),
+                    "val_accuracy": metrics.get("val_accuracy"),
+                    "images_per_sec": event.get("images_per_sec"),
+                }
+                break
+        summary["progress"] = progress
+        return summary
+
+    def tail_log(self, lines: int = 50) -> list:
+        """Last lines of training.log; reads only the end of the file"""
+        return tail_lines(self.log_path, lines)
+
+    def get_status(self, job_id: Optional[str] = None) -> dict:
+        """
+        Status snapshot for /train/status and the event stream
+
+        Args:
+            job_id: Report this job instead of the current one
+        """
+        if job_id is not None:
+            with self._shared():
+                job = self.jobs.get(job_id)
+        else:
+            job = self.current_job()
+        if job is None:
+            return {"status": "idle", "job": None, "queue": self.queued_jobs()}
+
+        described = self.describe(job)
+        if job["status"] == JOB_RUNNING:
+            state = "training" if described["progress"] else "running"
+        elif job["status"] == JOB_QUEUED:
+            state = "queued"
+        elif job["status"] == JOB_SUCCEEDED:
+            state = "completed"
+        elif job["status"] == JOB_CANCELLED:
+            state = "cancelled"
+        else:
+            state = "error"
+        return {"status": state, "job": described, "queue": self.queued_jobs()}
+
+    def _rotate_log(self):
+        """training.log -> training.log.1 -> ... (only while no job writes to it)"""
+        if not os.path.exists(self.log_path) or os.path.getsize(self.log_path) < settings.TRAINING_LOG_MAX_BYTES:
+            return
+        # Any worker process may be writing to it
+        if any(job["status"] == JOB_RUNNING for job in self.jobs.values()):
+            return
+        for i in range(settings.TRAINING_LOG_BACKUPS - 1, 0, -1):
+            src = f"{self.log_path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.log_path}.{i + 1}")
+        if settings.TRAINING_LOG_BACKUPS > 0:
+            os.replace(self.log_path, f"{self.log_path}.1")
+        else:
+            os.remove(self.log_path)
+
+    # ----- Worker -----
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(POLL_SECONDS)
+            self._wakeup.clear()
+            try:
+                with self._shared():
+                    self._poll_running()
+                    self._start_queued()
+            except Exception as e:
+                print(f"❌ Training job manager error: {e}")
+
+    def _busy_models(self) -> set:
+        return {job["model"] for job in self.jobs.values() if job["status"] == JOB_RUNNING}
+
+    def _start_queued(self):
+        busy = self._busy_models()
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if job["status"] != JOB_QUEUED or job["model"] in busy:
+                continue
+            if job.get("not_before") and now < job["not_before"]:
+                # Quiet period: later jobs for this model must not overtake it
+                busy.add(job["model"])
+                continue
+            lock = self._locks.setdefault(job["model"], ModelLock(
+                os.path.join(self.logs_dir, f"{job['model']}.train.lock")
+            ))
+            if not lock.acquire():
+                # Another backend process is training this model; stay queued
+                busy.add(job["model"])
+                continue
+            try:
+                self._launch(job)
+            except Exception as e:
+                lock.release()
+                self._finish(job, JOB_FAILED, error=f"Could not start: {e}")
+                continue
+            busy.add(job["model"])
+
+    def _launch(self, job: dict):
+        os.makedirs(self.logs_dir, exist_ok=True)
+        self._rotate_log()
+        log_file = open(self.log_path, "a", encoding="utf-8")
+        log_file.write(f"\n=== Training job {job['id']}: {' '.join([job['script'], *job['args']])} ===\n")
+        log_file.flush()
+
+        env = os.environ.copy()
+        env["TRAINING_EVENTS_PATH"] = job["events_path"]
+        env["TRAINING_JOB_ID"] = job["id"]
+        env["PYTHONUNBUFFERED"] = "1"  # Log lines appear as they are printed
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(self.ml_dir, job["script"]), *job["args"]],
+            cwd=self.ml_dir,
+            stdout=log_file,
+            stderr=subprocess.STDOUT,
+            env=env
+        )
+        self._processes[job["id"]] = process
+        self._log_files[job["id"]] = log_file
+        job.update(status=JOB_RUNNING, pid=process.pid, started_at=time.time())
+        self._save()
+        print(f"🚀 Training job {job['id']} started: {job['script']} (pid {process.pid})")
+
+    def _terminate(self, job: dict, force: bool = False):
+        process = self._processes.get(job["id"])
+        if process is not None:
+            if force:
+                process.kill()
+            else:
+                process.terminate()
+        elif _pid_alive(job.get("pid")):
+            os.kill(job["pid"], signal.SIGKILL if force else signal.SIGTERM)
+
+    def _poll_running(self):
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if job["status"] != JOB_RUNNING:
+                continue
+            process = self._processes.get(job["id"])
+            if process is None:
+                # Started by another worker process, or by a previous backend process
+                if not _pid_alive(job.get("pid")):
+                    self._finish(job, JOB_CANCELLED if job.get("cancel_requested_at") else JOB_LOST,
+                                 error=None if job.get("cancel_requested_at") else "Exit status unknown")
+                continue
+
+            returncode = process.poll()
+            if returncode is not None:
+                if job.get("cancel_requested_at"):
+                    outcome = JOB_CANCELLED
+                elif job.get("timed_out_at"):
+                    outcome = JOB_TIMED_OUT
+                else:
+                    outcome = JOB_SUCCEEDED if returncode == 0 else JOB_FAILED
+                self._finish(job, outcome, returncode=returncode,
+                             error=f"Exited with code {returncode}" if outcome == JOB_FAILED else None)
+                continue
+
+            if self.timeout_seconds and not job.get("timed_out_at") and now - job["started_at"] > self.timeout_seconds:
+                job["timed_out_at"] = now
+                self._terminate(job)
+                self._save()
+            stop_requested = job.get("cancel_requested_at") or job.get("timed_out_at")
+            if stop_requested and now - stop_requested > KILL_GRACE_SECONDS:
+                self._terminate(job, force=True)
+
+    def _finish(self, job: dict, outcome: str, returncode: Optional[int] = None, error: Optional[str] = None):
+        job.update(status=outcome, finished_at=time.time(), returncode=returncode)
+        if error:
+            job["error"] = error
+        if outcome == JOB_TIMED_OUT:
+            job["error"] = f"Timed out after {self.timeout_seconds}s"
+        launched_here = self._processes.pop(job["id"], None) is not None
+        log_file = self._log_files.pop(job["id"], None)
+        if log_file is not None:
+            log_file.write(f"=== Training job {job['id']} {outcome} ===\n")
+            log_file.close()
+        lock = self._locks.get(job["model"])
+        if lock is not None and launched_here:
+            lock.release()
+        self._save()
+        if job.get("started_at"):
+            print(f"🏁 Training job {job['id']} {outcome}")
+
+
+training_jobs = TrainingJobManager()
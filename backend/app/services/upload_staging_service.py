@@ -0,0 +1,343 @@
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.core.config import get_settings
+from app.core.ml_runtime import ML_DIR
+from app.services.training_job_service import ModelLock
+
+settings = get_settings()
+
+IMAGE_SUFFIX = ".img"
+META_SUFFIX = ".json"
+LOCAL_CACHE_ITEMS = 32  # Decoded uploads kept per worker; the images themselves are on disk
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class StagedUpload:
+    """
+    An image uploaded once and reused by the classify, price and create steps.
+
+    The raw bytes are kept for storing the product; the decoded model input
+    and the predictions are filled in lazily the first time a step needs them.
+    A stored upload writes its classification next to the image, so a step
+    served by another worker reuses it too.
+    """
+
+    def __init__(self, image_bytes: bytes, filename: Optional[str] = None,
+                 content_type: Optional[str] = None, token: Optional[str] = None,
+                 ttl_seconds: int = 0, created_at: Optional[float] = None,
+                 meta_path: Optional[str] = None):
+        self.token = token
+        self.image_bytes = image_bytes
+        self.filename = filename
+        self.content_type = content_type
+        self.created_at = created_at if created_at is not None else time.time()
+        self.expires_at = self.created_at + ttl_seconds
+        self.expires_at_utc = datetime.utcfromtimestamp(self.expires_at)
+        self.meta_path = meta_path
+        self.image_array = None
+        self.classification: Optional[dict] = None
+        self.price_predictions: dict = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.image_bytes)
+
+    def is_expired(self, now: Optional[float] = None) -> bool:
+        if self.token is None:
+            return False
+        return (now or time.time()) >= self.expires_at
+
+    def to_meta(self) -> dict:
+        return {
+            "token": self.token,
+            "filename": self.filename,
+            "content_type": self.content_type,
+            "size": self.size,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+            "classification": self.classification
+        }
+
+    def save_meta(self):
+        if self.meta_path is not None:
+            _write_atomic(self.meta_path, json.dumps(self.to_meta()).encode())
+
+    def get_image_array(self, predict_module):
+        """Decode and resize the image once, reusing the tensor afterwards"""
+        if self.image_array is None:
+            self.image_array = predict_module.preprocess_image_from_bytes(self.image_bytes)
+        return self.image_array
+
+    def classify(self, predict_module, cancel_token=None) -> dict:
+        """
+        Run (or reuse) the breed classification for this image
+
+        With a cancel_token the pipeline stops between decode and predict, and
+        a prediction finished after cancellation is neither formatted nor cached.
+        """
+        if self.classification is None:
+            image_array = self.get_image_array(predict_module)
+            if cancel_token is not None:
+                cancel_token.check()
+            classifier = predict_module.get_classifier()
+            result = classifier.predict_from_array(
+                image_array,
+                cancel_check=cancel_token.is_cancelled if cancel_token is not None else None
+            )
+            if result is None:
+                cancel_token.check()
+            self.classification = result
+            if self.meta_path is not None and os.path.exists(self.meta_path):
+                self.save_meta()
+        return self.classification
+
+    def predict_price(self, predict_price_fn, pet_type: str, breed: str, age_months: int,
+                      weight_kg: float, health_status: int, vaccinated: int, country: str) -> float:
+        """Run (or reuse) the price prediction for a given set of metadata"""
+        key = (pet_type, breed, age_months, weight_kg, health_status, vaccinated, country)
+        if key not in self.price_predictions:
+            self.price_predictions[key] = predict_price_fn(
+                None, pet_type, breed, age_months, weight_kg, health_status, vaccinated, country
+            )
+        return self.price_predictions[key]
+
+
+class UploadStagingService:
+    """
+    Disk-backed store of staged uploads keyed by a short-lived token.
+
+    Each upload is <UPLOAD_STAGING_DIR, default ml/staged_uploads>/<token>.img
+    plus <token>.json (name, type, expiry, classification), so a token issued
+    by one API worker resolves on every other. Changes to the store are
+    serialised across workers by a lock file.
+
+    Entries expire after UPLOAD_TOKEN_TTL_SECONDS and the store is bounded by
+    UPLOAD_STAGING_MAX_ITEMS / UPLOAD_STAGING_MAX_BYTES (oldest evicted first).
+    A single image may not exceed UPLOAD_STAGING_MAX_ITEM_BYTES, so one upload
+    cannot evict everyone else's staged images. Each worker keeps its last few
+    uploads in memory with their decoded tensors and price predictions.
+    """
+
+    def __init__(self, root: str = settings.UPLOAD_STAGING_DIR or os.path.join(ML_DIR, "staged_uploads"),
+                 ttl_seconds: int = settings.UPLOAD_TOKEN_TTL_SECONDS,
+                 max_items: int = settings.UPLOAD_STAGING_MAX_ITEMS,
+                 max_bytes: int = settings.UPLOAD_STAGING_MAX_BYTES,
+                 max_item_bytes: int = settings.UPLOAD_STAGING_MAX_ITEM_BYTES):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.max_item_bytes = min(max_item_bytes, max_bytes)
+        self._cache: "OrderedDict[str, StagedUpload]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._store_mutex = threading.Lock()  # ModelLock is per process, not per thread
+        self._store_lock = ModelLock(os.path.join(root, ".lock"))
+
+    async def stage(self, image: UploadFile) -> StagedUpload:
+        image_bytes = await image.read()
+        if not image_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Uploaded image is empty"
+            )
+        if len(image_bytes) > self.max_item_bytes:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Uploaded image exceeds {self.max_item_bytes // (1024 * 1024)} MB"
+            )
+
+        token = secrets.token_urlsafe(24)
+        upload = StagedUpload(
+            image_bytes,
+            filename=image.filename,
+            content_type=image.content_type,
+            token=token,
+            ttl_seconds=self.ttl_seconds,
+            meta_path=self._path(token, META_SUFFIX)
+        )
+        await asyncio.get_running_loop().run_in_executor(None, self._store, upload)
+        return upload
+
+    def get(self, token: str) -> StagedUpload:
+        """
+        Raises:
+            HTTPException: 404 if the token is unknown, expired or evicted
+        """
+        meta = self._load_meta(token)
+        if meta is None or meta["expires_at"] <= time.time():
+            if meta is not None:
+                self.discard(token)
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload token not found or expired"
+            )
+
+        with self._cache_lock:
+            upload = self._cache.get(token)
+            if upload is not None:
+                self._cache.move_to_end(token)
+                if upload.classification is None:
+                    upload.classification = meta.get("classification")
+                return upload
+
+        try:
+            with open(self._path(token, IMAGE_SUFFIX), "rb") as f:
+                image_bytes = f.read()
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Upload token not found or expired"
+            )
+        upload = StagedUpload(
+            image_bytes,
+            filename=meta.get("filename"),
+            content_type=meta.get("content_type"),
+            token=token,
+            created_at=meta["created_at"],
+            ttl_seconds=meta["expires_at"] - meta["created_at"],
+            meta_path=self._path(token, META_SUFFIX)
+        )
+        upload.classification = meta.get("classification")
+        self._remember(upload)
+        return upload
+
+    def discard(self, token: str) -> bool:
+        if not self._valid_token(token):
+            return False
+        with self._locked():
+            return self._remove(token)
+
+    async def resolve(self, image: Optional[UploadFile], upload_token: Optional[str]) -> StagedUpload:
+        """
+        Resolve the image of a request that accepts either a file or a token.
+
+        A direct file upload is wrapped in a transient StagedUpload that is not
+        stored, so callers use the same code path in both cases. When both are
+        sent the token is preferred; the file is the fallback for a token that
+        expired.
+        """
+        if upload_token:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(None, self.get, upload_token)
+            except HTTPException:
+                if image is None:
+                    raise
+        if image is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Either an image file or an upload_token is required"
+            )
+        return StagedUpload(await image.read(), filename=image.filename, content_type=image.content_type)
+
+    def purge_expired(self) -> int:
+        with self._locked():
+            now = time.time()
+            expired = [meta["token"] for meta in self._iter_meta() if meta["expires_at"] <= now]
+            for token in expired:
+                self._remove(token)
+        return len(expired)
+
+    def get_stats(self) -> dict:
+        self.purge_expired()
+        uploads = list(self._iter_meta())
+        return {
+            "staged_uploads": len(uploads),
+            "staged_bytes": sum(meta["size"] for meta in uploads),
+            "cached_in_worker": len(self._cache),
+            "ttl_seconds": self.ttl_seconds
+        }
+
+    # ----- Storage -----
+
+    def _store(self, upload: StagedUpload):
+        """Write the image, then its metadata (which makes it visible), then evict to the bounds"""
+        with self._locked():
+            now = time.time()
+            for meta in list(self._iter_meta()):
+                if meta["expires_at"] <= now:
+                    self._remove(meta["token"])
+            _write_atomic(self._path(upload.token, IMAGE_SUFFIX), upload.image_bytes)
+            upload.save_meta()
+            uploads = sorted(self._iter_meta(), key=lambda meta: meta["created_at"])
+            total_bytes = sum(meta["size"] for meta in uploads)
+            while uploads and (len(uploads) > self.max_items or total_bytes > self.max_bytes):
+                oldest = uploads.pop(0)
+                total_bytes -= oldest["size"]
+                self._remove(oldest["token"])
+        self._remember(upload)
+
+    def _remember(self, upload: StagedUpload):
+        with self._cache_lock:
+            self._cache[upload.token] = upload
+            self._cache.move_to_end(upload.token)
+            while len(self._cache) > LOCAL_CACHE_ITEMS:
+                self._cache.popitem(last=False)
+
+    def _remove(self, token: str) -> bool:
+        with self._cache_lock:
+            self._cache.pop(token, None)
+        removed = False
+        for suffix in (META_SUFFIX, IMAGE_SUFFIX):
+            try:
+                os.remove(self._path(token, suffix))
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock over the store, across threads and worker processes"""
+        with self._store_mutex:
+            os.makedirs(self.root, exist_ok=True)
+            self._store_lock.acquire(blocking=True)
+            try:
+                yield
+            finally:
+                self._store_lock.release()
+
+    def _load_meta(self, token: str) -> Optional[dict]:
+        if not self._valid_token(token):
+            return None
+        try:
+            with open(self._path(token, META_SUFFIX), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _iter_meta(self):
+        if not os.path.isdir(self.root):
+            return
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(META_SUFFIX):
+                meta = self._load_meta(entry.name[:-len(META_SUFFIX)])
+                if meta is not None:
+                    yield meta
+
+    @staticmethod
+    def _valid_token(token: str) -> bool:
+        # Tokens are token_urlsafe; anything else cannot name a staged upload
+        return bool(token) and all(c.isalnum() or c in "-_" for c in token)
+
+    def _path(self, token: str, suffix: str) -> str:
+        return os.path.join(self.root, token + suffix)
+
+
+upload_staging_service = UploadStagingService()
@@ -100,14 +100,20 @@ export default function AddProductPage() {
         formData.append('prediction_confidence', classificationData.predictionConfidence.toString())
       }
 
-      if (classificationData.imageUrl) {
-        const response = await fetch(classificationData.imageUrl);
-        const blob = await response.blob();
-        formData.append('image', blob, 'product_image.jpg');
+      const imageUrl = classificationData.imageUrl
+      const loadImage = imageUrl ? async () => (await fetch(imageUrl)).blob() : undefined
+      if (classificationData.uploadToken) {
+        // Image was already uploaded during classification; it is only sent again
+        // if the token expired (UPLOAD_TOKEN_TTL_SECONDS)
+        formData.append('upload_token', classificationData.uploadToken)
+        await api.createProduct(formData, loadImage)
+      } else {
+        if (loadImage) {
+          formData.append('image', await loadImage(), 'product_image.jpg')
+        }
+        await api.createProduct(formData)
       }
 
-      await api.createProduct(formData)
-
       // Clear sessionStorage
       sessionStorage.removeItem('classificationResult')
 
@@ -21,12 +21,85 @@ import {
 } from "@/components/ui/dialog"
 
 const PRODUCT_TYPES = ["Dog", "Cat", "Fish", "Bird", "Monkey"]
+const MAX_LOG_LINES = 200
+const API_URL = "http://localhost:8000"
+const CHUNK_RETRIES = 5
+
+async function sha256Hex(data: ArrayBuffer) {
+    const digest = await crypto.subtle.digest("SHA-256", data)
+    return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, "0")).join("")
+}
+
+/**
+ * Resumable upload (/train/uploads): the session id is kept in localStorage, so
+ * a failed chunk, a dropped connection or a page reload continues from the
+ * server's offset instead of resending the whole archive.
+ */
+async function uploadInChunks(file: File, productType: string, breedName: string, onProgress: (percent: number) => void) {
+    const storageKey = `train-upload:${productType}/${breedName}:${file.name}:${file.size}:${file.lastModified}`
+    let session = null
+
+    const savedId = localStorage.getItem(storageKey)
+    if (savedId) {
+        const res = await fetch(`${API_URL}/train/uploads/${savedId}`)
+        if (res.ok) session = await res.json()
+    }
+    if (!session) {
+        const form = new FormData()
+        form.append("filename", file.name)
+        form.append("total_size", String(file.size))
+        form.append("breed_name", breedName)
+        form.append("product_type", productType)
+        const res = await fetch(`${API_URL}/train/uploads`, { method: "POST", body: form })
+        session = await res.json()
+        if (!res.ok) throw new Error(session.detail || "Failed to start upload")
+        localStorage.setItem(storageKey, session.upload_id)
+    }
+
+    let offset: number = session.offset
+    let failures = 0
+    while (offset < file.size) {
+        onProgress(Math.round((offset / file.size) * 100))
+        const chunk = await file.slice(offset, offset + session.chunk_size).arrayBuffer()
+        const res = await fetch(`${API_URL}/train/uploads/${session.upload_id}?offset=${offset}`, {
+            method: "PUT",
+            headers: { "X-Chunk-SHA256": await sha256Hex(chunk) },
+            body: chunk,
+        }).catch(() => null)
+        if (res) {
+            const data = await res.json().catch(() => ({}))
+            if (res.ok) {
+                offset = data.offset
+                failures = 0
+                continue
+            }
+            if (res.status === 409 && typeof data.detail?.offset === "number") {
+                offset = data.detail.offset // Server already has more (or less) than we thought
+                continue
+            }
+            if (res.status !== 422 && res.status < 500) {
+                throw new Error(typeof data.detail === "string" ? data.detail : "Upload failed")
+            }
+        }
+        // Network/server error or checksum mismatch: back off and resend the same chunk
+        if (++failures > CHUNK_RETRIES) throw new Error("Upload interrupted. Submit again to resume.")
+        await new Promise(resolve => setTimeout(resolve, 1000 * failures))
+    }
+    onProgress(100)
+
+    const res = await fetch(`${API_URL}/train/uploads/${session.upload_id}/finalize`, { method: "POST" })
+    localStorage.removeItem(storageKey)
+    const data = await res.json()
+    if (!res.ok) throw new Error(data.detail || "Failed to start training")
+    return data
+}
 
 export default function TrainModelPage() {
     const router = useRouter()
     const { toast } = useToast()
 
     const [isLoading, setIsLoading] = useState(false)
+    const [uploadPercent, setUploadPercent] = useState<number | null>(null)
     const [isTraining, setIsTraining] = useState(false)
 
     // Form State
@@ -43,6 +116,8 @@ export default function TrainModelPage() {
     // Console State
     const [status, setStatus] = useState<{ type: 'success' | 'error' | 'info', message: string } | null>(null)
     const [logs, setLogs] = useState<string[]>([])
+    const [jobId, setJobId] = useState<string | null>(null)
+    const [progress, setProgress] = useState<{ epoch: number, epochs: number, val_accuracy?: number, images_per_sec?: number } | null>(null)
     const logsEndRef = useRef<HTMLDivElement>(null)
 
     // Fetch breeds when type changes in Fine-Tune mode
@@ -51,7 +126,7 @@ export default function TrainModelPage() {
             const fetchBreeds = async () => {
                 setLoadingBreeds(true)
                 try {
-                    const res = await fetch(`http://localhost:8000/train/breeds/${productType}`)
+                    const res = await fetch(`${API_URL}/train/breeds/${productType}`)
                     const data = await res.json()
                     setExistingBreeds(data.breeds || [])
                 } catch (err) {
@@ -69,45 +144,73 @@ export default function TrainModelPage() {
         }
     }, [mode, productType, toast])
 
-    // Polling for logs
+    // Live training updates (server-sent events)
     useEffect(() => {
-        let interval: NodeJS.Timeout
+        if (!isTraining) return
+
+        const url = jobId
+            ? `${API_URL}/train/events?job_id=${encodeURIComponent(jobId)}`
+            : `${API_URL}/train/events`
+        const source = new EventSource(url)
+
+        source.addEventListener("log", (event) => {
+            const data = JSON.parse((event as MessageEvent).data)
+            setLogs((prev) => [...prev, ...data.lines].slice(-MAX_LOG_LINES))
+        })
+
+        source.addEventListener("progress", (event) => {
+            const data = JSON.parse((event as MessageEvent).data)
+            if (data.event === "epoch_end") {
+                setProgress({
+                    epoch: data.epoch,
+                    epochs: data.epochs,
+                    val_accuracy: data.metrics?.val_accuracy,
+                    images_per_sec: data.images_per_sec
+                })
+            }
+        })
 
-        if (isTraining) {
-            interval = setInterval(async () => {
-                try {
-                    const response = await fetch("http://localhost:8000/train/status")
-                    const data = await response.json()
-
-                    if (data.logs) {
-                        setLogs(data.logs)
-                    }
-
-                    if (data.status === "completed") {
-                        setIsTraining(false)
-                        toast({
-                            title: "Training Complete",
-                            description: "The model has been successfully updated.",
-                        })
-                        setStatus({
-                            type: 'success',
-                            message: "Training completed successfully!"
-                        })
-                    } else if (data.status === "error") {
-                        setIsTraining(false)
-                        setStatus({
-                            type: 'error',
-                            message: "Training failed. Check logs for details."
-                        })
-                    }
-                } catch (error) {
-                    console.error("Error fetching status:", error)
-                }
-            }, 2000)
-        }
+        source.addEventListener("status", (event) => {
+            const data = JSON.parse((event as MessageEvent).data)
+            if (data.logs) {
+                setLogs(data.logs)
+            }
+            if (data.job?.progress) {
+                setProgress(data.job.progress)
+            }
+
+            if (data.status === "completed") {
+                setIsTraining(false)
+                toast({
+                    title: "Training Complete",
+                    description: "The model has been successfully updated.",
+                })
+                setStatus({
+                    type: 'success',
+                    message: "Training completed successfully!"
+                })
+            } else if (data.status === "error") {
+                setIsTraining(false)
+                setStatus({
+                    type: 'error',
+                    message: data.job?.error
+                        ? `Training failed: ${data.job.error}. Check logs for details.`
+                        : "Training failed. Check logs for details."
+                })
+            } else if (data.status === "cancelled") {
+                setIsTraining(false)
+                setStatus({
+                    type: 'info',
+                    message: "Training was cancelled."
+                })
+            }
+        })
+
+        // EventSource reconnects by itself after network errors
+        source.onerror = (error) => console.error("Training event stream error:", error)
 
-        return () => clearInterval(interval)
-    }, [isTraining, toast])
+        return () => source.close()
+    }, [isTraining, jobId, toast])
 
     // Auto-scroll logs
     useEffect(() => {
@@ -147,23 +250,10 @@ export default function TrainModelPage() {
         setIsLoading(true)
         setStatus(null)
         setLogs([])
+        setProgress(null)
 
         try {
-            const formData = new FormData()
-            formData.append("breed_name", finalBreedName)
-            formData.append("product_type", productType)
-            formData.append("images_zip", file)
-
-            const response = await fetch("http://localhost:8000/train/add-breed", {
-                method: "POST",
-                body: formData,
-            })
-
-            const data = await response.json()
-
-            if (!response.ok) {
-                throw new Error(data.detail || "Failed to start training")
-            }
+            const data = await uploadInChunks(file, productType, finalBreedName, setUploadPercent)
 
             setStatus({
                 type: 'success',
@@ -175,6 +265,7 @@ export default function TrainModelPage() {
                 description: "The model is being updated in the background.",
             })
 
+            setJobId(data.job_id ?? null)
             setIsTraining(true)
 
             // Reset form partially
@@ -189,6 +280,7 @@ export default function TrainModelPage() {
             })
         } finally {
             setIsLoading(false)
+            setUploadPercent(null)
         }
     }
 
@@ -359,7 +451,7 @@ export default function TrainModelPage() {
                                 {isLoading ? (
                                     <>
                                         <Loader2 className="mr-2 h-4 w-4 animate-spin" />
-                                        Starting...
+                                        {uploadPercent !== null && uploadPercent < 100 ? `Uploading... ${uploadPercent}%` : "Starting..."}
                                     </>
                                 ) : isTraining ? (
                                     <>
@@ -384,6 +476,13 @@ export default function TrainModelPage() {
                     <CardTitle className="text-sm font-normal flex items-center gap-2">
                         <div className={`h-2 w-2 rounded-full ${isTraining ? 'bg-green-500 animate-pulse' : 'bg-gray-500'}`} />
                         Training Console
+                        {progress && (
+                            <span className="ml-auto opacity-75">
+                                Epoch {progress.epoch}/{progress.epochs}
+                                {progress.val_accuracy != null && ` · val acc ${(progress.val_accuracy * 100).toFixed(1)}%`}
+                                {progress.images_per_sec != null && ` · ${progress.images_per_sec} img/s`}
+                            </span>
+                        )}
                     </CardTitle>
                 </CardHeader>
                 <CardContent className="p-4 h-[300px] overflow-y-auto space-y-1 bg-black/95">
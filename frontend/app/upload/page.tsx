@@ -27,6 +27,7 @@ export default function UploadPage() {
   const [previewUrl, setPreviewUrl] = useState<string>("")
   const [isClassifying, setIsClassifying] = useState(false)
   const [classificationResult, setClassificationResult] = useState<ClassificationResult | null>(null)
+  const [uploadToken, setUploadToken] = useState<string>("")
 
   // Step management
   const [currentStep, setCurrentStep] = useState<'upload' | 'classify' | 'metadata' | 'review'>("upload")
@@ -80,6 +81,7 @@ export default function UploadPage() {
       const url = URL.createObjectURL(file)
       setPreviewUrl(url)
       setClassificationResult(null)
+      setUploadToken("")
       setEditedType("")
       setEditedName("")
       setCurrentStep("upload")
@@ -93,10 +95,15 @@ export default function UploadPage() {
     setIsClassifying(true)
 
     try {
+      // Upload the image once; classify, price and save reuse it by token
+      const staged = await api.stageUpload(selectedImage)
+      setUploadToken(staged.upload_token)
+
       const formData = new FormData()
-      formData.append('file', selectedImage)
+      formData.append('upload_token', staged.upload_token)
 
-      const result = await api.classifyImage(formData)
+      // The image is only sent again if the token is gone by the time classify runs
+      const result = await api.classifyImage(formData, selectedImage)
 
       console.log('Backend response:', result)
 
@@ -112,6 +119,7 @@ export default function UploadPage() {
         productType: result.product_type,
         predictedPrice: result.price_predicted,
         imageUrl: previewUrl,
+        uploadToken: staged.upload_token,
         confidence: result.confidence
       })
 
@@ -192,23 +200,36 @@ export default function UploadPage() {
     setIsPredictingPrice(true)
 
     try {
-      const formData = new FormData()
-      formData.append('image', selectedImage)
-      formData.append('pet_type', editedType)
-      formData.append('breed', editedName)
-      formData.append('age_months', ageMonths)
-      formData.append('weight_kg', weightKg)
-      formData.append('health_status', healthStatus)
-      formData.append('vaccinated', vaccinated.toString())
-      formData.append('country', country)
-
-      const response = await fetch('http://localhost:8000/ml/predict-price', {
-        method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        },
-        body: formData
-      })
+      const image = selectedImage
+      const requestPrice = (withToken: boolean) => {
+        const formData = new FormData()
+        if (withToken) {
+          formData.append('upload_token', uploadToken)
+        } else {
+          formData.append('image', image)
+        }
+        formData.append('pet_type', editedType)
+        formData.append('breed', editedName)
+        formData.append('age_months', ageMonths)
+        formData.append('weight_kg', weightKg)
+        formData.append('health_status', healthStatus)
+        formData.append('vaccinated', vaccinated.toString())
+        formData.append('country', country)
+
+        return fetch('http://localhost:8000/ml/predict-price', {
+          method: 'POST',
+          headers: {
+            'Authorization': `Bearer ${localStorage.getItem('token')}`
+          },
+          body: formData
+        })
+      }
+
+      let response = await requestPrice(!!uploadToken)
+      if (response.status === 404 && uploadToken) {
+        // Token expired or was evicted: send the image itself
+        response = await requestPrice(false)
+      }
 
       if (!response.ok) {
         throw new Error('Price prediction failed')
@@ -246,6 +267,7 @@ export default function UploadPage() {
       productName: editedName,
       predictedPrice: predictedPrice,
       imageUrl: previewUrl,
+      uploadToken: uploadToken || undefined,
       predictedBreed: classificationResult.productName,
       predictionConfidence: classificationResult.confidence,
       metadata: {
@@ -263,6 +285,7 @@ export default function UploadPage() {
     setSelectedImage(null)
     setPreviewUrl("")
     setClassificationResult(null)
+    setUploadToken("")
     setEditedType("")
     setEditedName("")
     setCurrentStep("upload")
@@ -50,6 +50,12 @@ export interface MLResponse {
     existing_product?: any;
 }
 
+export interface StagedUpload {
+    upload_token: string;
+    expires_at: string;
+    size: number;
+}
+
 export interface ProductType {
     type_id: string;
     name: string;
@@ -78,6 +84,28 @@ async function fetchWithAuth(url: string, options: RequestInit = {}) {
     return response;
 }
 
+// An image to resend when a request's upload_token has expired (a Blob, or a loader for one)
+export type FallbackImage = Blob | (() => Promise<Blob>);
+
+// Send with the staged upload_token only; on a 404 (token expired or evicted) resend once with the image itself
+async function sendWithUploadFallback(
+    send: (body: FormData) => Promise<Response>,
+    formData: FormData,
+    fallbackImage?: FallbackImage
+): Promise<Response> {
+    const response = await send(formData);
+    if (response.status !== 404 || !formData.has("upload_token") || !fallbackImage) {
+        return response;
+    }
+    const retry = new FormData();
+    formData.forEach((value, key) => {
+        if (key !== "upload_token") retry.append(key, value);
+    });
+    const image = typeof fallbackImage === "function" ? await fallbackImage() : fallbackImage;
+    retry.append("image", image, image instanceof File ? image.name : "product_image.jpg");
+    return send(retry);
+}
+
 export const api = {
     // Auth
     async register(data: any): Promise<User> {
@@ -124,11 +152,12 @@ export const api = {
         return response.json();
     },
 
-    async createProduct(formData: FormData): Promise<Product> {
-        const response = await fetchWithAuth("/products/", {
-            method: "POST",
-            body: formData,
-        });
+    async createProduct(formData: FormData, fallbackImage?: FallbackImage): Promise<Product> {
+        const response = await sendWithUploadFallback(
+            (body) => fetchWithAuth("/products/", { method: "POST", body }),
+            formData,
+            fallbackImage
+        );
         if (!response.ok) throw new Error("Failed to create product");
         return response.json();
     },
@@ -140,12 +169,25 @@ export const api = {
         return response.json();
     },
 
-    // ML Stub
-    async classifyImage(formData: FormData): Promise<MLResponse> {
-        const response = await fetch(`${API_URL}/ml/classify-and-predict`, {
+    // Staged uploads
+    async stageUpload(image: File): Promise<StagedUpload> {
+        const formData = new FormData();
+        formData.append("image", image);
+        const response = await fetch(`${API_URL}/uploads/`, {
             method: "POST",
             body: formData,
         });
+        if (!response.ok) throw new Error("Image upload failed");
+        return response.json();
+    },
+
+    // ML Stub
+    async classifyImage(formData: FormData, fallbackImage?: FallbackImage): Promise<MLResponse> {
+        const response = await sendWithUploadFallback(
+            (body) => fetch(`${API_URL}/ml/classify-and-predict`, { method: "POST", body }),
+            formData,
+            fallbackImage
+        );
         if (!response.ok) throw new Error("AI classification failed");
         return response.json();
     },
@@ -14,6 +14,7 @@ export interface ClassificationResult {
   productName: string;
   predictedPrice: number;
   imageUrl: string;
+  uploadToken?: string;
   confidence: number;
   predictedBreed?: string;
   predictionConfidence?: number;
@@ -1,6 +1,13 @@
 """
 Script to add a NEW breed class to an existing trained model.
 Performs 'Model Surgery' to expand the output layer and transfer weights.
+
+A crashed run stays in models/runs/ with its last epoch checkpoint; --resume
+continues it instead of redoing the surgery (see training_runs.py).
+
+Usage:
+    python add_breed.py
+    python add_breed.py --resume [RUN_ID]
 """
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -10,58 +17,42 @@ from tensorflow import keras
 import numpy as np
 import config
 from data_loader import create_data_generators, get_class_weights
+from dataset_manifest import get_manifest, training_snapshot
 from model import create_model, get_callbacks
+from precision import TrainingModes
+from training_runs import TrainingRun
+from releases import current_release
+from profiling import profiler_callbacks
 import json
 import sys
 
 # Force UTF-8 for Windows consoles/logs
 sys.stdout.reconfigure(encoding='utf-8')
 
-def add_new_breed_to_model():
-    print("=" * 50)
-    print("Model Surgery: Adding New Breed")
-    print("=" * 50)
+def expand_model(class_names, old_class_names, old_model_path):
+    """
+    Build a model with one output per class in class_names from the served one
 
-    # 1. Verify paths
-    if not os.path.exists(config.MODEL_PATH):
-        print("Error: No existing model found to update.")
-        return False
+    Args:
+        class_names: Class order of the new model
+        old_class_names: Class order of the served model
+        old_model_path: The served model
 
-    # 2. Load Data & Detect New Classes
-    print("\nScanning dataset for new breeds...")
-    train_gen, val_gen, class_names = create_data_generators()
+    Returns:
+        keras.Model: Compiled model; old classes keep their output weights
+    """
     new_num_classes = len(class_names)
-    
-    # 3. Load Old Class Mapping
-    mapping_path = os.path.join(config.MODEL_DIR, 'class_mapping.json')
-    if os.path.exists(mapping_path):
-        with open(mapping_path, 'r') as f:
-            old_mapping = json.load(f)
-            old_num_classes = old_mapping['num_classes']
-            old_class_names = old_mapping['classes']
-    else:
-        print("Warning: No class mapping found. Assuming this is a fresh train.")
-        old_num_classes = 0
-        old_class_names = []
-
-    print(f"\nStats:")
-    print(f"   Old Class Count: {old_num_classes}")
-    print(f"   New Class Count: {new_num_classes}")
-
-    if new_num_classes <= old_num_classes:
-        print("\nWarning: No new classes detected. Use 'fine_tune.py' instead for existing breeds.")
-        return False
 
-    # 4. Load Old Model
+    # Load Old Model
     print("\nLoading old model...")
-    old_model = keras.models.load_model(config.MODEL_PATH)
+    old_model = keras.models.load_model(old_model_path)
     
-    # 5. Create New Model Architecture
+    # Create New Model Architecture
     print(f"\nConstructing new model with {new_num_classes} outputs...")
     # We create a fresh model architecture with the NEW number of classes
     new_model, base_model = create_model(new_num_classes)
 
-    # 6. Transfer Weights (The "Surgery")
+    # Transfer Weights (The "Surgery")
     print("\nPerforming weight transfer...")
     
     # Transfer weights for all layers EXCEPT the final classification layer
@@ -106,43 +97,131 @@ def add_new_breed_to_model():
     
     print("Surgery complete. Model expanded.")
 
-    # 7. Compile
+    # Compile
     new_model.compile(
         optimizer=keras.optimizers.Adam(learning_rate=1e-4), # Lower rate for stability
         loss='categorical_crossentropy',
         metrics=['accuracy', keras.metrics.TopKCategoricalAccuracy(k=3, name='top_3_accuracy')]
     )
+    return new_model
+
+
+def add_new_breed_to_model(use_embedding_cache=config.USE_EMBEDDING_CACHE, mixed_precision=config.MIXED_PRECISION,
+                           jit_compile=config.XLA_JIT, resume=None, promote=True, profile=config.PROFILE_TRAINING):
+    """
+    Expand the output layer for new breeds and train the new connections
+    
+    Args:
+        use_embedding_cache: Train the head on cached backbone features
+            (the backbone is frozen here anyway)
+        mixed_precision: Train on images with a bfloat16 mixed-precision policy
+        jit_compile: XLA-compile the training step
+        resume: 'latest' or a run id to continue from its last checkpoint
+        promote: Make the expanded model the served one at the end
+        profile: Record input wait vs compute of the image-based fit (printed)
+    
+    Returns:
+        bool: True if the model was updated (or staged with promote=False)
+    """
+    print("=" * 50)
+    print("Model Surgery: Adding New Breed")
+    print("=" * 50)
 
-    # 8. Train (Fine-tune)
+    # 1. Verify paths (model and mapping come from the same served release)
+    served = current_release()
+    if not os.path.exists(served.model_path):
+        print("Error: No existing model found to update.")
+        return False
+
+    # 2. Load Data & Detect New Classes
+    print("\nScanning dataset for new breeds...")
+    train_gen, val_gen, class_names = create_data_generators()
+    trained_files = training_snapshot(get_manifest(config.TRAIN_DIR))  # Baseline for fine_tune.py --incremental
+    new_num_classes = len(class_names)
+    
+    # 3. Load Old Class Mapping
+    mapping_path = served.class_mapping_path
+    if os.path.exists(mapping_path):
+        with open(mapping_path, 'r') as f:
+            old_mapping = json.load(f)
+            old_num_classes = old_mapping['num_classes']
+            old_class_names = old_mapping['classes']
+    else:
+        print("Warning: No class mapping found. Assuming this is a fresh train.")
+        old_num_classes = 0
+        old_class_names = []
+
+    print(f"\nStats:")
+    print(f"   Old Class Count: {old_num_classes}")
+    print(f"   New Class Count: {new_num_classes}")
+
+    if new_num_classes <= old_num_classes:
+        print("\nWarning: No new classes detected. Use 'fine_tune.py' instead for existing breeds.")
+        return False
+
+    # 4. Expand the model, or continue an unfinished run from its last checkpoint
+    run = None
+    if resume:
+        run = TrainingRun.find('add_breed', run_id=None if resume == 'latest' else resume)
+        if run is None:
+            print("\nNo unfinished add_breed run to resume; starting a new one")
+        elif run.state['script'] != 'add_breed' or run.state['class_names'] != class_names:
+            print(f"\nError: Run {run.run_id} is not an add_breed run over the current classes; it cannot be resumed")
+            return False
+    if run is None:
+        run = TrainingRun.create('add_breed', 42, class_names)
+    new_model, resumed_phase, resumed_epoch, phase_done = run.resume_point()
+    run.seed_epoch(resumed_epoch)
+    if new_model is None:
+        new_model = expand_model(class_names, old_class_names, served.model_path)
+
+    # 5. Train (Fine-tune)
     print("\n" + "=" * 50)
     print("Phase 1: Training New Breed Connections")
     print("=" * 50)
     
     class_weights = get_class_weights(train_gen)
-    callbacks = get_callbacks()
-    
-    # Train for a few epochs to settle the new weights
-    history = new_model.fit(
-        train_gen,
-        epochs=2, # Enough to learn the new class
-        validation_data=val_gen,
-        class_weight=class_weights,
-        callbacks=callbacks,
-        verbose=1
-    )
+    callbacks = get_callbacks(run)
+    modes = TrainingModes(mixed_precision, jit_compile)
+    
+    if phase_done:
+        print("Done in the resumed run")
+    elif use_embedding_cache:
+        # Backbone is frozen in create_model, so cached features are exact
+        from embedding_store import fit_head_on_cached_features
+        history = fit_head_on_cached_features(
+            new_model,
+            epochs=config.FINE_TUNE_EPOCHS,
+            learning_rate=1e-4,
+            class_weights=class_weights
+        )
+        run.complete_phase('add_breed', new_model, len(history.history.get('loss', [])), history)
+    else:
+        # Train for a few epochs to settle the new weights
+        new_model = modes.apply(new_model)
+        new_model.fit(
+            train_gen,
+            epochs=2, # Enough to learn the new class
+            validation_data=val_gen,
+            class_weight=class_weights,
+            callbacks=callbacks + [modes.callback('add_breed'), run.callback('add_breed')]
+                      + profiler_callbacks(profile, 'add_breed', train_gen, []),
+            initial_epoch=resumed_epoch,
+            verbose=1
+        )
+        for entry in modes.throughput:
+            print(f"   Throughput [{entry['mode']}]: {entry['images_per_sec']} images/sec")
     
-    # 9. Save Everything
+    # 6. Save Everything (model + mapping are staged, then promoted together)
     print("\nSaving updated model...")
-    new_model.save(config.MODEL_PATH)
-    
-    # Update mapping
-    new_mapping = {
-        'classes': class_names,
-        'num_classes': new_num_classes
-    }
-    with open(mapping_path, 'w') as f:
-        json.dump(new_mapping, f, indent=2)
-        
+    new_model = modes.restore(new_model)
+    run.finish(new_model, class_names, trained_files)
+    if not promote:
+        print(f"\nCandidate staged at {run.model_path}; promote it with: python training_runs.py promote {run.run_id}")
+        return True
+    if not run.promote(new_model):
+        return False
+    
     print("\nSUCCESS: New breed added and model updated!")
     return True
 
@@ -156,4 +235,22 @@ if __name__ == '__main__':
         except RuntimeError as e:
             print(e)
             
-    add_new_breed_to_model()
+    import argparse
+    parser = argparse.ArgumentParser(description='Add new breed classes to the existing model')
+    parser.add_argument('--no-cache', action='store_true', help='Train on images instead of cached features')
+    parser.add_argument('--bf16', action=argparse.BooleanOptionalAction, default=config.MIXED_PRECISION,
+                        help='bfloat16 mixed precision (falls back to float32 if unsupported)')
+    parser.add_argument('--xla', action=argparse.BooleanOptionalAction, default=config.XLA_JIT,
+                        help='XLA jit_compile for model.fit (falls back if unavailable)')
+    parser.add_argument('--profile', action=argparse.BooleanOptionalAction, default=config.PROFILE_TRAINING,
+                        help='Measure input-pipeline wait vs compute per step (see profiling.py)')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='RUN_ID',
+                        help='Continue the latest (or the given) unfinished run from its last checkpoint')
+    parser.add_argument('--no-promote', action='store_true',
+                        help='Leave the expanded model staged in models/runs/ instead of serving it')
+    args = parser.parse_args()
+    
+    ok = add_new_breed_to_model(use_embedding_cache=config.USE_EMBEDDING_CACHE and not args.no_cache,
+                                mixed_precision=args.bf16, jit_compile=args.xla, resume=args.resume,
+                                promote=not args.no_promote, profile=args.profile)
+    sys.exit(0 if ok else 1)
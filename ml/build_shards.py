@@ -0,0 +1,174 @@
+"""
+Build pre-resized training shards
+
+Decodes every image of a split once, resizes it to IMG_SIZE x IMG_SIZE and writes
+uint8 NumPy shards that the training pipeline memory-maps
+(data_loader.load_dataset_from_shards). Epochs then skip JPEG decoding and resizing,
+and shuffling only moves integer indices around instead of decoded float32 images.
+
+Layout:
+    ml/data/shards/<split>/index.json                 class names, image size, shard list, source fingerprint
+    ml/data/shards/<split>/shard-00000.npy            uint8 (N, IMG_SIZE, IMG_SIZE, 3)
+    ml/data/shards/<split>/shard-00000-labels.npy     int32 (N,)
+
+Images are written in a seeded random order so every shard mixes classes.
+A split is only rebuilt when its dataset manifest changed (or with --force).
+
+Usage:
+    python build_shards.py                    # train and val
+    python build_shards.py --split train --workers 8 --force
+"""
+import os
+import hashlib
+import json
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import config
+from dataset_manifest import get_manifest
+
+INDEX_FILE = 'index.json'
+
+
+def split_source_dir(split):
+    return {'train': config.TRAIN_DIR, 'val': config.VAL_DIR}.get(split, os.path.join(config.DATA_DIR, split))
+
+
+def manifest_fingerprint(manifest, img_size=config.IMG_SIZE):
+    """Hash of every (path, class, size, mtime) in the manifest plus the target size"""
+    digest = hashlib.sha1(str(img_size).encode())
+    for path, class_name, size, mtime_ns in manifest.iter_files():
+        digest.update(f"{os.path.relpath(path, manifest.directory)}|{class_name}|{size}|{mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def read_shard_index(split, shards_dir=config.SHARDS_DIR):
+    index_path = os.path.join(shards_dir, split, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'r') as f:
+        return json.load(f)
+
+
+def shards_are_current(split, shards_dir=config.SHARDS_DIR, img_size=config.IMG_SIZE):
+    """True if the shards of a split were built from the current dataset at this image size"""
+    index = read_shard_index(split, shards_dir)
+    if index is None or index.get('img_size') != img_size:
+        return False
+    manifest = get_manifest(split_source_dir(split))
+    return index.get('fingerprint') == manifest_fingerprint(manifest, img_size)
+
+
+def _load_resized(args):
+    """Process-pool job: decode and resize one image to uint8, None if unreadable"""
+    path, img_size = args
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            # Same resize as preprocess_image_from_bytes, so training matches serving
+            img = img.resize((img_size, img_size))
+            return np.asarray(img, dtype=np.uint8)
+    except Exception:
+        return None
+
+
+def build_split(split, shard_size=config.SHARD_SIZE, workers=None, force=False,
+                shards_dir=config.SHARDS_DIR, img_size=config.IMG_SIZE, seed=42):
+    """
+    Write the shards of one split
+
+    Returns:
+        dict: The split's index
+    """
+    manifest = get_manifest(split_source_dir(split))
+    fingerprint = manifest_fingerprint(manifest, img_size)
+    existing = read_shard_index(split, shards_dir)
+    if not force and existing and existing.get('fingerprint') == fingerprint:
+        print(f"✓ {split}: shards are up to date ({existing['num_images']} images)")
+        return existing
+
+    file_paths, labels, class_names = manifest.file_paths_and_labels()
+    if not file_paths:
+        raise ValueError(f"No images found in {manifest.directory}")
+
+    order = np.random.default_rng(seed).permutation(len(file_paths))
+    file_paths = [file_paths[i] for i in order]
+    labels = np.asarray(labels, dtype=np.int32)[order]
+
+    out_dir = os.path.join(shards_dir, split)
+    tmp_dir = out_dir + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    print(f"\n📦 {split}: {len(file_paths)} images -> shards of {shard_size} ({img_size}x{img_size} uint8)")
+    started = time.perf_counter()
+    shards = []
+    skipped = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for shard_id, start in enumerate(range(0, len(file_paths), shard_size)):
+            paths = file_paths[start:start + shard_size]
+            images = np.empty((len(paths), img_size, img_size, 3), dtype=np.uint8)
+            shard_labels = np.empty(len(paths), dtype=np.int32)
+            count = 0
+            jobs = [(p, img_size) for p in paths]
+            for path, label, img in zip(paths, labels[start:start + shard_size],
+                                        pool.map(_load_resized, jobs, chunksize=16)):
+                if img is None:
+                    skipped.append(path)
+                    continue
+                images[count] = img
+                shard_labels[count] = label
+                count += 1
+
+            name = f"shard-{shard_id:05d}"
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), images[:count])
+            np.save(os.path.join(tmp_dir, f"{name}-labels.npy"), shard_labels[:count])
+            shards.append({'images': f"{name}.npy", 'labels': f"{name}-labels.npy", 'count': int(count)})
+
+            done = start + len(paths)
+            elapsed = time.perf_counter() - started
+            print(f"  {name}: {count} images | {done}/{len(file_paths)} | {done / elapsed:.0f} img/s")
+
+    index = {
+        'split': split,
+        'img_size': img_size,
+        'class_names': class_names,
+        'num_images': int(sum(s['count'] for s in shards)),
+        'shards': shards,
+        'skipped': skipped,
+        'fingerprint': fingerprint,
+        'built_at': time.time()
+    }
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+    size_mb = sum(os.path.getsize(os.path.join(out_dir, s['images'])) for s in shards) / 1e6
+    print(f"✅ {split}: {index['num_images']} images in {len(shards)} shards ({size_mb:.0f} MB) "
+          f"in {time.perf_counter() - started:.1f}s")
+    if skipped:
+        print(f"⚠️  Skipped {len(skipped)} unreadable images (listed in {INDEX_FILE})")
+    return index
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Write pre-resized uint8 training shards')
+    parser.add_argument('--split', nargs='+', default=['train', 'val'], help='Splits to build')
+    parser.add_argument('--shard-size', type=int, default=config.SHARD_SIZE, help='Images per shard')
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if up to date')
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Building training shards")
+    print("=" * 50)
+    for split in args.split:
+        build_split(split, shard_size=args.shard_size, workers=args.workers, force=args.force)
@@ -1,6 +1,7 @@
 """
 Configuration for Pet Breed Classification Model
 """
+import json
 import os
 
 # Paths
@@ -8,11 +9,78 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(BASE_DIR, 'data')
 TRAIN_DIR = os.path.join(DATA_DIR, 'train')
 VAL_DIR = os.path.join(DATA_DIR, 'val')
+TEST_DIR = os.path.join(DATA_DIR, 'test')
 MODEL_DIR = os.path.join(BASE_DIR, 'models')
 MODEL_PATH = os.path.join(MODEL_DIR, 'pet_classifier.keras')
 PRICE_MODEL_PATH = os.path.join(MODEL_DIR, 'price_predictor.keras')
 PRICE_ENCODERS_PATH = os.path.join(MODEL_DIR, 'price_encoders.joblib')
 
+# Fast cold-load exports (architecture JSON + memory-mapped weights, see model_export.py)
+FAST_MODEL_DIR = os.path.join(MODEL_DIR, 'pet_classifier_fast')
+FAST_PRICE_MODEL_DIR = os.path.join(MODEL_DIR, 'price_predictor_fast')
+
+# Pre-resized uint8 training shards (see build_shards.py)
+SHARDS_DIR = os.path.join(DATA_DIR, 'shards')
+SHARD_SIZE = 1024           # Images per shard (~150 MB at 224x224)
+USE_SHARDS = True           # Train from shards when they are up to date
+SHARD_INTERLEAVE = 4        # Shards read concurrently
+
+# Cached backbone features for frozen-backbone head training (see embedding_store.py)
+EMBEDDINGS_DIR = os.path.join(DATA_DIR, 'embeddings')
+USE_EMBEDDING_CACHE = True  # Train the head on cached features while the backbone is frozen
+EMBEDDING_VIEWS = 4         # Augmented views cached per image (plus the original)
+EMBEDDING_BATCH_SIZE = 256  # Feature batches are tiny, so use larger batches
+EMBEDDING_CHUNK_IMAGES = 2048  # Images per stored chunk; features are written to disk as each chunk fills
+
+# Few-shot breeds recognised from class prototypes until the next retrain (see prototypes.py)
+PROTOTYPES_PATH = os.path.join(MODEL_DIR, 'prototypes.json')
+PROTOTYPE_TEMPERATURE = 0.02  # Sharpness of the similarity -> probability curve
+
+# Incremental fine-tuning (fine_tune.py --incremental)
+TRAINED_FILES_PATH = os.path.join(MODEL_DIR, 'trained_files.json')  # Images the current model has seen
+REPLAY_SAMPLE_SIZE = 500           # Previously seen images replayed with the new ones, balanced over classes
+INCREMENTAL_VAL_PER_CLASS = 20     # Stratified validation subset
+
+# Manifest-based splits (see dataset_splits.py)
+USE_SPLIT_MANIFEST = False  # Train/val from data/train.splits.json (hash-assigned) instead of the train/ and val/ folders
+SPLIT_VAL_PERCENT = 20
+SPLIT_TEST_PERCENT = 5
+SPLIT_BY = 'path'           # 'path' (no file reads) or 'content' (survives renames and moves)
+
+# Hyperparameter search (see hparam_search.py)
+HPARAM_DIR = os.path.join(MODEL_DIR, 'hparam_search')  # Results database, trial logs and the winning config
+CONFIG_OVERRIDES_ENV = 'ML_CONFIG_OVERRIDES'            # JSON file of {"SETTING": value} applied at import
+
+# Per-run staging of checkpoints and candidate models (see training_runs.py)
+RUNS_DIR = os.path.join(MODEL_DIR, 'runs')
+KEEP_RUNS = 3  # Finished runs kept for inspection and rollback; unfinished runs are always kept
+
+# Served classifier releases (see releases.py)
+RELEASES_DIR = os.path.join(MODEL_DIR, 'releases')
+SERVED_POINTER_PATH = os.path.join(MODEL_DIR, 'current.json')  # {"release": <run_id>}, swapped atomically on promotion
+KEEP_RELEASES = 3  # Earlier releases kept besides the served one
+
+# Training profiler (see profiling.py; --profile on the training scripts)
+PROFILE_TRAINING = False       # Input wait vs compute per step, summarized under 'profile' in the history JSON
+PROFILE_PROBE_STEPS = 5        # Train steps timed on one in-memory batch (compute alone)
+PROFILE_PIPELINE_BATCHES = 10  # Batches pulled from the input pipeline alone
+PROFILE_TRACE_STEPS = 0        # >0: also write a TF profiler trace of this many steps to logs/profile/
+TENSORBOARD_HISTOGRAM_FREQ = 0 # Weight histograms every N epochs (0 = off: they cost time at every epoch end)
+
+# Evaluation gate (see evaluate.py; candidate vs served model on the fixed test set)
+PROMOTION_GATE = False          # Training scripts and `training_runs.py promote` only promote candidates within budget
+EVAL_LATENCY_RUNS = 50          # Single-image predictions timed per model (batched: a fifth of this, at least 5)
+EVAL_MIN_TOP1 = 0.0             # Absolute floor for top-1 accuracy
+EVAL_MAX_TOP1_DROP = 0.01       # Allowed top-1 drop vs the served model, on the classes both know
+EVAL_MAX_LATENCY_INCREASE = 0.2 # Allowed relative p99 increase vs the served model (single image and batched)
+EVAL_MAX_P99_MS = 500           # Absolute single-image p99 budget on this host
+EVAL_MAX_PEAK_RSS_MB = 4096     # Peak RSS of the process loading and running the model
+EVAL_MAX_ARTIFACT_MB = 200      # Size of the .keras file
+
+# Training execution modes (see precision.py; --bf16 / --xla on the training scripts)
+MIXED_PRECISION = False  # bfloat16 compute with float32 variables and softmax; falls back to float32 if unsupported
+XLA_JIT = False          # jit_compile the training step; falls back if XLA is unavailable
+
 # Create directories if they don't exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(TRAIN_DIR, exist_ok=True)
@@ -24,6 +92,7 @@ IMG_SIZE = 224  # MobileNetV3 input size (reduce to 160 for 2x speed)
 BATCH_SIZE = 32  # Increase to 64 or 128 if you have enough RAM/GPU memory
 EPOCHS = 50  # Increased for EfficientNet
 LEARNING_RATE = 0.001
+DROPOUT_RATE = 0.4  # Both dropout layers of the classification head
 FINE_TUNE_LEARNING_RATE = 0.0001
 FINE_TUNE_EPOCHS = 10  # Reduced from 20 for faster training
 
@@ -72,3 +141,25 @@ BREED_PRICES = {
 
 # Default price if breed not found
 DEFAULT_PRICE = 500.0
+
+
+def apply_overrides(overrides):
+    """
+    Replace settings of this module (e.g. the winner of hparam_search.py)
+
+    Modules that bind settings as default arguments read them at import, so
+    call this before importing data_loader, model, etc.
+
+    Args:
+        overrides: {"SETTING": value}
+    """
+    for name, value in overrides.items():
+        if not name.isupper() or name not in globals():
+            raise KeyError(f"Unknown config setting '{name}'")
+        globals()[name] = tuple(value) if isinstance(globals()[name], tuple) else value
+
+
+if os.environ.get(CONFIG_OVERRIDES_ENV):
+    with open(os.environ[CONFIG_OVERRIDES_ENV], 'r') as f:
+        apply_overrides(json.load(f))
+    print(f"⚙️  Config overrides from {os.environ[CONFIG_OVERRIDES_ENV]}")
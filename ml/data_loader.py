@@ -4,7 +4,9 @@ Data Loading and Augmentation for Pet Breed Classification
 import tensorflow as tf
 import os
 import numpy as np
+import json
 import config
+from dataset_manifest import get_manifest
 
 def load_dataset_from_directory(directory, batch_size=config.BATCH_SIZE, img_size=config.IMG_SIZE, shuffle=True, seed=42):
     """
@@ -20,64 +22,15 @@ def load_dataset_from_directory(directory, batch_size=config.BATCH_SIZE, img_siz
     Returns:
         tuple: (dataset, class_names, file_paths, labels)
     """
-    file_paths = []
-    labels = []
-    class_names = []
-    
-    # 1. Scan directory to find classes and files
-    # Structure: directory/Type/Breed/image.jpg
+    # 1. Read classes and files from the cached manifest
+    # Structure: directory/Type/Breed/image.jpg (or directory/Class/image.jpg)
     print(f"Scanning {directory}...")
-    
-    # First pass: find all classes
-    classes_set = set()
-    for pet_type in os.listdir(directory):
-        pet_type_dir = os.path.join(directory, pet_type)
-        if os.path.isdir(pet_type_dir):
-            for breed in os.listdir(pet_type_dir):
-                breed_dir = os.path.join(pet_type_dir, breed)
-                if os.path.isdir(breed_dir):
-                    class_path = f"{pet_type}/{breed}"
-                    classes_set.add(class_path)
-    
-    class_names = sorted(list(classes_set))
-    class_to_index = {cls: i for i, cls in enumerate(class_names)}
-    
-    if not class_names:
-        print("Warning: No nested classes found. Checking top-level...")
-        # Fallback for flat structure
-        for cls in os.listdir(directory):
-            if os.path.isdir(os.path.join(directory, cls)):
-                classes_set.add(cls)
-        class_names = sorted(list(classes_set))
-        class_to_index = {cls: i for i, cls in enumerate(class_names)}
+    manifest = get_manifest(directory)
+    file_paths, labels, class_names = manifest.file_paths_and_labels()
+    print(f"Manifest refreshed in {manifest.stats['seconds']:.2f}s "
+          f"({manifest.stats['rescanned']}/{manifest.stats['directories']} directories re-listed)")
 
     print(f"Found {len(class_names)} classes: {class_names}")
-
-    # Second pass: collect files
-    for pet_type in os.listdir(directory):
-        pet_type_dir = os.path.join(directory, pet_type)
-        if os.path.isdir(pet_type_dir):
-            # Check if this is a class itself or a container
-            if pet_type in class_to_index:
-                 # Flat structure case
-                 cls_idx = class_to_index[pet_type]
-                 for fname in os.listdir(pet_type_dir):
-                    if fname.lower().endswith(('.png', '.jpg', '.jpeg')):
-                        file_paths.append(os.path.join(pet_type_dir, fname))
-                        labels.append(cls_idx)
-            else:
-                # Nested structure case
-                for breed in os.listdir(pet_type_dir):
-                    breed_dir = os.path.join(pet_type_dir, breed)
-                    if os.path.isdir(breed_dir):
-                        class_path = f"{pet_type}/{breed}"
-                        if class_path in class_to_index:
-                            cls_idx = class_to_index[class_path]
-                            for fname in os.listdir(breed_dir):
-                                if fname.lower().endswith(('.png', '.jpg', '.jpeg')):
-                                    file_paths.append(os.path.join(breed_dir, fname))
-                                    labels.append(cls_idx)
-    
     print(f"Found {len(file_paths)} images")
     
     if not file_paths:
@@ -86,8 +39,17 @@ def load_dataset_from_directory(directory, batch_size=config.BATCH_SIZE, img_siz
     # 2. Create dataset
     # Convert to one-hot encoding
     labels = tf.keras.utils.to_categorical(labels, num_classes=len(class_names))
+    dataset = _image_dataset(file_paths, labels, batch_size, img_size, shuffle, seed)
     
-    dataset = tf.data.Dataset.from_tensor_slices((file_paths, labels))
+    return dataset, class_names, file_paths, labels
+
+def _image_dataset(file_paths, one_hot_labels, batch_size, img_size, shuffle, seed):
+    """Decode/resize pipeline shared by the directory and file-list loaders"""
+    dataset = tf.data.Dataset.from_tensor_slices((file_paths, one_hot_labels))
+    
+    # Shuffle paths before decoding: the buffer holds strings, not decoded images
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=len(file_paths), seed=seed, reshuffle_each_iteration=True)
     
     # 3. Map function to load images
     def process_path(file_path, label):
@@ -101,21 +63,140 @@ def load_dataset_from_directory(directory, batch_size=config.BATCH_SIZE, img_siz
 
     dataset = dataset.map(process_path, num_parallel_calls=tf.data.AUTOTUNE)
     
-    if shuffle:
-        dataset = dataset.shuffle(buffer_size=1000, seed=seed)
+    dataset = dataset.batch(batch_size)
+    return dataset.prefetch(buffer_size=tf.data.AUTOTUNE)
+
+def load_dataset_from_entries(entries, class_names, batch_size=config.BATCH_SIZE, img_size=config.IMG_SIZE,
+                              shuffle=True, seed=42):
+    """
+    Load an explicit list of images (e.g. an incremental fine-tune selection)
     
+    Args:
+        entries: (path, class_name, size, mtime_ns) tuples, as from DatasetManifest.iter_files
+        class_names: Class names defining the label indices
+        batch_size: Batch size
+        img_size: Target image size
+        shuffle: Whether to shuffle data
+        seed: Random seed
+        
+    Returns:
+        tuple: (dataset, labels) with integer labels
+    """
+    if not entries:
+        raise ValueError("No images selected")
+    class_to_index = {cls: i for i, cls in enumerate(class_names)}
+    file_paths = [entry[0] for entry in entries]
+    labels = np.array([class_to_index[entry[1]] for entry in entries], dtype=np.int64)
+    one_hot = tf.keras.utils.to_categorical(labels, num_classes=len(class_names))
+    return _image_dataset(file_paths, one_hot, batch_size, img_size, shuffle, seed), labels
+
+def load_dataset_from_shards(split, batch_size=config.BATCH_SIZE, shuffle=True, seed=42,
+                             shards_dir=config.SHARDS_DIR, cycle_length=config.SHARD_INTERLEAVE):
+    """
+    Load a split from the pre-resized uint8 shards written by build_shards.py
+    
+    Shards are memory-mapped. Shuffling works on (shard, row) indices: the
+    shard order is shuffled, cycle_length shards are interleaved and rows are
+    shuffled within each shard, so no decoded images sit in a shuffle buffer.
+    
+    Args:
+        split: 'train', 'val', ...
+        batch_size: Batch size
+        shuffle: Whether to shuffle data
+        seed: Random seed
+        shards_dir: Root of the shards
+        cycle_length: Number of shards read concurrently
+        
+    Returns:
+        tuple: (dataset, class_names, num_images)
+    """
+    split_dir = os.path.join(shards_dir, split)
+    with open(os.path.join(split_dir, 'index.json'), 'r') as f:
+        index = json.load(f)
+    
+    class_names = index['class_names']
+    num_classes = len(class_names)
+    img_size = index['img_size']
+    shards = [s for s in index['shards'] if s['count'] > 0]
+    if not shards:
+        raise ValueError(f"No images in shards at {split_dir}")
+    
+    images = [np.load(os.path.join(split_dir, s['images']), mmap_mode='r') for s in shards]
+    labels = [np.load(os.path.join(split_dir, s['labels'])) for s in shards]
+    counts = tf.constant([s['count'] for s in shards], dtype=tf.int64)
+    print(f"Found {index['num_images']} images in {len(shards)} shards ({num_classes} classes)")
+    
+    def shard_rows(shard_id):
+        rows = tf.data.Dataset.range(counts[shard_id])
+        if shuffle:
+            rows = rows.shuffle(buffer_size=counts[shard_id], seed=seed, reshuffle_each_iteration=True)
+        return rows.map(lambda row: (shard_id, row))
+    
+    dataset = tf.data.Dataset.range(len(shards))
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=len(shards), seed=seed, reshuffle_each_iteration=True)
+    dataset = dataset.interleave(
+        shard_rows,
+        cycle_length=min(cycle_length, len(shards)),
+        block_length=1,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle
+    )
     dataset = dataset.batch(batch_size)
+    
+    def gather(shard_ids, rows):
+        batch_images = np.stack([images[s][r] for s, r in zip(shard_ids, rows)])
+        batch_labels = np.array([labels[s][r] for s, r in zip(shard_ids, rows)], dtype=np.int32)
+        return batch_images, batch_labels
+    
+    def load_batch(shard_ids, rows):
+        batch_images, batch_labels = tf.numpy_function(gather, [shard_ids, rows], [tf.uint8, tf.int32])
+        batch_images.set_shape([None, img_size, img_size, 3])
+        # EfficientNet expects [0, 255] inputs, so we don't normalize here
+        return tf.cast(batch_images, tf.float32), tf.one_hot(batch_labels, num_classes)
+    
+    dataset = dataset.map(load_batch, num_parallel_calls=tf.data.AUTOTUNE)
     dataset = dataset.prefetch(buffer_size=tf.data.AUTOTUNE)
     
-    return dataset, class_names, file_paths, labels
+    return dataset, class_names, index['num_images']
 
-def create_data_generators():
+def create_data_generators(use_shards=config.USE_SHARDS):
     """
     Create training and validation datasets
     
+    Uses the pre-resized shards when they are up to date with the image
+    folders, otherwise decodes the images directly. With USE_SPLIT_MANIFEST,
+    train/val come from the split manifest of the training folder instead.
+    
+    Args:
+        use_shards: Allow reading from shards
+    
     Returns:
         tuple: (train_ds, val_ds, class_names)
     """
+    if config.USE_SPLIT_MANIFEST:
+        # Shards mirror the physical folders, so they are not used for manifest splits
+        from dataset_splits import split_entries
+        print("Creating datasets from the split manifest...")
+        train_entries, class_names = split_entries(config.TRAIN_DIR, 'train')
+        val_entries, _ = split_entries(config.TRAIN_DIR, 'val')
+        print(f"Found {len(class_names)} classes, {len(train_entries)} train / {len(val_entries)} val images")
+        train_ds, _ = load_dataset_from_entries(train_entries, class_names, batch_size=config.BATCH_SIZE, shuffle=True)
+        val_ds, _ = load_dataset_from_entries(val_entries, class_names, batch_size=config.BATCH_SIZE, shuffle=False)
+        return train_ds, val_ds, class_names
+
+    if use_shards:
+        from build_shards import shards_are_current
+        if shards_are_current('train') and shards_are_current('val'):
+            print("Creating training dataset from shards...")
+            train_ds, class_names, _ = load_dataset_from_shards('train', batch_size=config.BATCH_SIZE, shuffle=True)
+            print("Creating validation dataset from shards...")
+            val_ds, val_class_names, _ = load_dataset_from_shards('val', batch_size=config.BATCH_SIZE, shuffle=False)
+            if class_names != val_class_names:
+                print("Warning: Training and validation classes do not match exactly!")
+            return train_ds, val_ds, class_names
+        print("Shards missing or out of date (run: python build_shards.py), decoding images directly")
+    
     print("Creating training dataset...")
     train_ds, class_names, _, _ = load_dataset_from_directory(
         config.TRAIN_DIR, 
@@ -139,50 +220,31 @@ def create_data_generators():
     return train_ds, val_ds, class_names
 
 
-def get_class_weights(train_ds):
+def get_class_weights(train_ds, labels=None):
     """
     Calculate class weights for imbalanced datasets
     
     Args:
         train_ds: Training dataset
+        labels: Integer labels of the images actually trained on (e.g. an
+            incremental selection); defaults to the whole training directory
         
     Returns:
         dict: Class weights
     """
     from sklearn.utils.class_weight import compute_class_weight
     
-    # Let's use a helper to get labels from directory again
-    labels = []
-    classes_set = set()
-    
-    # Scan directory to find classes
-    for pet_type in os.listdir(config.TRAIN_DIR):
-        pet_type_dir = os.path.join(config.TRAIN_DIR, pet_type)
-        if os.path.isdir(pet_type_dir):
-            for breed in os.listdir(pet_type_dir):
-                breed_dir = os.path.join(pet_type_dir, breed)
-                if os.path.isdir(breed_dir):
-                    class_path = f"{pet_type}/{breed}"
-                    classes_set.add(class_path)
-    
-    class_names = sorted(list(classes_set))
-    class_to_index = {cls: i for i, cls in enumerate(class_names)}
-    
-    # Collect labels
-    for pet_type in os.listdir(config.TRAIN_DIR):
-        pet_type_dir = os.path.join(config.TRAIN_DIR, pet_type)
-        if os.path.isdir(pet_type_dir):
-            for breed in os.listdir(pet_type_dir):
-                breed_dir = os.path.join(pet_type_dir, breed)
-                if os.path.isdir(breed_dir):
-                    class_path = f"{pet_type}/{breed}"
-                    if class_path in class_to_index:
-                        cls_idx = class_to_index[class_path]
-                        # Count files
-                        count = len([f for f in os.listdir(breed_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))])
-                        labels.extend([cls_idx] * count)
-
-    if not labels:
+    if labels is None and config.USE_SPLIT_MANIFEST:
+        from dataset_splits import split_entries
+        entries, class_names = split_entries(config.TRAIN_DIR, 'train')
+        class_to_index = {cls: i for i, cls in enumerate(class_names)}
+        labels = np.array([class_to_index[entry[1]] for entry in entries], dtype=np.int64)
+    elif labels is None:
+        # Per-class counts come from the cached manifest, no directory walk
+        class_counts = get_manifest(config.TRAIN_DIR).class_counts()
+        labels = np.repeat(np.arange(len(class_counts)), list(class_counts.values()))
+
+    if len(labels) == 0:
         return {}
 
     # Compute class weights
@@ -192,8 +254,8 @@ def get_class_weights(train_ds):
         y=labels
     )
     
-    # Convert to dictionary
-    class_weight_dict = {i: weight for i, weight in enumerate(class_weights)}
+    # Convert to dictionary (keyed by label, which may skip classes absent from `labels`)
+    class_weight_dict = {int(c): weight for c, weight in zip(np.unique(labels), class_weights)}
     
     print(f"Class weights: {class_weight_dict}")
     
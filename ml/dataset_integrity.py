@@ -0,0 +1,225 @@
+"""
+Parallel, incremental image integrity scanner
+
+Checks every image of a data directory in a process pool. Each file is read
+once and fully decoded once (a truncated JPEG only fails on decode, so
+verify() alone is not enough, and resizing catches nothing more).
+
+Results are cached in a JSON report next to the data directory
+(e.g. ml/data/train.integrity.json), keyed by path with the file's size and
+mtime: repeat scans only decode new or changed files. The file list comes
+from the dataset manifest, so an unchanged tree costs one stat per folder.
+
+The report records format, width, height and mode of every image, plus
+summary statistics. Images it flags as corrupt are left out of
+DatasetManifest file lists (and therefore out of the data loader, shards,
+embedding cache and class weights) for as long as their size and mtime match.
+
+Usage:
+    python dataset_integrity.py                        # train and val
+    python dataset_integrity.py data/test --workers 8
+    python dataset_integrity.py --full                 # ignore the caches (after in-place edits)
+    python dataset_integrity.py --quarantine           # move corrupt images to data/corrupted_backups
+"""
+import io
+import json
+import os
+import shutil
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from dataset_manifest import get_manifest, default_integrity_path
+
+REPORT_VERSION = 1
+# What tf.io.decode_image (data_loader) can read
+SUPPORTED_FORMATS = {'JPEG', 'PNG', 'GIF', 'BMP'}
+# Below this many files a pool costs more to start than it saves
+MIN_PARALLEL = 64
+
+
+def check_image(path):
+    """
+    Process-pool job: read one image and decode it fully
+
+    Returns:
+        dict: {'ok', 'format', 'width', 'height', 'mode'} or {'ok': False, 'error'}
+    """
+    from PIL import Image
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            result = {
+                'ok': img.format in SUPPORTED_FORMATS,
+                'format': img.format,
+                'width': img.width,
+                'height': img.height,
+                'mode': img.mode
+            }
+        if not result['ok']:
+            result['error'] = f"Unsupported format {img.format}"
+        return result
+    except Exception as e:
+        return {'ok': False, 'error': f"{type(e).__name__}: {e}"}
+
+
+def load_report(path):
+    """Returns the report dict, or None if missing/unreadable/outdated"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return report if report.get('version') == REPORT_VERSION else None
+
+
+def _save_report(report, path):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f)
+    os.replace(tmp_path, path)
+
+
+def scan_directory(directory, workers=None, full=False, report_path=None):
+    """
+    Check every image of a data directory, reusing cached results
+
+    Args:
+        directory: Data directory (e.g. config.TRAIN_DIR)
+        workers: Process pool size (default: CPU count)
+        full: Re-list the tree and re-check every image (after in-place overwrites,
+            which the manifest's directory mtimes cannot see)
+        report_path: Defaults to <directory>.integrity.json
+
+    Returns:
+        dict: The report ({'summary', 'files', 'bad', ...})
+    """
+    started = time.perf_counter()
+    report_path = report_path or default_integrity_path(directory)
+    manifest = get_manifest(directory, full=full)
+    previous = None if full else load_report(report_path)
+    cached = previous['files'] if previous and previous.get('directory') == manifest.directory else {}
+
+    files = {}
+    todo = []
+    # Flagged images are hidden from normal manifest queries; the scanner must still see them
+    for path, class_name, size, mtime_ns in manifest.iter_files(include_excluded=True):
+        rel = os.path.relpath(path, manifest.directory).replace(os.sep, '/')
+        entry = cached.get(rel)
+        if entry is not None and entry['size'] == size and entry['mtime_ns'] == mtime_ns:
+            files[rel] = entry
+        else:
+            todo.append((rel, path, size, mtime_ns))
+
+    paths = [path for _, path, _, _ in todo]
+    if len(paths) >= MIN_PARALLEL:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(check_image, paths, chunksize=max(1, min(256, len(paths) // (workers * 8)))))
+    else:
+        results = [check_image(path) for path in paths]
+    for (rel, _, size, mtime_ns), result in zip(todo, results):
+        files[rel] = {'size': size, 'mtime_ns': mtime_ns, **result}
+
+    bad = {rel: [entry['size'], entry['mtime_ns']] for rel, entry in files.items() if not entry['ok']}
+    good = [entry for entry in files.values() if entry['ok']]
+    report = {
+        'version': REPORT_VERSION,
+        'directory': manifest.directory,
+        'scanned_at': time.time(),
+        'summary': {
+            'images': len(files),
+            'checked': len(todo),
+            'cached': len(files) - len(todo),
+            'corrupt': len(bad),
+            'formats': dict(Counter(entry['format'] for entry in good)),
+            'modes': dict(Counter(entry['mode'] for entry in good)),
+            'min_width': min((entry['width'] for entry in good), default=None),
+            'min_height': min((entry['height'] for entry in good), default=None),
+            'max_width': max((entry['width'] for entry in good), default=None),
+            'max_height': max((entry['height'] for entry in good), default=None),
+            'seconds': round(time.perf_counter() - started, 3)
+        },
+        'bad': bad,
+        'files': files
+    }
+    _save_report(report, report_path)
+    return report
+
+
+def quarantine(directory, report, backup_dir=None, delete=False):
+    """
+    Move (or delete) the images a report flags as corrupt
+
+    Args:
+        directory: The scanned data directory
+        report: Result of scan_directory
+        backup_dir: Defaults to <data dir>/corrupted_backups/<split>
+        delete: Delete instead of moving
+
+    Returns:
+        list: Relative paths that were removed from the directory
+    """
+    backup_dir = backup_dir or os.path.join(
+        os.path.dirname(os.path.normpath(directory)), 'corrupted_backups', os.path.basename(os.path.normpath(directory))
+    )
+    removed = []
+    for rel in report['bad']:
+        path = os.path.join(directory, *rel.split('/'))
+        if not os.path.exists(path):
+            continue
+        if delete:
+            os.remove(path)
+        else:
+            target = os.path.join(backup_dir, *rel.split('/'))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.move(path, target)
+        removed.append(rel)
+    return removed
+
+
+def print_report(directory, report):
+    summary = report['summary']
+    print("=" * 50)
+    print(f"{directory}")
+    print("=" * 50)
+    print(f"Images: {summary['images']} | Checked: {summary['checked']} | Cached: {summary['cached']}"
+          f" | {summary['seconds']:.2f}s")
+    print(f"Formats: {summary['formats']}")
+    if summary['min_width'] is not None:
+        print(f"Sizes: {summary['min_width']}x{summary['min_height']} to {summary['max_width']}x{summary['max_height']}")
+    if report['bad']:
+        print(f"❌ Corrupt or unsupported: {summary['corrupt']}")
+        for rel in list(report['bad'])[:20]:
+            print(f"   {rel}: {report['files'][rel]['error']}")
+        if summary['corrupt'] > 20:
+            print(f"   ... and {summary['corrupt'] - 20} more")
+    else:
+        print("✅ No corrupted images found")
+
+
+if __name__ == '__main__':
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Check dataset images in parallel, reusing cached results')
+    parser.add_argument('directories', nargs='*', default=[config.TRAIN_DIR, config.VAL_DIR])
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: CPU count)')
+    parser.add_argument('--full', action='store_true', help='Re-check every image, ignoring the cache')
+    parser.add_argument('--quarantine', action='store_true',
+                        help='Move corrupt images to data/corrupted_backups (and rescan)')
+    parser.add_argument('--delete', action='store_true', help='With --quarantine: delete instead of moving')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        report = scan_directory(directory, workers=args.workers, full=args.full)
+        print_report(directory, report)
+        if args.quarantine and report['bad']:
+            removed = quarantine(directory, report, delete=args.delete)
+            print(f"🧹 {'Deleted' if args.delete else 'Quarantined'} {len(removed)} images")
+            scan_directory(directory, workers=args.workers)
+        print(f"Report: {default_integrity_path(directory)}")
@@ -0,0 +1,398 @@
+"""
+Cached dataset manifest
+
+One JSON file per data directory (e.g. ml/data/train.manifest.json) listing every
+image with its label, size and mtime, plus per-class counts. It replaces the
+repeated os.listdir/isdir walks in the data loader, class weights, price dataset
+generator and the backend breed listings.
+
+The manifest is refreshed incrementally: a directory is only re-listed when its
+mtime changed, so an unchanged tree costs one stat per type and breed folder.
+Adding, removing or renaming files changes the folder mtime; overwriting a file
+in place does not, so run with --full after such edits.
+
+Images flagged as corrupt in <directory>.integrity.json (dataset_integrity.py)
+are left out of every file list while their size and mtime still match.
+
+Stdlib only, so the backend can import it without TensorFlow.
+
+Usage:
+    python dataset_manifest.py                  # refresh train and val manifests
+    python dataset_manifest.py data/test --full
+"""
+import json
+import os
+import threading
+import time
+
+MANIFEST_VERSION = 1
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def default_manifest_path(directory):
+    """ml/data/train -> ml/data/train.manifest.json"""
+    return os.path.normpath(directory) + '.manifest.json'
+
+
+def default_integrity_path(directory):
+    """ml/data/train -> ml/data/train.integrity.json (written by dataset_integrity.py)"""
+    return os.path.normpath(directory) + '.integrity.json'
+
+
+def _scan_dir(path):
+    """
+    List one directory with os.scandir
+
+    Returns:
+        tuple: (subdirectory names, {image name: [size, mtime_ns]})
+    """
+    subdirs = []
+    files = {}
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir():
+                subdirs.append(entry.name)
+            elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                stat = entry.stat()
+                files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return sorted(subdirs), files
+
+
+class DatasetManifest:
+    """
+    Manifest of a Type/Breed/image.jpg tree (or a flat Class/image.jpg tree)
+    """
+
+    def __init__(self, directory, manifest_path=None):
+        self.directory = os.path.normpath(directory)
+        self.manifest_path = manifest_path or default_manifest_path(directory)
+        # Relative dir ('' for the root) -> {'mtime_ns', 'subdirs', 'files'}
+        self.dirs = {}
+        self.built_at = None
+        self.stats = {}
+        # Relative path -> [size, mtime_ns] of images the integrity report flags as corrupt
+        self.excluded = {}
+        self._integrity_mtime_ns = None
+
+    def load(self):
+        if not os.path.exists(self.manifest_path):
+            return False
+        try:
+            with open(self.manifest_path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != MANIFEST_VERSION or data.get('directory') != self.directory:
+            return False
+        self.dirs = data['dirs']
+        self.built_at = data.get('built_at')
+        return True
+
+    def save(self):
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'directory': self.directory,
+                'built_at': self.built_at,
+                'class_counts': self.class_counts(),
+                'dirs': self.dirs
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def refresh(self, full=False):
+        """
+        Bring the manifest up to date with the tree
+
+        Args:
+            full: Re-list every directory regardless of mtimes
+
+        Returns:
+            bool: True if anything changed
+        """
+        started = time.perf_counter()
+        rescanned = 0
+        old_dirs = {} if full else self.dirs
+        new_dirs = {}
+
+        if os.path.isdir(self.directory):
+            # Breadth-first over root (depth 0), types (1) and breeds (2)
+            pending = ['']
+            while pending:
+                rel = pending.pop()
+                path = os.path.join(self.directory, rel) if rel else self.directory
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    continue
+                cached = old_dirs.get(rel)
+                if cached is not None and cached['mtime_ns'] == mtime_ns:
+                    entry = cached
+                else:
+                    subdirs, files = _scan_dir(path)
+                    entry = {'mtime_ns': mtime_ns, 'subdirs': subdirs, 'files': files}
+                    rescanned += 1
+                new_dirs[rel] = entry
+                depth = rel.count('/') + 1 if rel else 0
+                if depth < 2:
+                    pending.extend(f"{rel}/{name}" if rel else name for name in entry['subdirs'])
+
+        changed = new_dirs != self.dirs
+        self.dirs = new_dirs
+        if changed or self.built_at is None:
+            self.built_at = time.time()
+        self.stats = {
+            'directories': len(new_dirs),
+            'rescanned': rescanned,
+            'seconds': round(time.perf_counter() - started, 3)
+        }
+        return changed
+
+    def load_exclusions(self, report_path=None):
+        """Re-read the integrity report's corrupt-image list if the report changed"""
+        report_path = report_path or default_integrity_path(self.directory)
+        try:
+            mtime_ns = os.stat(report_path).st_mtime_ns
+        except FileNotFoundError:
+            self.excluded, self._integrity_mtime_ns = {}, None
+            return
+        if mtime_ns == self._integrity_mtime_ns:
+            return
+        try:
+            with open(report_path, 'r') as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.excluded = report.get('bad', {}) if report.get('directory') == self.directory else {}
+        self._integrity_mtime_ns = mtime_ns
+
+    # ----- Queries -----
+
+    def _nested_classes(self):
+        return sorted(
+            rel for rel in self.dirs
+            if rel.count('/') == 1
+        )
+
+    def class_names(self):
+        """
+        Sorted class names: 'Type/Breed' for the nested layout, or top-level
+        folder names when there are no nested folders (flat layout)
+        """
+        nested = self._nested_classes()
+        if nested:
+            return nested
+        return sorted(rel for rel in self.dirs if rel and '/' not in rel)
+
+    def class_files(self, class_name, include_excluded=False):
+        """{file name: [size, mtime_ns]} of one class (without flagged corrupt images)"""
+        entry = self.dirs.get(class_name)
+        files = entry['files'] if entry else {}
+        if self.excluded and not include_excluded:
+            files = {
+                name: stat for name, stat in files.items()
+                if self.excluded.get(f"{class_name}/{name}") != stat
+            }
+        return files
+
+    def class_counts(self):
+        return {cls: len(self.class_files(cls)) for cls in self.class_names()}
+
+    def file_paths_and_labels(self):
+        """
+        Returns:
+            tuple: (file_paths, labels, class_names), file paths sorted within each class
+        """
+        class_names = self.class_names()
+        file_paths = []
+        labels = []
+        for idx, cls in enumerate(class_names):
+            class_dir = os.path.join(self.directory, *cls.split('/'))
+            for fname in sorted(self.class_files(cls)):
+                file_paths.append(os.path.join(class_dir, fname))
+                labels.append(idx)
+        return file_paths, labels, class_names
+
+    def iter_files(self, include_excluded=False):
+        """Yield (path, class_name, size, mtime_ns) for every image"""
+        for cls in self.class_names():
+            class_dir = os.path.join(self.directory, *cls.split('/'))
+            for fname, (size, mtime_ns) in sorted(self.class_files(cls, include_excluded).items()):
+                yield os.path.join(class_dir, fname), cls, size, mtime_ns
+
+    def breeds_by_type(self):
+        """{type: sorted breed folder names}, including breed folders without images"""
+        root = self.dirs.get('')
+        if root is None:
+            return {}
+        return {
+            pet_type: list(self.dirs.get(pet_type, {}).get('subdirs', []))
+            for pet_type in root['subdirs']
+        }
+
+
+def get_manifest(directory, full=False, save=True):
+    """
+    Load, refresh and return the manifest of a data directory
+
+    Manifests are cached per process; every call still does the cheap
+    incremental mtime check, so results are never stale.
+
+    Args:
+        directory: Data directory (e.g. config.TRAIN_DIR)
+        full: Force a full rescan
+        save: Write the manifest back if it changed
+
+    Returns:
+        DatasetManifest: Up-to-date manifest
+    """
+    key = os.path.normpath(directory)
+    with _cache_lock:
+        manifest = _cache.get(key)
+        if manifest is None:
+            manifest = DatasetManifest(directory)
+            manifest.load()
+            _cache[key] = manifest
+        changed = manifest.refresh(full=full)
+        manifest.load_exclusions()
+        if save and (changed or not os.path.exists(manifest.manifest_path)):
+            try:
+                manifest.save()
+            except OSError as e:
+                print(f"Warning: Could not write manifest {manifest.manifest_path}: {e}")
+        return manifest
+
+
+def training_snapshot(manifest):
+    """
+    The files a training run is about to see
+
+    Returns:
+        dict: {path relative to the data directory: [size, mtime_ns]}
+    """
+    return {
+        os.path.relpath(path, manifest.directory).replace(os.sep, '/'): [size, mtime_ns]
+        for path, _, size, mtime_ns in manifest.iter_files()
+    }
+
+
+def save_training_snapshot(snapshot, path):
+    """Record what the current model was trained on (after a successful run)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': MANIFEST_VERSION, 'saved_at': time.time(), 'files': snapshot}, f)
+    os.replace(tmp_path, path)
+
+
+def load_training_snapshot(path):
+    """Returns the snapshot dict, or None if no run has recorded one"""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f).get('files')
+
+
+def select_incremental(train_dir, val_dir, snapshot, replay_size, val_per_class, seed=42, splits=None):
+    """
+    Pick the data for an incremental fine-tune
+
+    Args:
+        train_dir: Training directory
+        val_dir: Validation directory
+        snapshot: Result of load_training_snapshot for the current model
+        replay_size: Total number of previously seen images to replay, spread evenly over classes
+        val_per_class: Validation images per class
+        seed: Random seed
+        splits: Optional {relative path: split} of train_dir (dataset_splits.split_assignments);
+            new/replay then only use its 'train' images and val is drawn from its
+            'val' images instead of val_dir
+
+    Returns:
+        dict: class_names, new, replay, val (lists of (path, class_name, size, mtime_ns))
+    """
+    import random
+    rng = random.Random(seed)
+
+    train = get_manifest(train_dir)
+    class_names = train.class_names()
+
+    new, old_by_class = [], {cls: [] for cls in class_names}
+    for entry in train.iter_files():
+        path, class_name, size, mtime_ns = entry
+        rel = os.path.relpath(path, train.directory).replace(os.sep, '/')
+        if splits is not None and splits.get(rel) != 'train':
+            continue
+        if snapshot.get(rel) == [size, mtime_ns]:
+            old_by_class[class_name].append(entry)
+        else:
+            new.append(entry)
+
+    # Class-balanced replay: the same quota for every class, redistributing what small classes can't fill
+    replay = []
+    quota_classes = [cls for cls in class_names if old_by_class[cls]]
+    remaining = replay_size
+    while remaining > 0 and quota_classes:
+        per_class = max(1, remaining // len(quota_classes))
+        still_open = []
+        for cls in quota_classes:
+            pool = old_by_class[cls]
+            rng.shuffle(pool)
+            take = min(per_class, len(pool), remaining)
+            replay.extend(pool[:take])
+            remaining -= take
+            old_by_class[cls] = pool[take:]
+            if old_by_class[cls]:
+                still_open.append(cls)
+            if remaining <= 0:
+                break
+        quota_classes = still_open
+
+    # Stratified validation subset
+    val = []
+    if splits is not None:
+        val_by_class = {cls: [] for cls in class_names}
+        for cls in class_names:
+            for fname, (size, mtime_ns) in sorted(train.class_files(cls).items()):
+                if splits.get(f"{cls}/{fname}") == 'val':
+                    val_by_class[cls].append((os.path.join(train.directory, *cls.split('/'), fname), cls, size, mtime_ns))
+    else:
+        val_manifest = get_manifest(val_dir)
+        val_by_class = {
+            cls: [
+                (os.path.join(val_manifest.directory, *cls.split('/'), fname), cls, size, mtime_ns)
+                for fname, (size, mtime_ns) in sorted(val_manifest.class_files(cls).items())
+            ]
+            for cls in val_manifest.class_names()
+        }
+    for cls, entries in val_by_class.items():
+        if cls not in old_by_class:
+            continue
+        val.extend(entries if len(entries) <= val_per_class else rng.sample(entries, val_per_class))
+
+    return {'class_names': class_names, 'new': new, 'replay': replay, 'val': val}
+
+
+if __name__ == '__main__':
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Build or refresh dataset manifests')
+    parser.add_argument('directories', nargs='*', default=[config.TRAIN_DIR, config.VAL_DIR])
+    parser.add_argument('--full', action='store_true', help='Re-list every directory')
+    args = parser.parse_args()
+
+    for directory in args.directories:
+        manifest = get_manifest(directory, full=args.full)
+        counts = manifest.class_counts()
+        print("=" * 50)
+        print(f"{directory}")
+        print("=" * 50)
+        print(f"Classes: {len(counts)} | Images: {sum(counts.values())}")
+        print(f"Directories: {manifest.stats['directories']} | Re-listed: {manifest.stats['rescanned']}"
+              f" | {manifest.stats['seconds']:.3f}s")
+        for cls, count in counts.items():
+            print(f"  {cls}: {count}")
+        print(f"Manifest: {manifest.manifest_path}")
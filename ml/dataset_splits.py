@@ -0,0 +1,290 @@
+"""
+Manifest-based dataset splits (zero-copy)
+
+Instead of copying images into test/val folders, every image of a source
+directory (default ml/data/train) is assigned to train, val or test by a
+stable hash, and the assignment is stored in <source>.splits.json.
+
+- by='path' hashes 'Type/Breed/file.jpg' (no file reads)
+- by='content' hashes the image bytes (SHA-1, the same scheme breed ingest
+  uses), so renamed or moved files keep their split; hashes are cached by
+  size and mtime
+
+An image's bucket depends only on its own key, so adding images never moves
+existing ones between splits. Changing the percentages only moves images
+whose bucket crosses the new boundary.
+
+With config.USE_SPLIT_MANIFEST the data loader, class weights, cached-feature
+head training and incremental fine-tuning read train/val straight from the
+split manifest. For tools that need directories, materialize() builds
+hardlink (or reflink/symlink) trees: no image bytes are copied.
+
+Stdlib only.
+
+Usage:
+    python dataset_splits.py                                  # build/refresh data/train.splits.json
+    python dataset_splits.py --val-percent 15 --test-percent 5 --by content
+    python dataset_splits.py --materialize test --to data/test_split --mode hardlink
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dataset_manifest import get_manifest
+
+SPLITS_VERSION = 1
+SPLIT_NAMES = ('train', 'val', 'test')
+LINK_MODES = ('hardlink', 'reflink', 'symlink')
+FICLONE = 0x40049409  # Linux ioctl: share extents (btrfs, XFS, ...)
+
+
+def default_splits_path(source_dir):
+    """ml/data/train -> ml/data/train.splits.json"""
+    return os.path.normpath(source_dir) + '.splits.json'
+
+
+def bucket_of(key_hash):
+    """0-99 from a hex SHA-1 (same formula as breed ingest's split_for)"""
+    return int(key_hash[:8], 16) % 100
+
+
+def split_for_bucket(bucket, val_percent, test_percent):
+    if bucket < test_percent:
+        return 'test'
+    if bucket < test_percent + val_percent:
+        return 'val'
+    return 'train'
+
+
+def _content_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_splits(path):
+    """Returns the split manifest dict, or None if missing/unreadable/outdated"""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('version') == SPLITS_VERSION else None
+
+
+def build_splits(source_dir, val_percent=None, test_percent=None, by=None, path=None, workers=8):
+    """
+    Create or incrementally refresh the split manifest of a source directory
+
+    Settings not given are taken from the existing manifest, then from config.
+
+    Args:
+        source_dir: Directory whose images are split (e.g. config.TRAIN_DIR)
+        val_percent: Share of images assigned to val
+        test_percent: Share of images assigned to test
+        by: 'path' or 'content'
+        path: Defaults to <source_dir>.splits.json
+        workers: Threads hashing file contents (by='content')
+
+    Returns:
+        dict: The manifest ({'files': {rel: [size, mtime_ns, key hash, split]}, 'counts', ...})
+    """
+    import config
+    started = time.perf_counter()
+    path = path or default_splits_path(source_dir)
+    previous = load_splits(path) or {}
+    val_percent = val_percent if val_percent is not None else previous.get('val_percent', config.SPLIT_VAL_PERCENT)
+    test_percent = test_percent if test_percent is not None else previous.get('test_percent', config.SPLIT_TEST_PERCENT)
+    by = by or previous.get('by', config.SPLIT_BY)
+    if by not in ('path', 'content'):
+        raise ValueError(f"Unknown split key '{by}' (use 'path' or 'content')")
+    if val_percent < 0 or test_percent < 0 or val_percent + test_percent >= 100:
+        raise ValueError("val_percent + test_percent must be below 100")
+
+    manifest = get_manifest(source_dir)
+    cached = previous.get('files', {}) if previous.get('by') == by else {}
+    files = {}
+    to_hash = []
+    for file_path, _, size, mtime_ns in manifest.iter_files():
+        rel = os.path.relpath(file_path, manifest.directory).replace(os.sep, '/')
+        entry = cached.get(rel)
+        if entry is not None and (by == 'path' or (entry[0] == size and entry[1] == mtime_ns)):
+            key_hash = entry[2]
+        elif by == 'path':
+            key_hash = hashlib.sha1(rel.encode('utf-8')).hexdigest()[:8]
+        else:
+            to_hash.append((rel, file_path, size, mtime_ns))
+            continue
+        files[rel] = [size, mtime_ns, key_hash, split_for_bucket(bucket_of(key_hash), val_percent, test_percent)]
+
+    if to_hash:
+        # Hashing is I/O bound: threads keep several reads in flight
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            hashes = list(pool.map(_content_hash, [item[1] for item in to_hash]))
+        for (rel, _, size, mtime_ns), key_hash in zip(to_hash, hashes):
+            key_hash = key_hash[:8]
+            files[rel] = [size, mtime_ns, key_hash, split_for_bucket(bucket_of(key_hash), val_percent, test_percent)]
+
+    counts = {name: 0 for name in SPLIT_NAMES}
+    for entry in files.values():
+        counts[entry[3]] += 1
+    data = {
+        'version': SPLITS_VERSION,
+        'source': manifest.directory,
+        'by': by,
+        'val_percent': val_percent,
+        'test_percent': test_percent,
+        'built_at': time.time(),
+        'counts': counts,
+        'files': files
+    }
+    changed = data['files'] != previous.get('files') or any(
+        data[key] != previous.get(key) for key in ('by', 'val_percent', 'test_percent')
+    )
+    if changed:
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    data['stats'] = {'hashed': len(to_hash), 'seconds': round(time.perf_counter() - started, 3)}
+    return data
+
+
+def split_assignments(source_dir, path=None):
+    """{relative path: split} for the current tree (refreshes the manifest incrementally)"""
+    return {rel: entry[3] for rel, entry in build_splits(source_dir, path=path)['files'].items()}
+
+
+def split_entries(source_dir, split, path=None):
+    """
+    Images of one split, ready for data_loader.load_dataset_from_entries
+
+    Returns:
+        tuple: ([(path, class_name, size, mtime_ns)], class_names of the whole source directory)
+    """
+    assignments = split_assignments(source_dir, path)
+    manifest = get_manifest(source_dir)
+    entries = [
+        entry for entry in manifest.iter_files()
+        if assignments.get(os.path.relpath(entry[0], manifest.directory).replace(os.sep, '/')) == split
+    ]
+    return entries, manifest.class_names()
+
+
+def _link(src, dst, mode):
+    if mode == 'hardlink':
+        os.link(src, dst)
+    elif mode == 'symlink':
+        os.symlink(os.path.abspath(src), dst)
+    else:
+        import fcntl
+        try:
+            with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError as e:
+            if os.path.exists(dst):
+                os.remove(dst)
+            raise OSError(f"Reflink not supported here ({e}); use --mode hardlink") from e
+        shutil.copystat(src, dst)
+
+
+def _is_current(src, dst, mode):
+    """True if dst already mirrors src in this mode"""
+    if mode == 'symlink':
+        return os.path.islink(dst) and os.path.realpath(dst) == os.path.realpath(src)
+    if os.path.islink(dst):
+        return False
+    if mode == 'hardlink':
+        return os.path.samefile(dst, src)
+    src_stat, dst_stat = os.stat(src), os.stat(dst)
+    return src_stat.st_size == dst_stat.st_size and src_stat.st_mtime_ns == dst_stat.st_mtime_ns
+
+
+def materialize(source_dir, split, target_dir, mode='hardlink', class_prefix=None, path=None):
+    """
+    Mirror one split as a directory tree of links (target_dir/Type/Breed/file)
+
+    target_dir is managed by this function: files in it that do not belong to
+    the split any more are removed.
+
+    Args:
+        source_dir: Split source directory
+        split: 'train', 'val' or 'test'
+        target_dir: Output directory
+        mode: 'hardlink' (same filesystem), 'reflink' (copy-on-write clone, btrfs/XFS)
+            or 'symlink'
+        class_prefix: Only classes starting with this (e.g. 'Fish/')
+
+    Returns:
+        dict: {'linked', 'unchanged', 'removed'}
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"Unknown mode '{mode}' (use one of {', '.join(LINK_MODES)})")
+    source_dir = os.path.normpath(source_dir)
+    target_dir = os.path.normpath(target_dir)
+    wanted = {}
+    for file_path, class_name, _, _ in split_entries(source_dir, split, path)[0]:
+        if class_prefix and not class_name.startswith(class_prefix):
+            continue
+        wanted[os.path.relpath(file_path, source_dir).replace(os.sep, '/')] = file_path
+
+    result = {'linked': 0, 'unchanged': 0, 'removed': 0}
+    for rel, src in wanted.items():
+        dst = os.path.join(target_dir, *rel.split('/'))
+        if os.path.lexists(dst):
+            if _is_current(src, dst, mode):
+                result['unchanged'] += 1
+                continue
+            os.remove(dst)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        _link(src, dst, mode)
+        result['linked'] += 1
+
+    if os.path.isdir(target_dir):
+        for root, _, names in os.walk(target_dir):
+            for name in names:
+                rel = os.path.relpath(os.path.join(root, name), target_dir).replace(os.sep, '/')
+                if rel not in wanted and (not class_prefix or rel.startswith(class_prefix)):
+                    os.remove(os.path.join(root, name))
+                    result['removed'] += 1
+    return result
+
+
+if __name__ == '__main__':
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Assign images to train/val/test by stable hash (no copies)')
+    parser.add_argument('--source', default=config.TRAIN_DIR, help='Directory whose images are split')
+    parser.add_argument('--val-percent', type=int, default=None)
+    parser.add_argument('--test-percent', type=int, default=None)
+    parser.add_argument('--by', choices=['path', 'content'], default=None, help='Hash the relative path or the bytes')
+    parser.add_argument('--materialize', choices=SPLIT_NAMES, default=None, help='Mirror this split as links')
+    parser.add_argument('--to', default=None, help='Target directory for --materialize')
+    parser.add_argument('--mode', choices=LINK_MODES, default='hardlink')
+    parser.add_argument('--type', default=None, help='Only this pet type (e.g. Fish)')
+    args = parser.parse_args()
+
+    data = build_splits(args.source, args.val_percent, args.test_percent, args.by)
+    print("=" * 50)
+    print(f"Splits of {data['source']} (by {data['by']})")
+    print("=" * 50)
+    print(f"val {data['val_percent']}% | test {data['test_percent']}% | "
+          f"hashed {data['stats']['hashed']} files in {data['stats']['seconds']:.2f}s")
+    for name in SPLIT_NAMES:
+        print(f"  {name}: {data['counts'][name]} images")
+    print(f"Manifest: {default_splits_path(args.source)}")
+
+    if args.materialize:
+        target = args.to or os.path.join(config.DATA_DIR, 'splits', args.materialize)
+        result = materialize(args.source, args.materialize, target, args.mode,
+                             class_prefix=f"{args.type}/" if args.type else None)
+        print(f"\n🔗 {args.materialize} -> {target} ({args.mode}): {result['linked']} linked, "
+              f"{result['unchanged']} unchanged, {result['removed']} removed")
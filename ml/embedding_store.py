@@ -0,0 +1,387 @@
+"""
+Persistent embedding store for training the classification head on cached features
+
+While the EfficientNet backbone is frozen (phase 1 of train.py, fine_tune.py,
+add_breed.py) only the small head learns, yet every epoch re-runs the backbone on
+every image. This module computes the pooled backbone features once per image and
+keeps them on disk, keyed by the SHA-1 of the image bytes:
+
+    ml/data/embeddings/hash_cache.json                  path -> [size, mtime_ns, sha1]
+    ml/data/embeddings/<backbone>-v<views>/index.json   sha1 -> [chunk, row]
+    ml/data/embeddings/<backbone>-v<views>/chunk-*.npy  float16 (N, views, feature_dim)
+
+Each image stores `views` feature vectors: view 0 is the plain image and views
+1..K go through the model's augmentation layers, so head training still sees
+augmented data (one random view per image per epoch).
+
+<backbone> is a fingerprint of the backbone weights. A fine-tuned backbone gets
+its own namespace, so features never mix between backbones. New images are
+embedded incrementally; files are only re-hashed when their size or mtime changed.
+
+Usage:
+    python embedding_store.py                  # embed train/val with the saved model's backbone
+    python embedding_store.py --imagenet       # embed with the ImageNet backbone (train.py phase 1)
+"""
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import hashlib
+import json
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+import config
+from dataset_manifest import get_manifest
+from model import augmentation_layers, copy_head_weights, create_head_model, get_backbone, training_event_callbacks
+
+HASH_CACHE_FILE = 'hash_cache.json'
+INDEX_FILE = 'index.json'
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def backbone_fingerprint(backbone):
+    """Short hash of the backbone weights; identical weights share cached features"""
+    digest = hashlib.sha1(str(backbone.input_shape).encode())
+    for weight in backbone.get_weights():
+        digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ContentHasher:
+    """SHA-1 of file contents, cached by (path, size, mtime) so unchanged files are never re-read"""
+
+    def __init__(self, root=config.EMBEDDINGS_DIR):
+        self.path = os.path.join(root, HASH_CACHE_FILE)
+        self.cache = {}
+        self.dirty = False
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.cache = json.load(f)
+
+    def hash(self, path, size, mtime_ns):
+        cached = self.cache.get(path)
+        if cached and cached[0] == size and cached[1] == mtime_ns:
+            return cached[2]
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        self.cache[path] = [size, mtime_ns, digest.hexdigest()]
+        self.dirty = True
+        return self.cache[path][2]
+
+    def save(self):
+        if self.dirty:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            _write_json_atomic(self.path, self.cache)
+            self.dirty = False
+
+
+class EmbeddingStore:
+    """Chunked on-disk features for one backbone and number of views"""
+
+    def __init__(self, fingerprint, views=config.EMBEDDING_VIEWS + 1, root=config.EMBEDDINGS_DIR):
+        self.fingerprint = fingerprint
+        self.views = views
+        self.dir = os.path.join(root, f"{fingerprint}-v{views}")
+        self.index_path = os.path.join(self.dir, INDEX_FILE)
+        self.chunks = []
+        self.rows = {}
+        self.feature_dim = None
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+            self.chunks = index['chunks']
+            self.rows = index['rows']
+            self.feature_dim = index.get('feature_dim')
+
+    def __contains__(self, content_hash):
+        return content_hash in self.rows
+
+    def add(self, hashes, features):
+        """
+        Append features for new images as one chunk (the index is rewritten
+        after the chunk is on disk, so an interrupted run keeps earlier chunks)
+
+        Args:
+            hashes: Content hashes, one per row
+            features: Array (N, views, feature_dim)
+        """
+        if not hashes:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        name = f"chunk-{len(self.chunks):05d}.npy"
+        tmp_path = os.path.join(self.dir, f"{name}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, features.astype(np.float16))
+        os.replace(tmp_path, os.path.join(self.dir, name))
+        chunk_id = len(self.chunks)
+        self.chunks.append(name)
+        for row, content_hash in enumerate(hashes):
+            self.rows[content_hash] = [chunk_id, row]
+        self.feature_dim = int(features.shape[-1])
+        _write_json_atomic(self.index_path, {
+            'fingerprint': self.fingerprint,
+            'views': self.views,
+            'feature_dim': self.feature_dim,
+            'chunks': self.chunks,
+            'rows': self.rows
+        })
+
+    def get(self, hashes):
+        """
+        Returns:
+            np.ndarray: float16 (len(hashes), views, feature_dim), in input order
+        """
+        out = np.empty((len(hashes), self.views, self.feature_dim), dtype=np.float16)
+        chunks = {}
+        for i, content_hash in enumerate(hashes):
+            chunk_id, row = self.rows[content_hash]
+            if chunk_id not in chunks:
+                chunks[chunk_id] = np.load(os.path.join(self.dir, self.chunks[chunk_id]), mmap_mode='r')
+            out[i] = chunks[chunk_id][row]
+        return out
+
+
+def _decode_images(paths, img_size=config.IMG_SIZE, batch_size=config.BATCH_SIZE):
+    """Same decode/resize as data_loader.process_path, batched, in path order"""
+    def load(path):
+        img = tf.io.read_file(path)
+        img = tf.io.decode_image(img, channels=3, expand_animations=False)
+        img.set_shape([None, None, 3])
+        return tf.image.resize(img, [img_size, img_size])
+
+    return (tf.data.Dataset.from_tensor_slices(paths)
+            .map(load, num_parallel_calls=tf.data.AUTOTUNE)
+            .batch(batch_size)
+            .prefetch(tf.data.AUTOTUNE))
+
+
+def embed_directory(store, backbone, directory, hasher, batch_size=config.BATCH_SIZE):
+    """
+    Make sure every image of a data directory has cached features
+
+    Args:
+        store: EmbeddingStore
+        backbone: Frozen backbone model (pooled output)
+        directory: Data directory (Type/Breed/image.jpg)
+        hasher: ContentHasher
+        batch_size: Images per backbone forward pass
+
+    Returns:
+        tuple: (hashes, labels, class_names) for every image in the directory
+    """
+    manifest = get_manifest(directory)
+    class_names = manifest.class_names()
+    hashes, labels = embed_files(store, backbone, list(manifest.iter_files()), class_names, hasher,
+                                 batch_size=batch_size, label=directory)
+    return hashes, labels, class_names
+
+
+def embed_files(store, backbone, entries, class_names, hasher, batch_size=config.BATCH_SIZE, label='files'):
+    """
+    Make sure the given images have cached features
+
+    Args:
+        store: EmbeddingStore
+        backbone: Frozen backbone model (pooled output)
+        entries: (path, class_name, size, mtime_ns) tuples, as from DatasetManifest.iter_files
+        class_names: Class names defining the label indices
+        hasher: ContentHasher
+        batch_size: Images per backbone forward pass
+        label: Name used in progress output
+
+    Returns:
+        tuple: (hashes, labels) in entry order
+    """
+    class_to_index = {cls: i for i, cls in enumerate(class_names)}
+
+    hashes, labels, missing_paths, missing_hashes = [], [], [], []
+    seen = set()
+    for path, class_name, size, mtime_ns in entries:
+        content_hash = hasher.hash(path, size, mtime_ns)
+        hashes.append(content_hash)
+        labels.append(class_to_index[class_name])
+        if content_hash not in store and content_hash not in seen:
+            seen.add(content_hash)
+            missing_paths.append(path)
+            missing_hashes.append(content_hash)
+    hasher.save()
+
+    print(f"   {label}: {len(hashes)} images, {len(hashes) - len(missing_paths)} cached, "
+          f"{len(missing_paths)} to embed")
+    if not missing_paths:
+        return hashes, labels
+
+    augmenter = keras.Sequential(augmentation_layers())
+
+    @tf.function
+    def embed_batch(batch):
+        views = [backbone(batch, training=False)]
+        for _ in range(store.views - 1):
+            views.append(backbone(augmenter(batch, training=True), training=False))
+        return tf.stack(views, axis=1)
+
+    started = time.perf_counter()
+    features = []
+    done = flushed = 0
+    for batch in _decode_images(missing_paths, batch_size=batch_size):
+        features.append(embed_batch(batch).numpy())
+        done += len(batch)
+        # Persist every EMBEDDING_CHUNK_IMAGES images: bounded memory, and a crash keeps the finished chunks
+        if done - flushed >= config.EMBEDDING_CHUNK_IMAGES:
+            store.add(missing_hashes[flushed:done], np.concatenate(features, axis=0))
+            features, flushed = [], done
+        print(f"   embedded {done}/{len(missing_paths)} ({done / (time.perf_counter() - started):.1f} img/s)",
+              end='\r')
+    print()
+    if features:
+        store.add(missing_hashes[flushed:done], np.concatenate(features, axis=0))
+    return hashes, labels
+
+
+def _feature_dataset(features, labels, num_classes, batch_size, shuffle, seed=42):
+    """One random view per image per epoch when shuffling (training), view 0 otherwise"""
+    views = features.shape[1]
+    dataset = tf.data.Dataset.from_tensor_slices((features, tf.one_hot(labels, num_classes)))
+    if shuffle:
+        dataset = dataset.shuffle(buffer_size=len(labels), seed=seed, reshuffle_each_iteration=True)
+        pick = lambda f, y: (tf.cast(tf.gather(f, tf.random.uniform([], 0, views, dtype=tf.int32)), tf.float32), y)
+    else:
+        pick = lambda f, y: (tf.cast(f[0], tf.float32), y)
+    return (dataset.map(pick, num_parallel_calls=tf.data.AUTOTUNE)
+            .batch(batch_size)
+            .prefetch(tf.data.AUTOTUNE))
+
+
+def fit_head_on_cached_features(model, epochs, learning_rate, class_weights=None,
+                                train_dir=config.TRAIN_DIR, val_dir=config.VAL_DIR,
+                                batch_size=config.EMBEDDING_BATCH_SIZE, selection=None):
+    """
+    Train the classification head of a full model on cached backbone features
+
+    The backbone must be frozen (its features are assumed fixed). The head
+    weights of `model` are used as the starting point and are replaced by the
+    trained ones, so the caller can keep using `model` as usual afterwards.
+
+    Args:
+        model: Full classifier (create_model architecture)
+        epochs: Maximum epochs (early stopping on val_loss)
+        learning_rate: Adam learning rate
+        class_weights: Optional class weights
+        train_dir: Training images
+        val_dir: Validation images
+        batch_size: Feature batch size
+        selection: Optional dataset_manifest.select_incremental result; trains on
+            its new + replay images and validates on its val subset instead of
+            the directories
+        (With USE_SPLIT_MANIFEST and no selection, train/val are the split
+        manifest's assignments of train_dir.)
+
+    Returns:
+        keras.callbacks.History: Head training history
+    """
+    backbone = get_backbone(model)
+    fingerprint = backbone_fingerprint(backbone)
+    store = EmbeddingStore(fingerprint)
+    hasher = ContentHasher()
+
+    print(f"\n🧠 Embedding store: {store.dir}")
+    if selection is not None:
+        class_names = val_class_names = selection['class_names']
+        train_hashes, train_labels = embed_files(store, backbone, selection['new'] + selection['replay'],
+                                                 class_names, hasher, label='new + replay')
+        val_hashes, val_labels = embed_files(store, backbone, selection['val'], class_names, hasher,
+                                             label='validation subset')
+    elif config.USE_SPLIT_MANIFEST:
+        from dataset_splits import split_entries
+        train_entries, class_names = split_entries(train_dir, 'train')
+        val_entries, val_class_names = split_entries(train_dir, 'val')
+        train_hashes, train_labels = embed_files(store, backbone, train_entries, class_names, hasher,
+                                                 label='train split')
+        val_hashes, val_labels = embed_files(store, backbone, val_entries, class_names, hasher,
+                                             label='val split')
+    else:
+        train_hashes, train_labels, class_names = embed_directory(store, backbone, train_dir, hasher)
+        val_hashes, val_labels, val_class_names = embed_directory(store, backbone, val_dir, hasher)
+    if class_names != val_class_names:
+        print("Warning: Training and validation classes do not match exactly!")
+
+    num_classes = len(class_names)
+    if model.output_shape[-1] != num_classes:
+        raise ValueError(f"Model has {model.output_shape[-1]} outputs but data has {num_classes} classes")
+
+    train_ds = _feature_dataset(store.get(train_hashes), train_labels, num_classes, batch_size, shuffle=True)
+    val_ds = _feature_dataset(store.get(val_hashes), val_labels, num_classes, batch_size, shuffle=False)
+
+    head = create_head_model(num_classes, store.feature_dim)
+    copy_head_weights(model, head)
+    head.compile(
+        optimizer=keras.optimizers.Adam(learning_rate=learning_rate),
+        loss='categorical_crossentropy',
+        metrics=['accuracy', keras.metrics.TopKCategoricalAccuracy(k=3, name='top_3_accuracy')]
+    )
+
+    callbacks = [
+        keras.callbacks.EarlyStopping(
+            monitor='val_loss',
+            patience=config.EARLY_STOPPING_PATIENCE,
+            restore_best_weights=True,
+            verbose=1
+        ),
+        keras.callbacks.ReduceLROnPlateau(
+            monitor='val_loss',
+            factor=0.5,
+            patience=config.REDUCE_LR_PATIENCE,
+            min_lr=1e-7,
+            verbose=1
+        )
+    ] + training_event_callbacks(batch_size)
+
+    started = time.perf_counter()
+    history = head.fit(
+        train_ds,
+        epochs=epochs,
+        validation_data=val_ds,
+        class_weight=class_weights,
+        callbacks=callbacks,
+        verbose=1
+    )
+    print(f"✓ Head trained on cached features in {time.perf_counter() - started:.1f}s")
+
+    copy_head_weights(head, model)
+    return history
+
+
+if __name__ == '__main__':
+    import sys
+    from model import create_model
+
+    if '--imagenet' in sys.argv:
+        manifest = get_manifest(config.TRAIN_DIR)
+        model, _ = create_model(max(len(manifest.class_names()), 1))
+    else:
+        from releases import current_release
+        model_path = current_release().model_path
+        if not os.path.exists(model_path):
+            print(f"ERROR: No model found at {model_path} (use --imagenet)")
+            sys.exit(1)
+        model = keras.models.load_model(model_path, compile=False)
+
+    backbone = get_backbone(model)
+    store = EmbeddingStore(backbone_fingerprint(backbone))
+    hasher = ContentHasher()
+    print("=" * 50)
+    print(f"Embedding store: {store.dir}")
+    print("=" * 50)
+    embed_directory(store, backbone, config.TRAIN_DIR, hasher)
+    embed_directory(store, backbone, config.VAL_DIR, hasher)
+    print(f"✅ {len(store.rows)} images cached")
@@ -0,0 +1,323 @@
+"""
+Model evaluation harness with regression gates
+
+Runs a candidate classifier and the currently served one on the same fixed
+test set (ml/data/test, or the test split of the split manifest with
+USE_SPLIT_MANIFEST) and measures, per model:
+
+- top-1 / top-3 accuracy, overall and per class
+- single-image and batched prediction latency (p50/p99, model.predict as the
+  API calls it) on this host
+- load time, peak RSS and artifact size
+
+Each model is evaluated in its own process, so peak RSS is the model's own and
+one model's memory does not skew the other's latency.
+
+The candidate fails the gate when it breaks an absolute budget (EVAL_MAX_*
+in config.py) or regresses against the served model by more than the allowed
+margin: top-1 on the classes both models know, or p99 latency. The exit code
+is 1 on failure, so it can gate promotion (PROMOTION_GATE, or
+`training_runs.py promote --gate`).
+
+Usage:
+    python evaluate.py                          # newest staged run vs the served model
+    python evaluate.py --run train-20250101-120000
+    python evaluate.py --model path/to/model.keras --mapping path/to/class_mapping.json
+    python evaluate.py --served-only            # baseline numbers for the served model
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import config
+from releases import current_release
+
+
+def test_entries(use_split_manifest=config.USE_SPLIT_MANIFEST, test_dir=config.TEST_DIR):
+    """
+    The fixed test set
+
+    Returns:
+        tuple: ([(path, class_name)], description)
+    """
+    if use_split_manifest:
+        from dataset_splits import split_entries
+        entries = split_entries(config.TRAIN_DIR, 'test')[0]
+        source = "test split of the split manifest"
+    else:
+        from dataset_manifest import get_manifest
+        entries = list(get_manifest(test_dir).iter_files())
+        source = test_dir
+    return [(entry[0], entry[1]) for entry in entries], source
+
+
+def artifact_mb(path):
+    """Size of a model file or export directory"""
+    if os.path.isdir(path):
+        total = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    else:
+        total = os.path.getsize(path)
+    return round(total / (1024 * 1024), 2)
+
+
+def _percentiles_ms(samples):
+    samples = sorted(samples)
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(round(q * (len(samples) - 1))))] * 1000
+    return {'p50_ms': round(pick(0.5), 2), 'p99_ms': round(pick(0.99), 2)}
+
+
+def _evaluate_in_process(model_path, mapping_path, entries_path):
+    """Child-process entry point: evaluate one model, print one JSON line"""
+    import numpy as np
+    from tensorflow import keras
+    from data_loader import load_dataset_from_entries
+    from model_export import _peak_rss_mb
+
+    with open(mapping_path, 'r') as f:
+        class_names = json.load(f)['classes']
+    with open(entries_path, 'r') as f:
+        entries = json.load(f)
+    class_to_index = {cls: i for i, cls in enumerate(class_names)}
+    known = [(path, cls, 0, 0) for path, cls in entries if cls in class_to_index]
+    if not known:
+        raise ValueError("None of the test images belong to a class this model knows")
+
+    started = time.perf_counter()
+    model = keras.models.load_model(model_path, compile=False)
+    load_seconds = time.perf_counter() - started
+
+    dataset, labels = load_dataset_from_entries(known, class_names, shuffle=False)
+    probs = model.predict(dataset, verbose=0)
+    top3 = np.argsort(-probs, axis=1)[:, :3]
+    top1_hit = top3[:, 0] == labels
+    top3_hit = (top3 == labels[:, None]).any(axis=1)
+
+    per_class = {}
+    for index, (_, cls, _, _) in enumerate(known):
+        stats = per_class.setdefault(cls, {'images': 0, 'top1_correct': 0, 'top3_correct': 0})
+        stats['images'] += 1
+        stats['top1_correct'] += int(top1_hit[index])
+        stats['top3_correct'] += int(top3_hit[index])
+    for stats in per_class.values():
+        stats['top1'] = round(stats['top1_correct'] / stats['images'], 4)
+        stats['top3'] = round(stats['top3_correct'] / stats['images'], 4)
+
+    # Latency as the API sees it (model.predict on preprocessed arrays)
+    images = next(iter(dataset))[0].numpy()
+    batch = np.resize(images, (config.BATCH_SIZE,) + images.shape[1:])
+    model.predict(images[:1], verbose=0)  # Warm-up (tracing)
+    model.predict(batch, verbose=0)
+    single, batched = [], []
+    for i in range(config.EVAL_LATENCY_RUNS):
+        t = time.perf_counter()
+        model.predict(images[i % len(images):i % len(images) + 1], verbose=0)
+        single.append(time.perf_counter() - t)
+    for _ in range(max(5, config.EVAL_LATENCY_RUNS // 5)):
+        t = time.perf_counter()
+        model.predict(batch, verbose=0)
+        batched.append(time.perf_counter() - t)
+
+    print(json.dumps({
+        'images': len(known),
+        'unknown_class_images': len(entries) - len(known),
+        'top1': round(float(top1_hit.mean()), 4),
+        'top3': round(float(top3_hit.mean()), 4),
+        'per_class': per_class,
+        'latency_single': _percentiles_ms(single),
+        'latency_batch': {**_percentiles_ms(batched), 'batch_size': config.BATCH_SIZE},
+        'load_seconds': round(load_seconds, 2),
+        'peak_rss_mb': round(_peak_rss_mb(), 1)
+    }))
+
+
+def evaluate_model(model_path, mapping_path, entries):
+    """
+    Evaluate one model in a fresh process
+
+    Args:
+        model_path: .keras file
+        mapping_path: Its class_mapping.json
+        entries: [(path, class_name)] test images
+
+    Returns:
+        dict: Metrics (see _evaluate_in_process) plus artifact_mb
+    """
+    with tempfile.NamedTemporaryFile('w', suffix='.json', delete=False) as f:
+        json.dump(entries, f)
+        entries_path = f.name
+    try:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '_worker', model_path, mapping_path, entries_path],
+            capture_output=True, text=True, cwd=config.BASE_DIR,
+            env={**os.environ, 'TF_CPP_MIN_LOG_LEVEL': '2'}
+        )
+    finally:
+        os.remove(entries_path)
+    if proc.returncode != 0:
+        raise RuntimeError(f"Evaluating {model_path} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['model_path'] = model_path
+    result['artifact_mb'] = artifact_mb(model_path)
+    return result
+
+
+def shared_top1(candidate, served):
+    """Top-1 of both models over the classes both know (weighted by images)"""
+    shared = set(candidate['per_class']) & set(served['per_class'])
+    images = sum(candidate['per_class'][cls]['images'] for cls in shared)
+    if not images:
+        return None, None
+    hits = lambda result: sum(result['per_class'][cls]['top1_correct'] for cls in shared) / images
+    return round(hits(candidate), 4), round(hits(served), 4)
+
+
+def check_budgets(candidate, served=None):
+    """
+    Returns:
+        list: Human-readable budget breaches (empty = pass)
+    """
+    breaches = []
+    if candidate['top1'] < config.EVAL_MIN_TOP1:
+        breaches.append(f"top-1 {candidate['top1']:.4f} < {config.EVAL_MIN_TOP1}")
+    if candidate['latency_single']['p99_ms'] > config.EVAL_MAX_P99_MS:
+        breaches.append(f"single-image p99 {candidate['latency_single']['p99_ms']} ms > {config.EVAL_MAX_P99_MS} ms")
+    if candidate['peak_rss_mb'] > config.EVAL_MAX_PEAK_RSS_MB:
+        breaches.append(f"peak RSS {candidate['peak_rss_mb']} MB > {config.EVAL_MAX_PEAK_RSS_MB} MB")
+    if candidate['artifact_mb'] > config.EVAL_MAX_ARTIFACT_MB:
+        breaches.append(f"artifact {candidate['artifact_mb']} MB > {config.EVAL_MAX_ARTIFACT_MB} MB")
+    if served is None:
+        return breaches
+
+    candidate_top1, served_top1 = shared_top1(candidate, served)
+    if candidate_top1 is not None and served_top1 - candidate_top1 > config.EVAL_MAX_TOP1_DROP:
+        breaches.append(f"top-1 on shared classes dropped {served_top1:.4f} -> {candidate_top1:.4f} "
+                        f"(allowed {config.EVAL_MAX_TOP1_DROP})")
+    for key in ('latency_single', 'latency_batch'):
+        before, after = served[key]['p99_ms'], candidate[key]['p99_ms']
+        if before and after > before * (1 + config.EVAL_MAX_LATENCY_INCREASE):
+            breaches.append(f"{key.replace('_', ' ')} p99 {before} -> {after} ms "
+                            f"(allowed +{config.EVAL_MAX_LATENCY_INCREASE:.0%})")
+    return breaches
+
+
+def evaluate(candidate_path, candidate_mapping, compare=True, report_path=None, entries=None):
+    """
+    Evaluate a candidate (and the served model) and apply the budgets
+
+    Args:
+        candidate_path: Candidate .keras file
+        candidate_mapping: Its class_mapping.json
+        compare: Also evaluate the served model and check regressions
+        report_path: Where to write the JSON report (default: next to the candidate)
+        entries: Test images (default: test_entries())
+
+    Returns:
+        dict: Report with 'candidate', 'served', 'breaches' and 'passed'
+    """
+    source = "given entries"
+    if entries is None:
+        entries, source = test_entries()
+    if not entries:
+        raise ValueError(f"No test images in {source}")
+    print(f"🧪 Evaluating on {len(entries)} test images ({source})")
+
+    candidate = evaluate_model(candidate_path, candidate_mapping, entries)
+    served = None
+    release = current_release()
+    same_model = os.path.abspath(candidate_path) == os.path.abspath(release.model_path)
+    if compare and not same_model and release.exists():
+        served = evaluate_model(release.model_path, release.class_mapping_path, entries)
+
+    breaches = check_budgets(candidate, served)
+    report = {
+        'evaluated_at': time.time(),
+        'test_source': source,
+        'candidate': candidate,
+        'served': served,
+        'breaches': breaches,
+        'passed': not breaches
+    }
+    report_path = report_path or os.path.join(os.path.dirname(os.path.abspath(candidate_path)), 'evaluation.json')
+    tmp_path = f"{report_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, report_path)
+    report['report_path'] = report_path
+    return report
+
+
+def print_report(report):
+    print("=" * 60)
+    print("Evaluation")
+    print("=" * 60)
+    rows = [('candidate', report['candidate'])] + ([('served', report['served'])] if report['served'] else [])
+    for name, result in rows:
+        print(f"{name:>9}: top-1 {result['top1']:.4f} | top-3 {result['top3']:.4f} | "
+              f"p50/p99 {result['latency_single']['p50_ms']}/{result['latency_single']['p99_ms']} ms "
+              f"(batch of {result['latency_batch']['batch_size']}: {result['latency_batch']['p99_ms']} ms p99) | "
+              f"RSS {result['peak_rss_mb']} MB | {result['artifact_mb']} MB")
+    weakest = sorted(report['candidate']['per_class'].items(), key=lambda item: item[1]['top1'])[:5]
+    print("Weakest classes: " + ", ".join(f"{cls} {stats['top1']:.2f}" for cls, stats in weakest))
+    if report['candidate']['unknown_class_images']:
+        print(f"({report['candidate']['unknown_class_images']} test images belong to classes the candidate lacks)")
+    if report['breaches']:
+        print("❌ Budget exceeded:")
+        for breach in report['breaches']:
+            print(f"   - {breach}")
+    else:
+        print("✅ Within budget")
+    print(f"Report: {report['report_path']}")
+
+
+def gate_run(run):
+    """
+    Promotion gate for a staged training run
+
+    Args:
+        run: training_runs.TrainingRun with a finished candidate
+
+    Returns:
+        bool: True if the candidate is within budget
+    """
+    report = evaluate(run.model_path, run.class_mapping_path)
+    print_report(report)
+    return report['passed']
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '_worker':
+        _evaluate_in_process(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit(0)
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Evaluate a candidate model against the served one')
+    parser.add_argument('--run', default=None, help='Staged training run id (default: newest trained run)')
+    parser.add_argument('--model', default=None, help='Candidate .keras file instead of a run')
+    parser.add_argument('--mapping', default=None, help="Candidate class_mapping.json (default: next to --model)")
+    parser.add_argument('--served-only', action='store_true', help='Evaluate the served model alone')
+    parser.add_argument('--no-compare', action='store_true', help='Only apply the absolute budgets')
+    args = parser.parse_args()
+
+    if args.served_only:
+        release = current_release()
+        model_path, mapping_path = release.model_path, release.class_mapping_path
+    elif args.model:
+        model_path = args.model
+        mapping_path = args.mapping or os.path.join(os.path.dirname(os.path.abspath(args.model)), 'class_mapping.json')
+    else:
+        from training_runs import TrainingRun, TRAINED
+        run = TrainingRun.find(run_id=args.run, status=None if args.run else TRAINED)
+        if run is None:
+            print("❌ No staged run to evaluate (train with --no-promote, or pass --model)")
+            sys.exit(1)
+        model_path, mapping_path = run.model_path, run.class_mapping_path
+
+    report = evaluate(model_path, mapping_path, compare=not args.no_compare)
+    print_report(report)
+    sys.exit(0 if report['passed'] else 1)
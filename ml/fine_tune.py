@@ -1,6 +1,21 @@
 """
 Fine-tuning script for adding more training data to an existing model
 Use this when you want to add more images for specific breeds without starting from scratch
+
+With --incremental only the images added since the model was last trained
+(per the served release's trained_files.json) are used, together with a
+class-balanced replay sample of previously seen images (REPLAY_SAMPLE_SIZE) to
+avoid forgetting, and evaluation runs on a stratified validation subset. The cost then scales with
+the size of the change instead of the size of the dataset.
+
+A crashed run stays in models/runs/ with its last epoch checkpoint; --resume
+continues it with the saved optimizer state (see training_runs.py).
+
+Usage:
+    python fine_tune.py                                  # all training data
+    python fine_tune.py --incremental [--replay-size N]  # new images + replay
+    python fine_tune.py --no-cache                       # whole model on images
+    python fine_tune.py --resume [RUN_ID]                # continue an unfinished run
 """
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
@@ -21,38 +36,90 @@ else:
     print("No GPU detected - training will use CPU")
 
 import config
-from data_loader import create_data_generators, get_class_weights
+from data_loader import create_data_generators, get_class_weights, load_dataset_from_entries
+from dataset_manifest import get_manifest, training_snapshot, load_training_snapshot, select_incremental
 from model import get_callbacks
+from precision import TrainingModes
+from training_runs import TrainingRun
+from releases import current_release
+from profiling import profiler_callbacks
 import json
+import shutil
 import sys
 
 # Force UTF-8 for Windows consoles/logs
 sys.stdout.reconfigure(encoding='utf-8')
 
-def fine_tune_existing_model():
+def fine_tune_existing_model(use_embedding_cache=config.USE_EMBEDDING_CACHE, incremental=False,
+                             replay_size=config.REPLAY_SAMPLE_SIZE, mixed_precision=config.MIXED_PRECISION,
+                             jit_compile=config.XLA_JIT, resume=None, promote=True, profile=config.PROFILE_TRAINING):
     """
     Fine-tune an existing trained model with additional data
+    
+    Args:
+        use_embedding_cache: Train only the head, on cached backbone features
+            (seconds to minutes). Otherwise the whole model trains on images.
+        incremental: Train on new images plus a replay sample instead of the
+            whole training set (falls back to a full run without a baseline)
+        replay_size: Previously seen images replayed in incremental mode
+        mixed_precision: Train on images with a bfloat16 mixed-precision policy
+        jit_compile: XLA-compile the training step
+        resume: 'latest' or a run id to continue from its last checkpoint
+        promote: Make the fine-tuned model the served one at the end
+        profile: Record input wait vs compute of the image-based fit
+    
+    Returns:
+        bool: False if fine-tuning failed or the promotion gate rejected the model
+            (True when there was nothing new to learn)
     """
     print("=" * 50)
     print("Pet Breed Classification - Fine-Tuning")
     print("=" * 50)
     
-    # Check if existing model exists
-    if not os.path.exists(config.MODEL_PATH):
-        print(f"ERROR: No existing model found at {config.MODEL_PATH}")
+    # Check if existing model exists (model and training baseline come from the same served release)
+    served = current_release()
+    if not os.path.exists(served.model_path):
+        print(f"ERROR: No existing model found at {served.model_path}")
         print("Please train the initial model first using train.py")
-        return
+        return False
     
-    print(f"\nFound existing model at {config.MODEL_PATH}")
+    print(f"\nFound existing model at {served.model_path}")
     
     # Load existing model
     print("\nLoading existing model...")
-    model = keras.models.load_model(config.MODEL_PATH)
+    model = keras.models.load_model(served.model_path)
     print("Model loaded successfully")
     
-    # Create data generators with new data
-    print("\nLoading training data (including new images)...")
-    train_gen, val_gen, class_names = create_data_generators()
+    # Snapshot what this run sees before loading, so images added meanwhile count as new next time
+    trained_files = training_snapshot(get_manifest(config.TRAIN_DIR))
+    
+    selection = None
+    if incremental:
+        baseline = load_training_snapshot(served.trained_files_path)
+        if baseline is None:
+            print(f"\nNo training baseline at {served.trained_files_path}; running a full fine-tune")
+        else:
+            splits = None
+            if config.USE_SPLIT_MANIFEST:
+                from dataset_splits import split_assignments
+                splits = split_assignments(config.TRAIN_DIR)
+            selection = select_incremental(config.TRAIN_DIR, config.VAL_DIR, baseline,
+                                           replay_size, config.INCREMENTAL_VAL_PER_CLASS, splits=splits)
+            print(f"\nIncremental: {len(selection['new'])} new images, {len(selection['replay'])} replayed, "
+                  f"{len(selection['val'])} validation images")
+            if not selection['new']:
+                print("No new images since the model was last trained - nothing to do")
+                print("Fine-Tuning Complete!")
+                return True
+    
+    if selection is not None:
+        class_names = selection['class_names']
+        train_gen, train_labels = load_dataset_from_entries(selection['new'] + selection['replay'], class_names)
+        val_gen, _ = load_dataset_from_entries(selection['val'], class_names, shuffle=False)
+    else:
+        # Create data generators with new data
+        print("\nLoading training data (including new images)...")
+        train_gen, val_gen, class_names = create_data_generators()
     
     num_classes = len(class_names)
     print(f"\nDetected {num_classes} classes (breeds)")
@@ -69,46 +136,81 @@ def fine_tune_existing_model():
         # We need to close the current session/model to avoid conflicts? 
         # Actually, add_new_breed_to_model loads the model again. 
         # Let's just return and call that function.
-        return add_new_breed_to_model()
+        return add_new_breed_to_model(use_embedding_cache=use_embedding_cache,
+                                      mixed_precision=mixed_precision, jit_compile=jit_compile, resume=resume,
+                                      promote=promote, profile=profile)
     
-    # Calculate class weights
-    class_weights = get_class_weights(train_gen)
+    # Calculate class weights (over the selection in incremental mode: new images skew it)
+    if selection is not None:
+        class_weights = get_class_weights(train_gen, labels=train_labels)
+        class_weights = {i: class_weights.get(i, 1.0) for i in range(num_classes)}
+    else:
+        class_weights = get_class_weights(train_gen)
     
-    # Update class mapping
-    class_mapping = {
-        'classes': class_names,
-        'num_classes': num_classes
-    }
-    with open(os.path.join(config.MODEL_DIR, 'class_mapping.json'), 'w') as f:
-        json.dump(class_mapping, f, indent=2)
-    
-    # Configure for fine-tuning with lower learning rate
-    print("\nConfiguring model for fine-tuning...")
-    model.compile(
-        optimizer=keras.optimizers.Adam(learning_rate=0.00001),  # Very low learning rate
-        loss='categorical_crossentropy',
-        metrics=['accuracy', keras.metrics.TopKCategoricalAccuracy(k=3, name='top_3_accuracy')]
-    )
+    # Checkpoints go to the run's staging directory, not the served model
+    run = None
+    if resume:
+        run = TrainingRun.find('fine_tune', run_id=None if resume == 'latest' else resume)
+        if run is None:
+            print("\nNo unfinished fine-tuning run to resume; starting a new one")
+        elif run.state['script'] != 'fine_tune' or run.state['class_names'] != class_names:
+            print(f"ERROR: Run {run.run_id} is not a fine-tuning run over the current classes; it cannot be resumed")
+            return False
+    if run is None:
+        run = TrainingRun.create('fine_tune', 42, class_names)
+    resumed_model, resumed_phase, resumed_epoch, phase_done = run.resume_point()
+    run.seed_epoch(resumed_epoch)
+    
+    if resumed_model is not None:
+        # Compiled, with its optimizer state
+        model = resumed_model
+    else:
+        # Configure for fine-tuning with lower learning rate
+        print("\nConfiguring model for fine-tuning...")
+        model.compile(
+            optimizer=keras.optimizers.Adam(learning_rate=0.00001),  # Very low learning rate
+            loss='categorical_crossentropy',
+            metrics=['accuracy', keras.metrics.TopKCategoricalAccuracy(k=3, name='top_3_accuracy')]
+        )
     
     # Get callbacks
-    callbacks = get_callbacks()
+    callbacks = get_callbacks(run)
+    modes = TrainingModes(mixed_precision, jit_compile)
+    profile_results = []
     
     # Fine-tune with new data
     print("\n" + "=" * 50)
     print("Fine-Tuning with Additional Data")
     print("=" * 50)
     
-    # Use fewer epochs for fine-tuning
-    fine_tune_epochs = 2
-    
-    history = model.fit(
-        train_gen,
-        epochs=fine_tune_epochs,
-        validation_data=val_gen,
-        class_weight=class_weights,
-        callbacks=callbacks,
-        verbose=1
-    )
+    if phase_done:
+        print("Done in the resumed run")
+    elif use_embedding_cache:
+        # Head-only on cached features: cheap enough for more epochs (early stopping)
+        from embedding_store import fit_head_on_cached_features
+        history = fit_head_on_cached_features(
+            model,
+            epochs=config.FINE_TUNE_EPOCHS,
+            learning_rate=config.FINE_TUNE_LEARNING_RATE,
+            class_weights=class_weights,
+            selection=selection
+        )
+        run.complete_phase('fine_tuning', model, len(history.history.get('loss', [])), history)
+    else:
+        # Use fewer epochs for fine-tuning
+        fine_tune_epochs = 2
+        
+        model = modes.apply(model)
+        model.fit(
+            train_gen,
+            epochs=fine_tune_epochs,
+            validation_data=val_gen,
+            class_weight=class_weights,
+            callbacks=callbacks + [modes.callback('fine_tuning'), run.callback('fine_tuning')]
+                      + profiler_callbacks(profile, 'fine_tuning', train_gen, profile_results),
+            initial_epoch=resumed_epoch,
+            verbose=1
+        )
     
     # Evaluate
     print("\n" + "=" * 50)
@@ -116,34 +218,84 @@ def fine_tune_existing_model():
     print("=" * 50)
     
     results = model.evaluate(val_gen, verbose=1)
+    if selection is not None:
+        print(f"(stratified subset: {len(selection['val'])} images)")
     print(f"\nValidation Accuracy: {results[1]:.4f}")
     print(f"Validation Top-3 Accuracy: {results[2]:.4f}")
     
-    # Save fine-tuned model
-    model.save(config.MODEL_PATH)
-    print(f"\nFine-tuned model saved to {config.MODEL_PATH}")
+    # Stage the fine-tuned model (always float32), then promote it to serving
+    model = modes.restore(model)
+    run.finish(model, class_names, trained_files)
+    promoted = promote and run.promote(model)
     
-    # Save training history
+    # Save training history (accumulated across resumes)
     history_dict = {
-        'fine_tuning': {k: [float(v) for v in vals] for k, vals in history.history.items()}
+        'run_id': run.run_id,
+        'fine_tuning': run.history('fine_tuning'),
+        'throughput': modes.throughput,
+        'profile': profile_results
     }
-    with open(os.path.join(config.MODEL_DIR, 'fine_tuning_history.json'), 'w') as f:
+    if selection is not None:
+        history_dict['incremental'] = {
+            'new_images': len(selection['new']),
+            'replayed_images': len(selection['replay']),
+            'validation_images': len(selection['val'])
+        }
+    with open(os.path.join(run.directory, 'fine_tuning_history.json'), 'w') as f:
         json.dump(history_dict, f, indent=2)
+    if promoted:
+        shutil.copyfile(os.path.join(run.directory, 'fine_tuning_history.json'),
+                        os.path.join(config.MODEL_DIR, 'fine_tuning_history.json'))
     
     print("\n" + "=" * 50)
     print("Fine-Tuning Complete!")
     print("=" * 50)
-    print(f"\nYour improved model is ready at: {config.MODEL_PATH}")
-    print("Restart the backend to use the updated model.")
+    if promoted:
+        print(f"\nYour improved model is ready at: {current_release().model_path}")
+        print("Restart the backend to use the updated model.")
+    else:
+        print(f"\nCandidate staged at {run.model_path} (not served)")
+        print(f"Promote it with: python training_runs.py promote {run.run_id}")
+    return promoted or not promote
 
 
 if __name__ == '__main__':
+    import argparse
     import numpy as np
     import random
     
+    parser = argparse.ArgumentParser(description='Fine-tune the existing model')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Fine-tune the whole model on images instead of the head on cached features')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Train on images added since the last run plus a replay sample')
+    parser.add_argument('--replay-size', type=int, default=config.REPLAY_SAMPLE_SIZE,
+                        help='Previously seen images replayed in incremental mode')
+    parser.add_argument('--bf16', action=argparse.BooleanOptionalAction, default=config.MIXED_PRECISION,
+                        help='bfloat16 mixed precision (falls back to float32 if unsupported)')
+    parser.add_argument('--xla', action=argparse.BooleanOptionalAction, default=config.XLA_JIT,
+                        help='XLA jit_compile for model.fit (falls back if unavailable)')
+    parser.add_argument('--profile', action=argparse.BooleanOptionalAction, default=config.PROFILE_TRAINING,
+                        help='Measure input-pipeline wait vs compute per step (see profiling.py)')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='RUN_ID',
+                        help='Continue the latest (or the given) unfinished run from its last checkpoint')
+    parser.add_argument('--no-promote', action='store_true',
+                        help='Leave the fine-tuned model staged in models/runs/ instead of serving it')
+    args = parser.parse_args()
+    
     SEED = 42
     random.seed(SEED)
     np.random.seed(SEED)
     tf.random.set_seed(SEED)
     
-    fine_tune_existing_model()
+    ok = fine_tune_existing_model(
+        use_embedding_cache=config.USE_EMBEDDING_CACHE and not args.no_cache,
+        incremental=args.incremental,
+        replay_size=args.replay_size,
+        mixed_precision=args.bf16,
+        jit_compile=args.xla,
+        resume=args.resume,
+        promote=not args.no_promote,
+        profile=args.profile
+    )
+    sys.exit(0 if ok else 1)
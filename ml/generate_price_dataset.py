@@ -1,10 +1,35 @@
 """
 Generate synthetic price training dataset from existing image data
+
+Rows are sampled per breed as NumPy arrays (age, weight, health, vaccination,
+country and noise drawn in one call each), in chunks of --chunk-rows that run
+in parallel processes. Every chunk has its own generator spawned from --seed,
+so the output depends on the seed and chunk size, not on the worker count.
+
+By default each breed gets one row per image (train + val). --rows-per-breed N
+gives every breed on disk N rows regardless of its image count, e.g. to build
+10M-row sets for stress-testing the price model. CSV output is one file;
+Parquet output is a directory of one file per chunk, written to a temp
+directory and swapped in when complete.
+
+Usage:
+    python generate_price_dataset.py
+    python generate_price_dataset.py --rows-per-breed 250000 --format parquet
+    python generate_price_dataset.py --rows-per-breed 250000 --format parquet --workers 8 --chunk-rows 500000
 """
 import os
-import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
 import pandas as pd
 import config
+from dataset_manifest import get_manifest
+
+CSV_PATH = os.path.join(config.DATA_DIR, 'price_training_data.csv')
+PARQUET_DIR = os.path.join(config.DATA_DIR, 'price_training_data.parquet')
+CHUNK_ROWS = 1_000_000
 
 # Breed-specific characteristics for realistic data generation (2024/2025 Market Prices)
 BREED_CHARACTERISTICS = {
@@ -365,222 +390,191 @@ def normalize_name(name):
 NORMALIZED_BREED_CHARS = {normalize_name(k): v for k, v in BREED_CHARACTERISTICS.items()}
 NORMALIZED_COUNTRY_MAP = {normalize_name(k): v for k, v in BREED_COUNTRY_MAP.items()}
 
-def generate_metadata(pet_type, breed):
+# Every country a row can get; rows store an index into this list
+COUNTRIES = sorted({country for countries in BREED_COUNTRY_MAP.values() for country in countries} | {'USA'})
+COUNTRY_INDEX = {country: i for i, country in enumerate(COUNTRIES)}
+
+# (default weight, minimum price) per type; anything else is (20, 100)
+TYPE_DEFAULTS = {
+    'Cat': (5, 80),
+    'Fish': (0.1, 5),
+    'Bird': (0.2, 20),
+    'Monkey': (5, 1000),
+}
+
+# Age in months, skewed towards younger pets
+AGES = np.arange(2, 61)
+AGE_PROBS = np.where(AGES < 12, 3, np.where(AGES < 24, 2, 1)).astype(float)
+AGE_PROBS /= AGE_PROBS.sum()
+
+# Health: 0=normal, 1=good, 2=excellent
+HEALTH_PROBS = [0.2, 0.5, 0.3]
+VACCINATION_RATE = 0.85
+
+# Percent-of-base-price bonuses and limits by size class
+SIZE_RULES = {
+    # Small animals (fish, birds, cheap cats/dogs)
+    'small': {
+        'health_bonus_pct': np.array([0.00, 0.10, 0.25]),  # good = +10%, excellent = +25%
+        'vacc_bonus_pct': 0.10,                            # +10% if vaccinated
+        'noise_pct': 0.15,                                 # ±15% random noise
+        'max_multiplier': 2.5                              # hard cap base_price * 2.5
+    },
+    # Big animals (most dogs, monkeys, expensive cats)
+    'big': {
+        'health_bonus_pct': np.array([0.00, 0.15, 0.35]),
+        'vacc_bonus_pct': 0.20,
+        'noise_pct': 0.30,
+        'max_multiplier': 4.0
+    },
+}
+
+
+def sample_breed(pet_type, breed, n, rng):
     """
-    Generate realistic metadata for a pet
+    Sample n rows of realistic metadata for one breed
 
     Args:
         pet_type: Dog / Cat / Bird / Fish / Monkey
         breed: Breed name (folder name)
+        n: Number of rows
+        rng: numpy Generator
 
     Returns:
-        dict: Metadata including age, weight, health, vaccination, country, price
+        dict: Arrays age_months, weight, health_status, vaccinated, country (index
+            into COUNTRIES) and price
     """
-    # ---------- Defaults by type ----------
-    default_weight = 20
-    min_price = 100  # default minimum price
-
-    if pet_type == 'Cat':
-        default_weight = 5
-        min_price = 80
-    elif pet_type == 'Fish':
-        default_weight = 0.1
-        min_price = 5
-    elif pet_type == 'Bird':
-        default_weight = 0.2
-        min_price = 20
-    elif pet_type == 'Monkey':
-        default_weight = 5
-        min_price = 1000
-
-    # Try to find breed using normalized name
-    normalized_breed = normalize_name(breed)
-    breed_info = NORMALIZED_BREED_CHARS.get(normalized_breed)
-
-    if not breed_info:
-        # Fallback if a folder exists but breed not configured
-        breed_info = {
-            'avg_weight': default_weight,
-            'base_price': min_price,
-            'price_range': min_price * 0.3
-        }
+    default_weight, min_price = TYPE_DEFAULTS.get(pet_type, (20, 100))
 
+    # Try to find breed using normalized name; fallback if a folder exists but breed not configured
+    normalized_breed = normalize_name(breed)
+    breed_info = NORMALIZED_BREED_CHARS.get(normalized_breed) or {
+        'avg_weight': default_weight,
+        'base_price': min_price,
+        'price_range': min_price * 0.3
+    }
     base_price = breed_info['base_price']
-    price_range = breed_info['price_range']
-
-    # ---------- SMALL vs BIG animal classification ----------
-    # Small animals: fish & birds, plus very cheap cats/dogs
-    if pet_type in ['Fish', 'Bird'] or base_price < 500:
-        size_class = 'small'
-    else:
-        size_class = 'big'
+    avg_weight = breed_info['avg_weight']
+    rules = SIZE_RULES['small' if pet_type in ['Fish', 'Bird'] or base_price < 500 else 'big']
 
     # ---------- Country ----------
-    possible_countries = NORMALIZED_COUNTRY_MAP.get(normalized_breed, ['USA'])
-    country = random.choice(possible_countries)
-    country_multiplier = COUNTRY_MULTIPLIERS.get(country, 1.0)
+    countries = np.array([COUNTRY_INDEX[c] for c in NORMALIZED_COUNTRY_MAP.get(normalized_breed, ['USA'])])
+    multipliers = np.array([COUNTRY_MULTIPLIERS.get(COUNTRIES[i], 1.0) for i in countries])
+    pick = rng.integers(len(countries), size=n)
 
     # ---------- Age ----------
-    age_months = random.choices(
-        range(2, 61),
-        weights=[3 if i < 12 else 2 if i < 24 else 1 for i in range(2, 61)]
-    )[0]
-
-    # Age factor: same for all, but reasonable
-    if age_months < 6:
-        age_factor = 1.3
-    elif age_months < 12:
-        age_factor = 1.1
-    elif age_months < 24:
-        age_factor = 1.0
-    else:
-        age_factor = 0.85
-
-    # ---------- Weight ----------
-    weight = max(0.1, breed_info['avg_weight'] + random.uniform(-0.2, 0.2) * breed_info['avg_weight'])
-    weight = round(weight, 2)
-
-    # ---------- Health & vaccination ----------
-    # 0=normal, 1=good, 2=excellent
-    health_status = random.choices([0, 1, 2], weights=[0.2, 0.5, 0.3])[0]
-    vaccinated = random.choices([0, 1], weights=[0.15, 0.85])[0]
-
-    # Percent-based bonuses, different for small vs big animals
-    if size_class == 'small':
-        # Small animals (fish, birds, cheap cats/dogs)
-        # Percent of base_price
-        health_bonus_pct_map = {
-            0: 0.00,   # normal
-            1: 0.10,   # good = +10%
-            2: 0.25    # excellent = +25%
-        }
-        vacc_bonus_pct = 0.10 if vaccinated else 0.0   # +10% if vaccinated
-        noise_pct = 0.15                               # ±15% random noise
-        max_multiplier = 2.5                           # hard cap base_price * 2.5
-    else:
-        # Big animals (most dogs, monkeys, expensive cats)
-        health_bonus_pct_map = {
-            0: 0.00,
-            1: 0.15,   # +15%
-            2: 0.35    # +35%
-        }
-        vacc_bonus_pct = 0.20 if vaccinated else 0.0   # +20%
-        noise_pct = 0.30                               # ±30% random noise
-        max_multiplier = 4.0                           # base_price * 4 cap
-
-    health_bonus = base_price * health_bonus_pct_map[health_status]
-    vacc_bonus = base_price * vacc_bonus_pct
+    age_months = rng.choice(AGES, size=n, p=AGE_PROBS)
+    age_factor = np.select([age_months < 6, age_months < 12, age_months < 24], [1.3, 1.1, 1.0], 0.85)
 
-    # ---------- Price computation ----------
-    # Start from base_price and apply factors and bonuses
-    price = base_price
-
-    # 1) age
-    price *= age_factor
-
-    # 2) country (prestige/exotic)
-    price *= country_multiplier
-
-    # 3) add health & vaccination bonuses as absolute amounts based on base_price
-    price += health_bonus + vacc_bonus
-
-    # 4) add random noise proportional to base_price
-    noise = random.uniform(-noise_pct, noise_pct) * base_price
-    price += noise
+    # ---------- Weight, health & vaccination ----------
+    weight = np.maximum(0.1, avg_weight + rng.uniform(-0.2, 0.2, n) * avg_weight).round(2)
+    health_status = rng.choice(3, size=n, p=HEALTH_PROBS).astype(np.int8)
+    vaccinated = (rng.random(n) < VACCINATION_RATE).astype(np.int8)
 
-    # 5) clamp by size-based maximum (relative cap)
-    price_cap = base_price * max_multiplier
-    price = min(price, price_cap)
-
-    # 6) special cap for Gold Fish so "best" ≈ <= 50 USD
+    # ---------- Price computation ----------
+    # age and country factors, then health/vaccination bonuses and noise as shares of base_price
+    price = base_price * age_factor * multipliers[pick]
+    price += base_price * (rules['health_bonus_pct'][health_status] + rules['vacc_bonus_pct'] * vaccinated)
+    price += rng.uniform(-rules['noise_pct'], rules['noise_pct'], n) * base_price
+    price = np.minimum(price, base_price * rules['max_multiplier'])
+    # Special cap for Gold Fish so "best" ≈ <= 50 USD
     if pet_type == 'Fish' and normalized_breed == normalize_name('Gold Fish'):
-        price = min(price, 50.0)
-
-    # 7) enforce minimum per type
-    price = max(min_price, round(price, 2))
+        price = np.minimum(price, 50.0)
+    price = np.maximum(min_price, price.round(2))
 
     return {
         'age_months': age_months,
         'weight': weight,
         'health_status': health_status,
         'vaccinated': vaccinated,
-        'country': country,
+        'country': countries[pick],
         'price': price
     }
 
-def scan_directory_and_generate_dataset(base_dir, dataset_name):
+
+def breed_row_counts(rows_per_breed=None):
     """
-    Scan directory and generate dataset rows
+    Rows to generate per (type, breed) found in the image folders
 
     Args:
-        base_dir: Directory to scan (train or val)
-        dataset_name: Name for logging (train/val)
+        rows_per_breed: Rows for every breed; None = one row per train + val image
 
     Returns:
-        list: List of data rows
+        dict: {(type, breed): rows}
     """
-    data_rows = []
-
-    if not os.path.exists(base_dir):
-        print(f"Warning: {base_dir} does not exist")
-        return data_rows
-
-    # Scan Type/Breed/image.jpg structure
-    for pet_type in os.listdir(base_dir):
-        pet_type_dir = os.path.join(base_dir, pet_type)
-
-        if not os.path.isdir(pet_type_dir):
+    counts = {}
+    for base_dir in (config.TRAIN_DIR, config.VAL_DIR):
+        if not os.path.exists(base_dir):
+            print(f"Warning: {base_dir} does not exist")
             continue
-
-        for breed in os.listdir(pet_type_dir):
-            breed_dir = os.path.join(pet_type_dir, breed)
-
-            if not os.path.isdir(breed_dir):
+        # Type/Breed/image.jpg structure (counts from the manifest)
+        for class_name, count in get_manifest(base_dir).class_counts().items():
+            if '/' not in class_name:
                 continue
+            key = tuple(class_name.split('/', 1))
+            counts[key] = counts.get(key, 0) + count
+    if rows_per_breed is not None:
+        counts = {key: rows_per_breed for key in counts}
+    return {key: count for key, count in sorted(counts.items()) if count > 0}
+
+
+def plan_chunks(counts, chunk_rows=CHUNK_ROWS):
+    """Split the per-breed row counts into chunks of at most chunk_rows: [[(type, breed, rows)]]"""
+    chunks, current, size = [], [], 0
+    for (pet_type, breed), remaining in counts.items():
+        while remaining:
+            take = min(remaining, chunk_rows - size)
+            current.append((pet_type, breed, take))
+            size += take
+            remaining -= take
+            if size == chunk_rows:
+                chunks.append(current)
+                current, size = [], 0
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def generate_chunk(segments, seed_seq, types, breeds):
+    """
+    Generate one chunk as a DataFrame
 
-            # Process all images in breed directory
-            for image_file in os.listdir(breed_dir):
-                if image_file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                    # Generate metadata
-                    metadata = generate_metadata(pet_type, breed)
-
-                    # Create row (NO image_path)
-                    row = {
-                        'type': pet_type,
-                        'breed': breed,
-                        **metadata
-                    }
-
-                    data_rows.append(row)
-
-    print(f"Generated {len(data_rows)} samples from {dataset_name}")
-    return data_rows
-
-def main():
-    """Generate synthetic price dataset"""
-    print("=" * 60)
-    print("Generating Synthetic Price Dataset (Metadata Only)")
-    print("=" * 60)
-
-    # Collect data from train and val directories
-    all_data = []
-
-    print("\n📁 Scanning training data...")
-    train_data = scan_directory_and_generate_dataset(config.TRAIN_DIR, 'train')
-    all_data.extend(train_data)
-
-    print("\n📁 Scanning validation data...")
-    val_data = scan_directory_and_generate_dataset(config.VAL_DIR, 'val')
-    all_data.extend(val_data)
-
-    if not all_data:
-        print("\n❌ No images found! Please ensure ml/data/train and ml/data/val contain images.")
-        return
-
-    # Create DataFrame
-    df = pd.DataFrame(all_data)
-
-    # Show statistics
+    type, breed and country are categoricals over the same categories in every
+    chunk, so Parquet parts share one schema.
+    """
+    rng = np.random.default_rng(seed_seq)
+    samples = [sample_breed(pet_type, breed, n, rng) for pet_type, breed, n in segments]
+    sizes = [n for _, _, n in segments]
+
+    def column(name):
+        return np.concatenate([sample[name] for sample in samples])
+    type_codes = np.repeat([types.index(pet_type) for pet_type, _, _ in segments], sizes)
+    breed_codes = np.repeat([breeds.index(breed) for _, breed, _ in segments], sizes)
+    return pd.DataFrame({
+        'type': pd.Categorical.from_codes(type_codes, types),
+        'breed': pd.Categorical.from_codes(breed_codes, breeds),
+        'age_months': column('age_months'),
+        'weight': column('weight'),
+        'health_status': column('health_status'),
+        'vaccinated': column('vaccinated'),
+        'country': pd.Categorical.from_codes(column('country'), COUNTRIES),
+        'price': column('price')
+    })
+
+
+def _write_part(index, segments, seed_seq, types, breeds, output_dir):
+    """Worker: generate a chunk and write it as output_dir/part-<index>.parquet"""
+    df = generate_chunk(segments, seed_seq, types, breeds)
+    df.to_parquet(os.path.join(output_dir, f"part-{index:05d}.parquet"), index=False)
+    return len(df)
+
+
+def _progress(done, total, started):
+    elapsed = time.perf_counter() - started
+    print(f"   {done:,} / {total:,} rows ({done / total:.0%}, {done / max(elapsed, 1e-9):,.0f} rows/sec)")
+
+
+def print_statistics(df):
     print("\n" + "=" * 60)
     print("Dataset Statistics")
     print("=" * 60)
@@ -595,13 +589,101 @@ def main():
     print(df['health_status'].value_counts())
     print(f"\nVaccination rate: {df['vaccinated'].mean() * 100:.1f}%")
 
-    # Save to CSV
-    output_path = os.path.join(config.DATA_DIR, 'price_training_data.csv')
-    df.to_csv(output_path, index=False)
-    print(f"\n✅ Dataset saved to: {output_path}")
-    print(f"   Columns: {list(df.columns)}")
+
+def generate_dataset(rows_per_breed=None, output_format='csv', output_path=None, seed=42,
+                     workers=None, chunk_rows=CHUNK_ROWS):
+    """
+    Generate the synthetic price dataset
+
+    Args:
+        rows_per_breed: Rows for every breed (None = one row per image)
+        output_format: 'csv' (one file) or 'parquet' (directory of chunk files)
+        output_path: Default CSV_PATH / PARQUET_DIR
+        seed: Base seed; each chunk gets its own generator spawned from it
+        workers: Parallel processes (default: CPU count)
+        chunk_rows: Rows per chunk (and per Parquet file)
+
+    Returns:
+        int: Rows written (0 if there are no breed folders)
+    """
+    counts = breed_row_counts(rows_per_breed)
+    if not counts:
+        return 0
+    total = sum(counts.values())
+    types = sorted({pet_type for pet_type, _ in counts})
+    breeds = sorted({breed for _, breed in counts})
+    chunks = plan_chunks(counts, chunk_rows)
+    seeds = np.random.SeedSequence(seed).spawn(len(chunks))
+    workers = min(workers or os.cpu_count() or 1, len(chunks))
+    output_path = output_path or (PARQUET_DIR if output_format == 'parquet' else CSV_PATH)
+    print(f"\n🚀 {total:,} rows for {len(counts)} breeds in {len(chunks)} chunk(s), {workers} worker(s)")
+
+    started = time.perf_counter()
+    done = 0
+    if output_format == 'parquet':
+        tmp_dir = f"{output_path}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_write_part, i, segments, seeds[i], types, breeds, tmp_dir)
+                           for i, segments in enumerate(chunks)]
+                for future in as_completed(futures):
+                    done += future.result()
+                    _progress(done, total, started)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+        # Swap in the complete directory (stale parts of an older, larger set never mix in)
+        shutil.rmtree(output_path, ignore_errors=True)
+        os.replace(tmp_dir, output_path)
+    else:
+        tmp_path = f"{output_path}.{os.getpid()}.tmp"
+        frames = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map keeps chunk order, so the CSV is the same whatever the worker count
+            results = pool.map(generate_chunk, chunks, seeds, [types] * len(chunks), [breeds] * len(chunks))
+            with open(tmp_path, 'w', newline='') as f:
+                for i, df in enumerate(results):
+                    df.to_csv(f, index=False, header=i == 0)
+                    done += len(df)
+                    _progress(done, total, started)
+                    if total <= chunk_rows:
+                        frames.append(df)
+        os.replace(tmp_path, output_path)
+        if frames:
+            print_statistics(pd.concat(frames, ignore_index=True))
+
+    print(f"\n✅ Dataset saved to: {output_path} ({time.perf_counter() - started:.1f}s)")
+    return total
+
+
+def main():
+    """Generate synthetic price dataset"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate the synthetic price training dataset')
+    parser.add_argument('--rows-per-breed', type=int, default=None,
+                        help='Rows for every breed folder (default: one row per train + val image)')
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', help='Output format')
+    parser.add_argument('--output', default=None, help=f'Default: {CSV_PATH} / {PARQUET_DIR}')
+    parser.add_argument('--seed', type=int, default=42, help='Base random seed')
+    parser.add_argument('--workers', type=int, default=None, help='Parallel processes (default: CPU count)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='Rows per chunk / Parquet file')
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Generating Synthetic Price Dataset (Metadata Only)")
+    print("=" * 60)
+
+    rows = generate_dataset(args.rows_per_breed, args.format, args.output, args.seed, args.workers, args.chunk_rows)
+    if not rows:
+        print("\n❌ No images found! Please ensure ml/data/train and ml/data/val contain images.")
+        return
+
+    print("   Columns: ['type', 'breed', 'age_months', 'weight', 'health_status', 'vaccinated', 'country', 'price']")
     print("\nYou can now train the price prediction model with:")
-    print("   python ml/train_price_model.py")
+    print("   python ml/train_price_model.py" + (f" --data {args.output or PARQUET_DIR}" if args.format == 'parquet' else ""))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,390 @@
+"""
+Parallel hyperparameter search with asynchronous successive halving (ASHA)
+
+Trials sample SEARCH_SPACE at random and run as separate processes, each with
+its own CPU-thread budget (and CPU set, where the OS supports affinity), so
+`--parallel` trials share the machine instead of fighting over every core.
+
+Each trial trains the image model (frozen backbone, like phase 1 of train.py)
+and reports val_accuracy after every epoch. Rungs sit at min_epochs * eta^k
+epochs: a trial reaching a rung continues only if it is in the top 1/eta of
+all trials that reached that rung so far, otherwise it is pruned. Decisions
+never wait for other trials, so slots are always busy.
+
+Everything is recorded in a local SQLite database
+(models/hparam_search/search.db): studies, trials with their parameters and
+status, and every per-epoch report. Studies can be resumed and inspected with
+--report. The best trial is written to models/hparam_search/best.json as
+config overrides, and --train-best runs train.py with them:
+
+    ML_CONFIG_OVERRIDES=models/hparam_search/best.json python train.py
+
+Trials decode images (not cached features), since IMG_SIZE and BATCH_SIZE are
+searched. On a single GPU, use --parallel 1.
+
+Usage:
+    python hparam_search.py --trials 30 --parallel 4
+    python hparam_search.py --study lr-sweep --space space.json --max-epochs 27 --eta 3
+    python hparam_search.py --report
+    python hparam_search.py --train-best
+"""
+import json
+import math
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+
+import config
+
+# {setting: (kind, ...)}: ('log', low, high), ('uniform', low, high), ('int', low, high), ('choice', [values])
+SEARCH_SPACE = {
+    'LEARNING_RATE': ('log', 1e-4, 3e-3),
+    'BATCH_SIZE': ('choice', [16, 32, 64]),
+    'DROPOUT_RATE': ('uniform', 0.2, 0.6),
+    'IMG_SIZE': ('choice', [160, 192, 224]),
+    'EARLY_STOPPING_PATIENCE': ('int', 3, 8),
+    'REDUCE_LR_PATIENCE': ('int', 2, 4),
+}
+METRIC = 'val_accuracy'  # Maximized
+DB_PATH = os.path.join(config.HPARAM_DIR, 'search.db')
+BEST_PATH = os.path.join(config.HPARAM_DIR, 'best.json')
+LOG_DIR = os.path.join(config.HPARAM_DIR, 'logs')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS studies (
+    name TEXT PRIMARY KEY, space TEXT, min_epochs INTEGER, max_epochs INTEGER, eta INTEGER, created_at REAL
+);
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, study TEXT, number INTEGER, params TEXT, status TEXT,
+    threads INTEGER, started_at REAL, finished_at REAL, epochs INTEGER, best_value REAL, error TEXT
+);
+CREATE TABLE IF NOT EXISTS reports (
+    trial_id INTEGER, epoch INTEGER, value REAL, metrics TEXT, reported_at REAL,
+    PRIMARY KEY (trial_id, epoch)
+);
+CREATE INDEX IF NOT EXISTS reports_epoch ON reports (epoch);
+"""
+
+
+def connect(path=DB_PATH):
+    """SQLite connection shared safely by the runner and its trial processes (WAL)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def sample_params(space, rng):
+    """
+    Draw one configuration
+
+    Args:
+        space: {setting: (kind, ...)} like SEARCH_SPACE
+        rng: random.Random
+
+    Returns:
+        dict: {setting: value}
+    """
+    params = {}
+    for name, spec in space.items():
+        kind = spec[0]
+        if kind == 'log':
+            params[name] = float(math.exp(rng.uniform(math.log(spec[1]), math.log(spec[2]))))
+        elif kind == 'uniform':
+            params[name] = rng.uniform(spec[1], spec[2])
+        elif kind == 'int':
+            params[name] = rng.randint(spec[1], spec[2])
+        elif kind == 'choice':
+            params[name] = rng.choice(spec[1])
+        else:
+            raise ValueError(f"Unknown search space kind '{kind}' for {name}")
+    return params
+
+
+def rungs(min_epochs, max_epochs, eta):
+    """Epochs at which pruning is decided: min_epochs * eta^k below max_epochs"""
+    result = []
+    epoch = min_epochs
+    while epoch < max_epochs:
+        result.append(epoch)
+        epoch *= eta
+    return result
+
+
+def should_prune(conn, study, trial_id, epoch, eta):
+    """
+    ASHA decision at a rung: keep the trial if its value is in the top 1/eta of
+    every trial of the study that has reached this epoch so far
+
+    Returns:
+        bool: True if the trial should stop
+    """
+    rows = conn.execute(
+        "SELECT r.trial_id, r.value FROM reports r JOIN trials t ON t.id = r.trial_id "
+        "WHERE t.study = ? AND r.epoch = ?",
+        (study, epoch)
+    ).fetchall()
+    values = sorted((row['value'] for row in rows), reverse=True)
+    own = next(row['value'] for row in rows if row['trial_id'] == trial_id)
+    keep = max(1, len(values) // eta)
+    return own < values[keep - 1]
+
+
+def _study(conn, name):
+    row = conn.execute("SELECT * FROM studies WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        raise KeyError(f"Unknown study '{name}'")
+    return row
+
+
+def run_trial(trial_id, db_path=DB_PATH, cpus=None):
+    """
+    Trial process: train with the trial's overrides, report every epoch, stop when pruned
+
+    Args:
+        trial_id: Row id in the trials table
+        db_path: Results database
+        cpus: CPU ids this trial may run on
+    """
+    conn = connect(db_path)
+    trial = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+    study = _study(conn, trial['study'])
+    decision_epochs = set(rungs(study['min_epochs'], study['max_epochs'], study['eta']))
+
+    # Thread budget and overrides must be in place before TensorFlow and the
+    # data/model modules (which bind settings as default arguments) are imported
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpus)
+    config.apply_overrides(json.loads(trial['params']))
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow import keras
+    tf.config.threading.set_intra_op_parallelism_threads(trial['threads'])
+    tf.config.threading.set_inter_op_parallelism_threads(min(2, trial['threads']))
+    random.seed(42)
+    np.random.seed(42)
+    tf.random.set_seed(42)
+
+    from data_loader import create_data_generators, get_class_weights
+    from model import create_model
+
+    class PruningCallback(keras.callbacks.Callback):
+        """Record METRIC per epoch and stop at a rung when ASHA says so"""
+
+        pruned = False
+
+        def on_epoch_end(self, epoch, logs=None):
+            logs = logs or {}
+            value = float(logs.get(METRIC, 0.0))
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (trial_id, epoch, value, metrics, reported_at) VALUES (?, ?, ?, ?, ?)",
+                (trial_id, epoch + 1, value, json.dumps({k: float(v) for k, v in logs.items()}), time.time())
+            )
+            conn.execute("UPDATE trials SET epochs = ?, best_value = MAX(COALESCE(best_value, ?), ?) WHERE id = ?",
+                         (epoch + 1, value, value, trial_id))
+            conn.commit()
+            if epoch + 1 in decision_epochs and should_prune(conn, trial['study'], trial_id, epoch + 1, study['eta']):
+                print(f"✂️  Pruned at epoch {epoch + 1} ({METRIC} {value:.4f})")
+                self.pruned = True
+                self.model.stop_training = True
+
+    train_ds, val_ds, class_names = create_data_generators()
+    model, _ = create_model(len(class_names))
+    pruning = PruningCallback()
+    model.fit(
+        train_ds,
+        epochs=study['max_epochs'],
+        validation_data=val_ds,
+        class_weight=get_class_weights(train_ds),
+        callbacks=[
+            keras.callbacks.EarlyStopping(monitor='val_loss', patience=config.EARLY_STOPPING_PATIENCE),
+            keras.callbacks.ReduceLROnPlateau(monitor='val_loss', factor=0.5,
+                                              patience=config.REDUCE_LR_PATIENCE, min_lr=1e-7),
+            pruning
+        ],
+        verbose=2
+    )
+    conn.execute("UPDATE trials SET status = ?, finished_at = ? WHERE id = ?",
+                 ('pruned' if pruning.pruned else 'complete', time.time(), trial_id))
+    conn.commit()
+
+
+def _cpu_slots(parallel):
+    """Split the usable CPUs into `parallel` disjoint sets"""
+    cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count() or 1))
+    per_trial = max(1, len(cpus) // parallel)
+    return [cpus[i * per_trial:(i + 1) * per_trial] or cpus for i in range(parallel)]
+
+
+def run_search(study='default', trials=20, parallel=2, min_epochs=1, max_epochs=27, eta=3,
+               space=None, seed=42, db_path=DB_PATH):
+    """
+    Run (or resume) a study until it has `trials` finished trials
+
+    Args:
+        study: Study name; resuming keeps its space and rung settings
+        trials: Total trials of the study
+        parallel: Concurrent trial processes
+        min_epochs: First rung
+        max_epochs: Epoch budget of a trial that is never pruned
+        eta: Keep the top 1/eta at each rung
+        space: Search space (default SEARCH_SPACE)
+        seed: Base seed for sampling (trial n uses seed + n)
+
+    Returns:
+        sqlite3.Row: The best trial, or None
+    """
+    conn = connect(db_path)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    row = conn.execute("SELECT * FROM studies WHERE name = ?", (study,)).fetchone()
+    if row is None:
+        conn.execute("INSERT INTO studies VALUES (?, ?, ?, ?, ?, ?)",
+                     (study, json.dumps(space or SEARCH_SPACE), min_epochs, max_epochs, eta, time.time()))
+        conn.commit()
+    row = _study(conn, study)
+    space = json.loads(row['space'])
+    # Trials left running by an interrupted search cannot be continued
+    conn.execute("UPDATE trials SET status = 'failed', error = 'interrupted' WHERE study = ? AND status = 'running'",
+                 (study,))
+    conn.commit()
+
+    slots = _cpu_slots(parallel)
+    free = list(range(parallel))
+    running = {}
+    print("=" * 50)
+    print(f"Hyperparameter search '{study}': {trials} trials, {parallel} in parallel, "
+          f"{len(slots[0])} CPU threads each")
+    print(f"Rungs at epochs {rungs(row['min_epochs'], row['max_epochs'], row['eta'])} "
+          f"(keep top 1/{row['eta']}), max {row['max_epochs']} epochs")
+    print("=" * 50)
+
+    while True:
+        started = conn.execute("SELECT COUNT(*) FROM trials WHERE study = ?", (study,)).fetchone()[0]
+        while free and started < trials:
+            slot = free.pop(0)
+            params = sample_params(space, random.Random(seed + started))
+            cursor = conn.execute(
+                "INSERT INTO trials (study, number, params, status, threads, started_at) VALUES (?, ?, ?, 'running', ?, ?)",
+                (study, started, json.dumps(params), len(slots[slot]), time.time())
+            )
+            conn.commit()
+            trial_id = cursor.lastrowid
+            log = open(os.path.join(LOG_DIR, f"{study}-{trial_id}.log"), 'w')
+            env = {**os.environ, 'OMP_NUM_THREADS': str(len(slots[slot])), 'TF_CPP_MIN_LOG_LEVEL': '2'}
+            env.pop(config.CONFIG_OVERRIDES_ENV, None)
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--worker', str(trial_id), '--db', db_path,
+                 '--cpus', ','.join(map(str, slots[slot]))],
+                cwd=config.BASE_DIR, stdout=log, stderr=subprocess.STDOUT, env=env
+            )
+            running[trial_id] = (process, slot, log)
+            print(f"🚀 Trial {trial_id}: {json.dumps(params)}")
+            started += 1
+
+        if not running:
+            break
+        time.sleep(2)
+        for trial_id, (process, slot, log) in list(running.items()):
+            if process.poll() is None:
+                continue
+            log.close()
+            free.append(slot)
+            del running[trial_id]
+            if process.returncode != 0:
+                conn.execute("UPDATE trials SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                             (time.time(), f"exit code {process.returncode} (see {log.name})", trial_id))
+                conn.commit()
+            trial = conn.execute("SELECT * FROM trials WHERE id = ?", (trial_id,)).fetchone()
+            value = f"{trial['best_value']:.4f}" if trial['best_value'] is not None else '-'
+            print(f"🏁 Trial {trial_id} {trial['status']} after {trial['epochs'] or 0} epochs ({METRIC} {value})")
+
+    return save_best(conn, study)
+
+
+def best_trial(conn, study):
+    """Best trial by METRIC, preferring trials that ran their full budget"""
+    return conn.execute(
+        "SELECT * FROM trials WHERE study = ? AND best_value IS NOT NULL AND status != 'failed' "
+        "ORDER BY status = 'complete' DESC, best_value DESC LIMIT 1",
+        (study,)
+    ).fetchone()
+
+
+def save_best(conn, study, path=BEST_PATH):
+    """Write the best trial's parameters as config overrides (for ML_CONFIG_OVERRIDES)"""
+    best = best_trial(conn, study)
+    if best is None:
+        print("❌ No successful trials")
+        return None
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(json.loads(best['params']), f, indent=2)
+    os.replace(tmp_path, path)
+    print(f"\n✅ Best trial {best['id']} ({METRIC} {best['best_value']:.4f}) saved to {path}")
+    print("   Full run: python hparam_search.py --train-best")
+    return best
+
+
+def print_report(conn, study, top=10):
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM trials WHERE study = ? GROUP BY status",
+                               (study,)).fetchall())
+    print("=" * 50)
+    print(f"Study '{study}': " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+    print("=" * 50)
+    rows = conn.execute(
+        "SELECT * FROM trials WHERE study = ? AND best_value IS NOT NULL ORDER BY best_value DESC LIMIT ?",
+        (study, top)
+    ).fetchall()
+    for row in rows:
+        print(f"  #{row['id']:<4} {row['best_value']:.4f}  {row['status']:<8} {row['epochs'] or 0:>3} ep  {row['params']}")
+
+
+def train_best(path=BEST_PATH):
+    """Run train.py with the saved winner applied; returns its exit code"""
+    if not os.path.exists(path):
+        print(f"❌ No winning config at {path}; run a search first")
+        return 1
+    env = {**os.environ, config.CONFIG_OVERRIDES_ENV: path}
+    return subprocess.call([sys.executable, os.path.join(config.BASE_DIR, 'train.py')], cwd=config.BASE_DIR, env=env)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter search with ASHA pruning')
+    parser.add_argument('--study', default='default', help='Study name (resumes an existing study)')
+    parser.add_argument('--trials', type=int, default=20, help='Total trials of the study')
+    parser.add_argument('--parallel', type=int, default=2, help='Concurrent trial processes')
+    parser.add_argument('--min-epochs', type=int, default=1, help='First rung')
+    parser.add_argument('--max-epochs', type=int, default=27, help='Epoch budget of an unpruned trial')
+    parser.add_argument('--eta', type=int, default=3, help='Keep the top 1/eta of trials at each rung')
+    parser.add_argument('--space', default=None, help='JSON file with a search space (default: SEARCH_SPACE)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', default=DB_PATH, help='Results database')
+    parser.add_argument('--report', action='store_true', help='Print the leaderboard and save the best config')
+    parser.add_argument('--train-best', action='store_true', help='Run train.py with the best config')
+    parser.add_argument('--worker', type=int, default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--cpus', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_trial(args.worker, args.db, [int(cpu) for cpu in args.cpus.split(',')] if args.cpus else None)
+    elif args.train_best:
+        sys.exit(train_best())
+    elif args.report:
+        conn = connect(args.db)
+        print_report(conn, args.study)
+        save_best(conn, args.study)
+    else:
+        space = None
+        if args.space:
+            with open(args.space, 'r') as f:
+                space = json.load(f)
+        run_search(args.study, args.trials, args.parallel, args.min_epochs, args.max_epochs, args.eta,
+                   space, args.seed, args.db)
+        print_report(connect(args.db), args.study)
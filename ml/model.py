@@ -1,6 +1,10 @@
 """
 Pet Breed Classification Model using MobileNetV3
 """
+import json
+import os
+import time
+
 import tensorflow as tf
 from tensorflow import keras
 from tensorflow.keras import layers, models
@@ -8,6 +12,79 @@ from tensorflow.keras.applications import MobileNetV3Small
 import config
 
 
+HEAD_LAYERS = 6  # BN, Dropout, Dense(512), BN, Dropout, Dense(num_classes)
+
+
+def augmentation_layers():
+    """
+    Fresh instances of the training-time augmentation layers
+    
+    Returns:
+        list: Keras preprocessing layers, applied in order
+    """
+    return [
+        layers.RandomFlip("horizontal"),
+        layers.RandomRotation(0.2),
+        layers.RandomZoom(0.2),
+        layers.RandomContrast(0.2),
+        layers.RandomBrightness(0.2),
+    ]
+
+
+def add_classification_head(x, num_classes):
+    """
+    Classification head on top of pooled backbone features
+    
+    Args:
+        x: Feature tensor (batch, feature_dim)
+        num_classes: Number of breed classes
+        
+    Returns:
+        Tensor: Softmax output
+    """
+    x = layers.BatchNormalization()(x)
+    x = layers.Dropout(config.DROPOUT_RATE)(x)
+    x = layers.Dense(512, activation='relu', kernel_regularizer=keras.regularizers.l2(0.001))(x)
+    x = layers.BatchNormalization()(x)
+    x = layers.Dropout(config.DROPOUT_RATE)(x)
+    
+    # Output layer
+    return layers.Dense(num_classes, activation='softmax')(x)
+
+
+def create_head_model(num_classes, feature_dim):
+    """
+    The classification head alone, for training on cached backbone features
+    
+    Its last HEAD_LAYERS layers match the last HEAD_LAYERS layers of
+    create_model, so weights can be copied with copy_head_weights.
+    
+    Args:
+        num_classes: Number of breed classes
+        feature_dim: Size of the pooled backbone features (1280 for EfficientNetB0)
+        
+    Returns:
+        keras.Model: Uncompiled head model
+    """
+    inputs = keras.Input(shape=(feature_dim,))
+    outputs = add_classification_head(inputs, num_classes)
+    return models.Model(inputs, outputs, name='pet_breed_classifier_head')
+
+
+def copy_head_weights(source, target):
+    """Copy the classification head weights between a full model and a head model (either way)"""
+    for src_layer, dst_layer in zip(source.layers[-HEAD_LAYERS:], target.layers[-HEAD_LAYERS:]):
+        dst_layer.set_weights(src_layer.get_weights())
+
+
+def get_backbone(model):
+    """Return the nested EfficientNet sub-model of a full classifier"""
+    for layer in model.layers:
+        if isinstance(layer, keras.Model):
+            return layer
+    raise ValueError("Model has no nested backbone")
+
+
 def create_model(num_classes):
     """
     Create EfficientNetB0 based model for pet breed classification
@@ -28,11 +105,9 @@ def create_model(num_classes):
     inputs = keras.Input(shape=(config.IMG_SIZE, config.IMG_SIZE, 3))
     
     # Data augmentation layers (active only during training)
-    x = layers.RandomFlip("horizontal")(inputs)
-    x = layers.RandomRotation(0.2)(x)
-    x = layers.RandomZoom(0.2)(x)
-    x = layers.RandomContrast(0.2)(x)
-    x = layers.RandomBrightness(0.2)(x)
+    x = inputs
+    for layer in augmentation_layers():
+        x = layer(x)
     
     # Load pre-trained EfficientNetB0
     # Note: EfficientNet expects [0, 255] inputs
@@ -63,14 +138,7 @@ def create_model(num_classes):
     x = base_model(x, training=False)
     
     # Custom classification head
-    x = layers.BatchNormalization()(x)
-    x = layers.Dropout(0.4)(x)
-    x = layers.Dense(512, activation='relu', kernel_regularizer=keras.regularizers.l2(0.001))(x)
-    x = layers.BatchNormalization()(x)
-    x = layers.Dropout(0.4)(x)
-    
-    # Output layer
-    outputs = layers.Dense(num_classes, activation='softmax')(x)
+    outputs = add_classification_head(x, num_classes)
     
     # Create model
     model = models.Model(inputs, outputs, name='pet_breed_classifier_effnet')
@@ -117,23 +185,70 @@ def unfreeze_and_fine_tune(model, base_model, num_classes):
     return model
 
 
-def get_callbacks():
+class TrainingEventsCallback(keras.callbacks.Callback):
+    """
+    Append structured progress as JSON lines for the backend job manager
+    
+    Events: train_begin, epoch_end (epoch, epochs, metrics, images_per_sec), train_end.
+    """
+    
+    def __init__(self, path, batch_size=config.BATCH_SIZE):
+        super().__init__()
+        self.path = path
+        self.batch_size = batch_size
+    
+    def _emit(self, event, **fields):
+        record = {'event': event, 'time': time.time(), 'job_id': os.environ.get('TRAINING_JOB_ID'), **fields}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record) + '\n')
+    
+    def on_train_begin(self, logs=None):
+        self._emit('train_begin', epochs=self.params.get('epochs'), steps=self.params.get('steps'))
+    
+    def on_epoch_begin(self, epoch, logs=None):
+        self.epoch_started = time.perf_counter()
+        self.steps = 0
+        self.train_seconds = 0.0
+    
+    def on_train_batch_end(self, batch, logs=None):
+        self.steps += 1
+        self.train_seconds = time.perf_counter() - self.epoch_started
+    
+    def on_epoch_end(self, epoch, logs=None):
+        metrics = {k: float(v) for k, v in (logs or {}).items()}
+        self._emit(
+            'epoch_end',
+            epoch=epoch + 1,
+            epochs=self.params.get('epochs'),
+            metrics=metrics,
+            images_per_sec=round(self.steps * self.batch_size / self.train_seconds, 1) if self.train_seconds else None
+        )
+    
+    def on_train_end(self, logs=None):
+        self._emit('train_end')
+
+
+def training_event_callbacks(batch_size=config.BATCH_SIZE):
+    """
+    [TrainingEventsCallback] when run by the backend job manager
+    (TRAINING_EVENTS_PATH is set), otherwise []
+    """
+    path = os.environ.get('TRAINING_EVENTS_PATH')
+    return [TrainingEventsCallback(path, batch_size)] if path else []
+
+
+def get_callbacks(run=None):
     """
     Create training callbacks
     
+    Args:
+        run: training_runs.TrainingRun; its staging directory receives the
+            best-epoch model (the served config.MODEL_PATH is never written here)
+    
     Returns:
         list: List of Keras callbacks
     """
     callbacks = [
-        # Save best model
-        keras.callbacks.ModelCheckpoint(
-            config.MODEL_PATH,
-            monitor='val_accuracy',
-            save_best_only=True,
-            mode='max',
-            verbose=1
-        ),
-        
         # Early stopping
         keras.callbacks.EarlyStopping(
             monitor='val_loss',
@@ -154,8 +269,19 @@ def get_callbacks():
         # TensorBoard logging
         keras.callbacks.TensorBoard(
             log_dir='logs',
-            histogram_freq=1
+            histogram_freq=config.TENSORBOARD_HISTOGRAM_FREQ
         )
-    ]
+    ] + training_event_callbacks()
+    
+    if run is not None:
+        # Save best model
+        callbacks.insert(0, keras.callbacks.ModelCheckpoint(
+            run.best_path,
+            monitor='val_accuracy',
+            save_best_only=True,
+            mode='max',
+            initial_value_threshold=run.best_metric('val_accuracy'),  # Continues across --resume
+            verbose=1
+        ))
     
     return callbacks
@@ -0,0 +1,261 @@
+"""
+Fast cold-load model format
+
+Stores a Keras model as:
+    <dir>/architecture.json   model.to_json()
+    <dir>/weights.bin         every weight tensor, raw, each starting on a page boundary
+    <dir>/weights_index.json  name, dtype, shape and byte offset of each tensor
+
+Loading rebuilds the graph from JSON and memory-maps weights.bin, so there is
+no zip archive to decompress. The file is read through the OS page cache,
+which is shared by every process on the host that loads the same model.
+(TensorFlow still copies each tensor into its own variable on set_weights.)
+
+Usage:
+    python model_export.py export              # served classifier -> its release's fast export
+    python model_export.py export --price      # price model -> config.FAST_PRICE_MODEL_DIR
+    python model_export.py benchmark           # cold-start time and RSS, .keras vs fast format
+"""
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import json
+import mmap
+import subprocess
+import sys
+import time
+
+import numpy as np
+import config
+
+FORMAT_VERSION = 1
+ARCHITECTURE_FILE = 'architecture.json'
+WEIGHTS_FILE = 'weights.bin'
+INDEX_FILE = 'weights_index.json'
+PAGE_SIZE = mmap.PAGESIZE
+
+
+def _align(offset, alignment=PAGE_SIZE):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def export_fast_format(model, out_dir):
+    """
+    Write a model in the fast cold-load format
+
+    Args:
+        model: Keras model
+        out_dir: Target directory (created if missing)
+
+    Returns:
+        str: out_dir
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    weights = model.get_weights()
+    names = [getattr(v, 'path', v.name) for v in model.weights]
+
+    entries = []
+    offset = 0
+    tmp_weights = os.path.join(out_dir, WEIGHTS_FILE + '.tmp')
+    with open(tmp_weights, 'wb') as f:
+        for name, array in zip(names, weights):
+            array = np.ascontiguousarray(array)
+            offset = _align(offset)
+            f.seek(offset)
+            f.write(array.tobytes())
+            entries.append({
+                'name': name,
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'offset': offset,
+                'nbytes': int(array.nbytes)
+            })
+            offset += array.nbytes
+        f.truncate(_align(offset))
+
+    index = {
+        'format_version': FORMAT_VERSION,
+        'page_size': PAGE_SIZE,
+        'total_bytes': _align(offset),
+        'weights': entries
+    }
+
+    # Write architecture and index next to the weights, then swap in atomically
+    tmp_arch = os.path.join(out_dir, ARCHITECTURE_FILE + '.tmp')
+    with open(tmp_arch, 'w') as f:
+        f.write(model.to_json())
+    tmp_index = os.path.join(out_dir, INDEX_FILE + '.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f, indent=2)
+
+    os.replace(tmp_weights, os.path.join(out_dir, WEIGHTS_FILE))
+    os.replace(tmp_arch, os.path.join(out_dir, ARCHITECTURE_FILE))
+    # Index last: its presence marks the export as complete
+    os.replace(tmp_index, os.path.join(out_dir, INDEX_FILE))
+
+    print(f"✓ Exported {len(entries)} tensors ({index['total_bytes'] / 1e6:.1f} MB) to {out_dir}")
+    return out_dir
+
+
+def refresh_fast_export(model, out_dir):
+    """
+    Re-export after a training run saved a new .keras file.
+    A failure only costs cold-start speed (loaders fall back to .keras), so it is not fatal.
+    """
+    try:
+        export_fast_format(model, out_dir)
+    except Exception as e:
+        print(f"⚠️  Fast format export failed, loaders will use the .keras file: {e}")
+
+
+def is_fast_format_current(fast_dir, source_path):
+    """True if fast_dir holds a complete export at least as new as source_path"""
+    index_path = os.path.join(fast_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return False
+    if source_path and os.path.exists(source_path):
+        return os.path.getmtime(index_path) >= os.path.getmtime(source_path)
+    return True
+
+
+def load_fast_format(fast_dir):
+    """
+    Load a model written by export_fast_format
+
+    Args:
+        fast_dir: Export directory
+
+    Returns:
+        keras.Model: Uncompiled model
+    """
+    from tensorflow import keras
+
+    with open(os.path.join(fast_dir, INDEX_FILE), 'r') as f:
+        index = json.load(f)
+    if index.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported fast model format version: {index.get('format_version')}")
+
+    with open(os.path.join(fast_dir, ARCHITECTURE_FILE), 'r') as f:
+        model = keras.models.model_from_json(f.read())
+
+    buffer = np.memmap(os.path.join(fast_dir, WEIGHTS_FILE), dtype=np.uint8, mode='r')
+    weights = [
+        np.ndarray(tuple(entry['shape']), dtype=np.dtype(entry['dtype']), buffer=buffer, offset=entry['offset'])
+        for entry in index['weights']
+    ]
+    if len(weights) != len(model.weights):
+        raise ValueError(
+            f"Weight count mismatch: file has {len(weights)}, architecture expects {len(model.weights)}"
+        )
+    model.set_weights(weights)
+    return model
+
+
+def export_command(price=False):
+    from tensorflow import keras
+
+    if price:
+        source, target = config.PRICE_MODEL_PATH, config.FAST_PRICE_MODEL_DIR
+    else:
+        from releases import current_release
+        release = current_release()
+        source, target = release.model_path, release.fast_dir
+
+    if not os.path.exists(source):
+        print(f"❌ Model not found at {source}")
+        sys.exit(1)
+
+    print(f"Loading {source}...")
+    model = keras.models.load_model(source, compile=False)
+    export_fast_format(model, target)
+
+
+def _peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / 1024 if sys.platform != 'darwin' else peak / (1024 * 1024)
+
+
+def _load_once(kind, path):
+    """Child-process entry point for the benchmark; prints one JSON line"""
+    started = time.perf_counter()
+    import tensorflow as tf  # noqa: F401  (import cost is part of cold start)
+    import_seconds = time.perf_counter() - started
+
+    t = time.perf_counter()
+    if kind == 'keras':
+        from tensorflow import keras
+        keras.models.load_model(path, compile=False)
+    else:
+        load_fast_format(path)
+    load_seconds = time.perf_counter() - t
+
+    print(json.dumps({
+        'kind': kind,
+        'import_seconds': import_seconds,
+        'load_seconds': load_seconds,
+        'total_seconds': time.perf_counter() - started,
+        'peak_rss_mb': _peak_rss_mb()
+    }))
+
+
+def benchmark_command(runs=3, price=False):
+    """Compare cold starts of the .keras loader and the fast format in fresh processes"""
+    if price:
+        keras_path, fast_dir = config.PRICE_MODEL_PATH, config.FAST_PRICE_MODEL_DIR
+    else:
+        from releases import current_release
+        release = current_release()
+        keras_path, fast_dir = release.model_path, release.fast_dir
+
+    if not is_fast_format_current(fast_dir, keras_path):
+        print(f"❌ No current fast export in {fast_dir}. Run: python model_export.py export{' --price' if price else ''}")
+        sys.exit(1)
+
+    print("=" * 60)
+    print("Cold-start benchmark")
+    print("=" * 60)
+    results = {}
+    for kind, path in (('keras', keras_path), ('fast', fast_dir)):
+        samples = []
+        for _ in range(runs):
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '_load', kind, path],
+                capture_output=True, text=True, cwd=config.BASE_DIR
+            )
+            if proc.returncode != 0:
+                print(proc.stderr)
+                sys.exit(1)
+            samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        results[kind] = samples
+        load = sorted(s['load_seconds'] for s in samples)[len(samples) // 2]
+        total = sorted(s['total_seconds'] for s in samples)[len(samples) // 2]
+        rss = max(s['peak_rss_mb'] for s in samples)
+        print(f"{kind:>6}: load {load:6.2f}s | total {total:6.2f}s | peak RSS {rss:7.1f} MB  (median of {runs})")
+
+    keras_load = sorted(s['load_seconds'] for s in results['keras'])[runs // 2]
+    fast_load = sorted(s['load_seconds'] for s in results['fast'])[runs // 2]
+    if fast_load > 0:
+        print(f"\nModel load speedup: {keras_load / fast_load:.1f}x")
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    if len(sys.argv) > 1 and sys.argv[1] == '_load':
+        _load_once(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description='Fast cold-load model format')
+    parser.add_argument('command', choices=['export', 'benchmark'])
+    parser.add_argument('--price', action='store_true', help='Use the price model instead of the classifier')
+    parser.add_argument('--runs', type=int, default=3, help='Benchmark runs per loader')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_command(price=args.price)
+    else:
+        benchmark_command(runs=args.runs, price=args.price)
@@ -0,0 +1,428 @@
+"""
+Near-duplicate detection across train/val/test with perceptual hashes
+
+Every image gets a 64-bit difference hash (dHash: a 9x8 grayscale thumbnail,
+one bit per horizontally adjacent pixel pair). Re-encoded, resized or lightly
+edited copies of a photo land within a few bits of each other.
+
+Lookups use multi-index hashing instead of comparing all pairs: the hash is
+cut into max_distance + 1 bands, and by the pigeonhole principle two hashes
+within max_distance bits agree exactly on at least one band. Only images
+sharing a band value are compared bit by bit.
+
+The index (ml/data/phash_index.json) is built incrementally: like the dataset
+manifests it is keyed by path, size and mtime, so only new or changed images
+are hashed (in a process pool). The backend checks uploads against it at
+ingest and adds accepted images to it. Every read-modify-write of the file
+holds phash_index.json.lock, so concurrent ingests and the CLI never drop each
+other's entries.
+
+Stdlib + PIL only (no TensorFlow, no config import at module level), so the
+backend can import it.
+
+Usage:
+    python near_duplicates.py                    # update the index, write the report
+    python near_duplicates.py --max-distance 6
+    python near_duplicates.py --fix              # remove redundant copies (moved to data/duplicates_backup)
+    python near_duplicates.py --fix --delete
+"""
+import json
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+from dataset_manifest import get_manifest
+
+INDEX_VERSION = 1
+HASH_BITS = 64
+DEFAULT_MAX_DISTANCE = 4
+SPLITS = ('train', 'val', 'test')
+# When a group spans splits, copies in the most held-out split are kept
+KEEP_PRIORITY = {'test': 0, 'val': 1, 'train': 2}
+MIN_PARALLEL = 64
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def default_index_path(data_dir):
+    return os.path.join(data_dir, 'phash_index.json')
+
+
+def dhash(img):
+    """
+    64-bit difference hash of a PIL image
+
+    Returns:
+        int: Hash (bit i set if pixel i is brighter than its right neighbour)
+    """
+    from PIL import Image
+    small = img.convert('L').resize((9, 8), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def hash_file(path):
+    """Process-pool job: dHash of one image file, None if unreadable"""
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return dhash(img)
+    except Exception:
+        return None
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class HashIndex:
+    """
+    Multi-index Hamming lookup over 64-bit hashes
+
+    Args:
+        max_distance: Largest Hamming distance that counts as a near-duplicate
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [HASH_BITS // bands + (1 if i < HASH_BITS % bands else 0) for i in range(bands)]
+        self._bands = []  # (shift, mask)
+        shift = HASH_BITS
+        for width in widths:
+            shift -= width
+            self._bands.append((shift, (1 << width) - 1))
+        self._tables = [{} for _ in self._bands]
+        self.keys = []
+        self.hashes = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, value):
+        idx = len(self.keys)
+        self.keys.append(key)
+        self.hashes.append(value)
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            table.setdefault((value >> shift) & mask, []).append(idx)
+
+    def query(self, value, exclude=None):
+        """
+        Returns:
+            list: (key, distance) of every indexed hash within max_distance, closest first
+        """
+        seen = set()
+        matches = []
+        for table, (shift, mask) in zip(self._tables, self._bands):
+            for idx in table.get((value >> shift) & mask, ()):
+                if idx in seen:
+                    continue
+                seen.add(idx)
+                key = self.keys[idx]
+                if key == exclude:
+                    continue
+                distance = hamming(value, self.hashes[idx])
+                if distance <= self.max_distance:
+                    matches.append((key, distance))
+        return sorted(matches, key=lambda match: match[1])
+
+
+def load_index(data_dir, index_path=None):
+    """Returns {relative path: [size, mtime_ns, hex hash]} ({} if missing or outdated)"""
+    index_path = index_path or default_index_path(data_dir)
+    if not os.path.exists(index_path):
+        return {}
+    try:
+        with open(index_path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data.get('files', {}) if data.get('version') == INDEX_VERSION else {}
+
+
+@contextmanager
+def index_lock(data_dir, index_path=None):
+    """Exclusive, cross-process lock (fcntl/msvcrt) around a load-update-save of the index"""
+    index_path = index_path or default_index_path(data_dir)
+    with open(f"{index_path}.lock", 'a+') as f:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after ~10 s; keep waiting
+                    pass
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def save_index(data_dir, files, index_path=None):
+    index_path = index_path or default_index_path(data_dir)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'hash': 'dhash64', 'updated_at': time.time(), 'files': files}, f)
+    os.replace(tmp_path, index_path)
+
+
+def update_index(data_dir, splits=SPLITS, workers=None, index_path=None):
+    """
+    Hash new or changed images of the splits and drop removed ones
+
+    Args:
+        data_dir: ml/data
+        splits: Split folders to index (missing ones are skipped)
+        workers: Process pool size (default: CPU count)
+
+    Returns:
+        tuple: ({relative path: [size, mtime_ns, hex hash]}, number of images hashed)
+    """
+    cached = load_index(data_dir, index_path)
+    files = {}
+    todo = []
+    for split in splits:
+        split_dir = os.path.join(data_dir, split)
+        if not os.path.isdir(split_dir):
+            continue
+        for path, _, size, mtime_ns in get_manifest(split_dir).iter_files():
+            rel = os.path.relpath(path, data_dir).replace(os.sep, '/')
+            entry = cached.get(rel)
+            if entry is not None and entry[0] == size and entry[1] == mtime_ns:
+                files[rel] = entry
+            else:
+                todo.append((rel, path, size, mtime_ns))
+
+    paths = [path for _, path, _, _ in todo]
+    if len(paths) >= MIN_PARALLEL:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            hashes = list(pool.map(hash_file, paths, chunksize=max(1, min(256, len(paths) // (workers * 8)))))
+    else:
+        hashes = [hash_file(path) for path in paths]
+    for (rel, _, size, mtime_ns), value in zip(todo, hashes):
+        if value is not None:  # Unreadable images are the integrity scanner's business
+            files[rel] = [size, mtime_ns, f"{value:016x}"]
+
+    # Hashing ran unlocked; entries added meanwhile (e.g. by an ingest) are kept if still current
+    with index_lock(data_dir, index_path):
+        latest = load_index(data_dir, index_path)
+        for rel, entry in latest.items():
+            if rel in files or entry == cached.get(rel):
+                continue
+            try:
+                stat = os.stat(os.path.join(data_dir, rel))
+            except OSError:
+                continue
+            if entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+                files[rel] = entry
+        if files != latest:
+            save_index(data_dir, files, index_path)
+    return files, len(todo)
+
+
+def build_lookup(files, max_distance=DEFAULT_MAX_DISTANCE):
+    index = HashIndex(max_distance)
+    for rel, (_, _, value) in files.items():
+        index.add(rel, int(value, 16))
+    return index
+
+
+def get_lookup(data_dir, max_distance=DEFAULT_MAX_DISTANCE, index_path=None):
+    """
+    HashIndex over the saved index file, cached per process until the file changes
+    (the backend calls this on every upload; nothing is rehashed here)
+    """
+    index_path = index_path or default_index_path(data_dir)
+    try:
+        mtime_ns = os.stat(index_path).st_mtime_ns
+    except FileNotFoundError:
+        return HashIndex(max_distance)
+    key = (index_path, max_distance)
+    with _cache_lock:
+        cached = _cache.get(key)
+        if cached is None or cached[0] != mtime_ns:
+            cached = (mtime_ns, build_lookup(load_index(data_dir, index_path), max_distance))
+            _cache[key] = cached
+        return cached[1]
+
+
+def add_to_index(data_dir, entries, index_path=None):
+    """
+    Record freshly written images without rehashing them
+
+    Args:
+        entries: (absolute path, int hash) pairs
+    """
+    added = {}
+    for path, value in entries:
+        stat = os.stat(path)
+        rel = os.path.relpath(path, data_dir).replace(os.sep, '/')
+        added[rel] = [stat.st_size, stat.st_mtime_ns, f"{value:016x}"]
+    with index_lock(data_dir, index_path):
+        files = load_index(data_dir, index_path)
+        files.update(added)
+        save_index(data_dir, files, index_path)
+
+
+def _class_of(rel):
+    """'train/Dog/Beagle/x.jpg' -> 'Dog/Beagle'"""
+    return '/'.join(rel.split('/')[1:-1])
+
+
+def find_groups(files, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Connected groups of near-duplicate images (union-find over index matches)
+
+    Returns:
+        list: Groups (lists of relative paths, sorted), largest first
+    """
+    index = build_lookup(files, max_distance)
+    parent = list(range(len(index)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    position = {key: i for i, key in enumerate(index.keys)}
+    for i, (key, value) in enumerate(zip(index.keys, index.hashes)):
+        for match, _ in index.query(value, exclude=key):
+            a, b = find(i), find(position[match])
+            if a != b:
+                parent[a] = b
+
+    groups = {}
+    for i, key in enumerate(index.keys):
+        groups.setdefault(find(i), []).append(key)
+    return sorted((sorted(group) for group in groups.values() if len(group) > 1), key=len, reverse=True)
+
+
+def describe_group(group, files):
+    splits = sorted({rel.split('/')[0] for rel in group})
+    classes = sorted({_class_of(rel) for rel in group})
+    return {
+        'images': group,
+        'splits': splits,
+        'classes': classes,
+        'leak': len(splits) > 1,
+        'label_conflict': len(classes) > 1,
+    }
+
+
+def plan_fix(group, files):
+    """
+    Which copies of a group to remove: keep one image, in the most held-out split
+    (so train loses the leaked copy), preferring the largest file
+
+    Returns:
+        list: Relative paths to remove ([] for label conflicts, which need a human)
+    """
+    if len({_class_of(rel) for rel in group}) > 1:
+        return []
+    keep = min(group, key=lambda rel: (KEEP_PRIORITY.get(rel.split('/')[0], 3), -files[rel][0], rel))
+    return [rel for rel in group if rel != keep]
+
+
+def write_report(data_dir, files, groups, path=None):
+    path = path or os.path.join(data_dir, 'near_duplicates_report.json')
+    described = [describe_group(group, files) for group in groups]
+    report = {
+        'generated_at': time.time(),
+        'images': len(files),
+        'groups': len(groups),
+        'redundant_images': sum(len(group) - 1 for group in groups),
+        'leaking_groups': sum(1 for group in described if group['leak']),
+        'label_conflicts': sum(1 for group in described if group['label_conflict']),
+        'duplicates': described
+    }
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    os.replace(tmp_path, path)
+    return report
+
+
+def remove_duplicates(data_dir, groups, files, delete=False, backup_dir=None):
+    """
+    Apply plan_fix to every group
+
+    Returns:
+        list: Relative paths that were removed (moved to backup_dir unless delete)
+    """
+    backup_dir = backup_dir or os.path.join(data_dir, 'duplicates_backup')
+    removed = []
+    for group in groups:
+        for rel in plan_fix(group, files):
+            path = os.path.join(data_dir, *rel.split('/'))
+            if not os.path.exists(path):
+                continue
+            if delete:
+                os.remove(path)
+            else:
+                target = os.path.join(backup_dir, *rel.split('/'))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.move(path, target)
+            removed.append(rel)
+    return removed
+
+
+if __name__ == '__main__':
+    import argparse
+    import config
+
+    parser = argparse.ArgumentParser(description='Find near-duplicate images across train/val/test')
+    parser.add_argument('--max-distance', type=int, default=DEFAULT_MAX_DISTANCE,
+                        help='Largest Hamming distance (of 64 bits) that counts as a duplicate')
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size (default: CPU count)')
+    parser.add_argument('--fix', action='store_true',
+                        help='Keep one copy per group (test > val > train), move the rest to data/duplicates_backup')
+    parser.add_argument('--delete', action='store_true', help='With --fix: delete instead of moving')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    files, hashed = update_index(config.DATA_DIR, workers=args.workers)
+    groups = find_groups(files, args.max_distance)
+    report = write_report(config.DATA_DIR, files, groups)
+
+    print("=" * 50)
+    print("Near-Duplicate Report")
+    print("=" * 50)
+    print(f"Images: {report['images']} | Hashed: {hashed} | {time.perf_counter() - started:.2f}s")
+    print(f"Duplicate groups: {report['groups']} ({report['redundant_images']} redundant images)")
+    print(f"Groups leaking across splits: {report['leaking_groups']}")
+    print(f"Groups with conflicting labels: {report['label_conflicts']}")
+    for group in report['duplicates'][:10]:
+        flags = ' [LEAK]' if group['leak'] else ''
+        flags += ' [LABEL CONFLICT]' if group['label_conflict'] else ''
+        print(f"  {len(group['images'])} images{flags}: {', '.join(group['images'][:3])}"
+              f"{' ...' if len(group['images']) > 3 else ''}")
+
+    if args.fix:
+        removed = remove_duplicates(config.DATA_DIR, groups, files, delete=args.delete)
+        print(f"\n🧹 {'Deleted' if args.delete else 'Moved to duplicates_backup'}: {len(removed)} images")
+        if report['label_conflicts']:
+            print("⚠️  Label conflicts were left in place; review them in near_duplicates_report.json")
+        update_index(config.DATA_DIR, workers=args.workers)
+    print(f"Report: {os.path.join(config.DATA_DIR, 'near_duplicates_report.json')}")
@@ -0,0 +1,260 @@
+"""
+Mixed-precision and XLA training modes
+
+bfloat16 mixed precision runs matmuls/convolutions in bfloat16 while keeping
+float32 variables, which roughly doubles throughput on CPUs with AVX512-BF16 or
+AMX (Xeon Cooper Lake / Sapphire Rapids and newer) and on Ampere+ GPUs.
+XLA (jit_compile) fuses each training step into one compiled program instead of
+dispatching Keras ops one by one.
+
+The model definition is not touched: a built or loaded float32 model is rebuilt
+from its config under the mixed policy (the softmax output layer stays float32
+for a numerically stable loss) and its weights are copied over. Models are cast
+back to float32 before saving, so served models are unaffected.
+
+Unsupported hardware falls back to float32 / no XLA with a message.
+"""
+import time
+
+import tensorflow as tf
+from tensorflow import keras
+import config
+
+FLOAT32 = 'float32'
+MIXED_BFLOAT16 = 'mixed_bfloat16'
+
+
+def _cpu_flags():
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def bf16_supported():
+    """
+    Returns:
+        tuple: (supported, reason)
+    """
+    gpus = tf.config.list_physical_devices('GPU')
+    if gpus:
+        capability = tf.config.experimental.get_device_details(gpus[0]).get('compute_capability', (0, 0))
+        if tuple(capability) >= (8, 0):
+            return True, f"GPU compute capability {capability[0]}.{capability[1]}"
+        return False, f"GPU compute capability {capability[0]}.{capability[1]} < 8.0"
+
+    flags = _cpu_flags()
+    native = sorted(flags & {'avx512_bf16', 'amx_bf16'})
+    if not native:
+        return False, "CPU has no AVX512-BF16/AMX (bfloat16 would be emulated and slower)"
+    try:
+        x = tf.ones((8, 8), dtype=tf.bfloat16)
+        tf.linalg.matmul(x, x).numpy()
+    except Exception as e:
+        return False, f"bfloat16 kernels unavailable: {e}"
+    return True, f"CPU {'/'.join(native)}"
+
+
+def xla_supported():
+    """
+    Returns:
+        tuple: (supported, reason)
+    """
+    try:
+        tf.function(lambda x: x * 2.0, jit_compile=True)(tf.ones(4)).numpy()
+    except Exception as e:
+        return False, f"XLA compilation failed: {e}"
+    return True, "XLA available"
+
+
+class TrainingModes:
+    """Resolved precision policy and XLA switch for one training run"""
+
+    def __init__(self, mixed_precision=config.MIXED_PRECISION, jit_compile=config.XLA_JIT):
+        self.policy = FLOAT32
+        self.jit_compile = False
+
+        if mixed_precision:
+            ok, reason = bf16_supported()
+            if ok:
+                self.policy = MIXED_BFLOAT16
+                print(f"✓ Mixed precision (bfloat16): {reason}")
+            else:
+                print(f"⚠️  Mixed precision unavailable, falling back to float32: {reason}")
+        if jit_compile:
+            ok, reason = xla_supported()
+            if ok:
+                self.jit_compile = True
+                print("✓ XLA jit_compile enabled")
+            else:
+                print(f"⚠️  XLA unavailable, falling back to standard execution: {reason}")
+
+        self.throughput = []
+
+    @property
+    def name(self):
+        return self.policy + ('+xla' if self.jit_compile else '')
+
+    def apply(self, model):
+        """
+        Prepare a compiled model for model.fit under these modes
+
+        Args:
+            model: Compiled Keras model
+
+        Returns:
+            keras.Model: The same model, or a recompiled rebuild under the mixed policy
+        """
+        if _model_policy(model) != self.policy:
+            model = cast_model(model, self.policy)
+        # Only force XLA on: leave Keras' own default (e.g. "auto" on GPU) alone otherwise
+        if self.jit_compile:
+            model.jit_compile = True
+        return model
+
+    def restore(self, model):
+        """Cast back to float32 for saving (no-op in float32 mode)"""
+        if _model_policy(model) != FLOAT32:
+            model = cast_model(model, FLOAT32)
+        return model
+
+    def callback(self, phase, batch_size=config.BATCH_SIZE):
+        """ThroughputCallback that records into self.throughput"""
+        return ThroughputCallback(self, phase, batch_size)
+
+
+def _model_policy(model):
+    """Policy of the first compute layer (input layers are always float32)"""
+    for layer in model.layers:
+        if not isinstance(layer, keras.layers.InputLayer):
+            policy = getattr(layer, 'dtype_policy', None)
+            return getattr(policy, 'name', FLOAT32)
+    return FLOAT32
+
+
+def _set_policy(layer_configs, policy, keep_float32):
+    for layer in layer_configs:
+        if layer['class_name'] == 'InputLayer':
+            continue
+        layer_config = layer['config']
+        if 'layers' in layer_config:
+            _set_policy(layer_config['layers'], policy, keep_float32)
+        name = layer_config.get('name', layer.get('name'))
+        layer_config['dtype'] = FLOAT32 if name in keep_float32 else policy
+
+
+def cast_model(model, policy):
+    """
+    Rebuild a functional model under a dtype policy and copy its weights
+
+    The output layer stays float32. If the model was compiled, the rebuild is
+    compiled from the model's compile config (optimizer, loss, metrics) and the
+    optimizer state (learning rate, step count, moment estimates) is carried over,
+    so a policy change mid-training (e.g. --resume with another --bf16 setting)
+    continues where the optimizer left off.
+
+    Args:
+        model: Functional Keras model (create_model architecture)
+        policy: FLOAT32 or MIXED_BFLOAT16
+
+    Returns:
+        keras.Model: Rebuilt model
+    """
+    model_config = model.get_config()
+    _set_policy(model_config['layers'], policy, keep_float32={model.layers[-1].name})
+    rebuilt = keras.Model.from_config(model_config)
+    rebuilt.set_weights(model.get_weights())
+
+    if getattr(model, 'optimizer', None) is not None:
+        compile_config = model.get_compile_config() if hasattr(model, 'get_compile_config') else None
+        if compile_config:
+            rebuilt.compile_from_config(compile_config)
+        else:
+            rebuilt.compile(
+                optimizer=model.optimizer.__class__.from_config(model.optimizer.get_config()),
+                loss='categorical_crossentropy',
+                metrics=['accuracy', keras.metrics.TopKCategoricalAccuracy(k=3, name='top_3_accuracy')]
+            )
+        _carry_optimizer_state(model.optimizer, rebuilt.optimizer, rebuilt.trainable_variables)
+    return rebuilt
+
+
+def _optimizer_variables(optimizer):
+    variables = optimizer.variables
+    return list(variables() if callable(variables) else variables)
+
+
+def _carry_optimizer_state(source, target, var_list):
+    """
+    Copy the current learning rate and all optimizer variables to a freshly compiled optimizer
+
+    Raises:
+        RuntimeError: If a trained optimizer's state does not line up with the rebuild
+    """
+    if not isinstance(getattr(target, '_learning_rate', None), keras.optimizers.schedules.LearningRateSchedule):
+        learning_rate = source.learning_rate
+        target.learning_rate = float(learning_rate.numpy() if hasattr(learning_rate, 'numpy') else learning_rate)
+    if int(source.iterations.numpy()) == 0:
+        return  # Never stepped: nothing learned to carry over
+    if not (getattr(target, 'built', False) or getattr(target, '_built', False)):
+        target.build(var_list)
+    source_vars, target_vars = _optimizer_variables(source), _optimizer_variables(target)
+    if len(source_vars) != len(target_vars) or any(
+            tuple(a.shape) != tuple(b.shape) for a, b in zip(source_vars, target_vars)):
+        raise RuntimeError(
+            "Cannot carry the optimizer state over to the rebuilt model; "
+            "resume with the same --bf16 setting as the checkpoint"
+        )
+    for source_var, target_var in zip(source_vars, target_vars):
+        target_var.assign(source_var.numpy())
+
+
+class ThroughputCallback(keras.callbacks.Callback):
+    """
+    Training images/sec per epoch (training steps incl. input waits, validation excluded)
+
+    Appends {'phase', 'mode', 'epochs', 'images_per_sec'} to TrainingModes.throughput
+    at the end of training.
+    """
+
+    def __init__(self, modes, phase, batch_size):
+        super().__init__()
+        self.modes = modes
+        self.phase = phase
+        self.batch_size = batch_size
+
+    def on_train_begin(self, logs=None):
+        self.epoch_rates = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.steps = 0
+        self.step_time = 0.0
+        self.epoch_started = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # Wall time up to the last training step, so input waits count but validation does not
+        self.step_time = time.perf_counter() - self.epoch_started
+        self.steps += 1
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.step_time > 0:
+            rate = self.steps * self.batch_size / self.step_time
+            self.epoch_rates.append(rate)
+            print(f"   [{self.modes.name}] {rate:.1f} images/sec")
+
+    def on_train_end(self, logs=None):
+        if not self.epoch_rates:
+            return
+        # The first epoch includes tracing/XLA compilation; report steady state when available
+        steady = self.epoch_rates[1:] or self.epoch_rates
+        self.modes.throughput.append({
+            'phase': self.phase,
+            'mode': self.modes.name,
+            'epochs': len(self.epoch_rates),
+            'images_per_sec': round(sum(steady) / len(steady), 1),
+            'first_epoch_images_per_sec': round(self.epoch_rates[0], 1)
+        })
@@ -8,8 +8,11 @@ import tensorflow as tf
 from tensorflow import keras
 import numpy as np
 import json
+import threading
 import config
 from data_loader import preprocess_image, preprocess_image_from_bytes
+from model_export import is_fast_format_current, load_fast_format
+from releases import current_release
 
 
 class PetClassifier:
@@ -17,69 +20,155 @@ class PetClassifier:
     Pet breed classifier with prediction capabilities
     """
     
-    def __init__(self, model_path=config.MODEL_PATH):
+    def __init__(self, release=None):
         """
         Initialize classifier
         
         Args:
-            model_path: Path to trained model
+            release: releases.Release to load (default: the served one)
         """
         self.model = None
         self.class_names = []
         self.pet_types = {}  # Maps breed to pet type (Dog/Cat)
         
+        # Few-shot prototype classes (see prototypes.py), reloaded when the file changes
+        self.prototype_head = None
+        self._prototypes_mtime = None
+        self._backbone = None
+        self._backbone_fingerprint = None
+        self._head = None
+        self._prototype_lock = threading.Lock()
+        
+        # Resolve the served release once: model, mapping and fast export all come from it
+        release = release or current_release()
+        
         # Load model if exists
-        if os.path.exists(model_path):
-            self.load_model(model_path)
+        if os.path.exists(release.model_path):
+            self.load_model(release)
         else:
-            print(f"Warning: Model not found at {model_path}")
+            print(f"Warning: Model not found at {release.model_path}")
             print("Please train the model first using: python ml/train.py")
     
-    def load_model(self, model_path):
+    def load_model(self, release):
         """
         Load trained model and class mapping
         
+        Both come from the same release directory, so the mapping always
+        belongs to the model (promotion swaps whole releases, see releases.py).
+        
         Args:
-            model_path: Path to model file
+            release: releases.Release to load
         """
-        print(f"Loading model from {model_path}...")
-        try:
-            # Try with safe_mode=False for cross-version compatibility
-            self.model = keras.models.load_model(model_path, compile=False, safe_mode=False)
-        except Exception as e:
-            print(f"Warning: Could not load with safe_mode=False: {e}")
-            # Fallback to default loading
-            self.model = keras.models.load_model(model_path, compile=False)
+        self.model = None
+        model_path = release.model_path
+
+        # Prefer the memory-mapped export when it is at least as new as the .keras file
+        if is_fast_format_current(release.fast_dir, model_path):
+            print(f"Loading model from {release.fast_dir} (fast format)...")
+            try:
+                self.model = load_fast_format(release.fast_dir)
+            except Exception as e:
+                print(f"Warning: Could not load fast format, using {model_path}: {e}")
+
+        if self.model is None:
+            print(f"Loading model from {model_path}...")
+            try:
+                # Try with safe_mode=False for cross-version compatibility
+                self.model = keras.models.load_model(model_path, compile=False, safe_mode=False)
+            except Exception as e:
+                print(f"Warning: Could not load with safe_mode=False: {e}")
+                # Fallback to default loading
+                self.model = keras.models.load_model(model_path, compile=False)
         
         # Load class mapping
-        mapping_path = os.path.join(config.MODEL_DIR, 'class_mapping.json')
+        mapping_path = release.class_mapping_path
         if os.path.exists(mapping_path):
             with open(mapping_path, 'r') as f:
                 mapping = json.load(f)
                 self.class_names = mapping['classes']
             
             # Parse pet types from class names
-            # Format: "Dog/Golden_Retriever" or similar nested structure
             for class_name in self.class_names:
-                parts = class_name.split('/')
-                if len(parts) >= 2:
-                    pet_type = parts[0]  # Dog or Cat
-                    breed = parts[1]  # Breed name
-                    self.pet_types[class_name] = {
-                        'type': pet_type,
-                        'breed': breed.replace('_', ' ')
-                    }
-                else:
-                    # Fallback if structure is different
-                    self.pet_types[class_name] = {
-                        'type': 'Unknown',
-                        'breed': class_name.replace('_', ' ')
-                    }
+                self._register_class(class_name)
             
             print(f"✓ Model loaded with {len(self.class_names)} classes")
         else:
             print(f"Warning: Class mapping not found at {mapping_path}")
     
+    def _register_class(self, class_name):
+        """
+        Parse pet type and breed from a class name
+        Format: "Dog/Golden_Retriever" or similar nested structure
+        """
+        parts = class_name.split('/')
+        if len(parts) >= 2:
+            pet_type = parts[0]  # Dog or Cat
+            breed = parts[1]  # Breed name
+            self.pet_types[class_name] = {
+                'type': pet_type,
+                'breed': breed.replace('_', ' ')
+            }
+        else:
+            # Fallback if structure is different
+            self.pet_types[class_name] = {
+                'type': 'Unknown',
+                'breed': class_name.replace('_', ' ')
+            }
+    
+    def _refresh_prototypes(self):
+        """Load prototype classes for breeds the softmax head doesn't know yet (one stat per call)"""
+        with self._prototype_lock:
+            self._load_prototypes_if_changed()
+    
+    def _load_prototypes_if_changed(self):
+        try:
+            mtime = os.stat(config.PROTOTYPES_PATH).st_mtime_ns
+        except FileNotFoundError:
+            self.prototype_head = None
+            self._prototypes_mtime = None
+            return
+        if mtime == self._prototypes_mtime:
+            return
+        self._prototypes_mtime = mtime
+        
+        from prototypes import PrototypeHead, load_prototypes
+        from embedding_store import backbone_fingerprint
+        from model import copy_head_weights, create_head_model, get_backbone
+        
+        if self._backbone is None:
+            self._backbone = get_backbone(self.model)
+            self._backbone_fingerprint = backbone_fingerprint(self._backbone)
+        
+        head = PrototypeHead(load_prototypes(), self.class_names, self._backbone_fingerprint)
+        if len(head) == 0:
+            self.prototype_head = None
+            return
+        
+        # Split the model into backbone + head so one pass yields both features and softmax
+        if self._head is None:
+            self._head = create_head_model(len(self.class_names), self._backbone.output_shape[-1])
+            copy_head_weights(self.model, self._head)
+        for class_name in head.class_names:
+            self._register_class(class_name)
+        self.prototype_head = head
+        print(f"✓ Prototype classes active: {head.class_names}")
+    
+    def _predict_probs(self, img_array, batch_size=None):
+        """
+        Forward pass, including prototype classes when any are active
+        
+        Returns:
+            tuple: (probabilities (N, num_classes), class names for the columns)
+        """
+        self._refresh_prototypes()
+        if self.prototype_head is None:
+            return self.model.predict(img_array, batch_size=batch_size, verbose=0), self.class_names
+        
+        feats = self._backbone.predict(img_array, batch_size=batch_size, verbose=0)
+        probs = self._head.predict(feats, batch_size=batch_size, verbose=0)
+        combined = self.prototype_head.combine(probs, feats)
+        return combined, self.class_names + self.prototype_head.class_names
+    
     def predict_from_path(self, image_path):
         """
         Predict breed from image file path
@@ -97,9 +186,9 @@ class PetClassifier:
         img = preprocess_image(image_path)
         
         # Make prediction
-        predictions = self.model.predict(img, verbose=0)
+        predictions, class_names = self._predict_probs(img)
         
-        return self._format_prediction(predictions[0])
+        return self._format_prediction(predictions[0], class_names)
     
     def predict_from_bytes(self, image_bytes):
         """
@@ -113,29 +202,79 @@ class PetClassifier:
         """
         if self.model is None:
             return self._get_stub_response()
-        
+
         # Preprocess image
         img = preprocess_image_from_bytes(image_bytes)
-        
+
+        return self.predict_from_array(img)
+
+    def predict_from_array(self, img_array, cancel_check=None):
+        """
+        Predict breed from an already preprocessed image batch
+
+        Args:
+            img_array: Array of shape (1, IMG_SIZE, IMG_SIZE, 3) in [0, 255]
+            cancel_check: Optional callable; if it returns True before or after
+                the forward pass, the work is abandoned and None is returned
+
+        Returns:
+            dict: Prediction results, or None if cancelled
+        """
+        if self.model is None:
+            return self._get_stub_response()
+
+        if cancel_check is not None and cancel_check():
+            return None
+
         # Make prediction
-        predictions = self.model.predict(img, verbose=0)
-        
-        return self._format_prediction(predictions[0])
-    
-    def _format_prediction(self, predictions):
+        predictions, class_names = self._predict_probs(img_array)
+
+        # Nobody is waiting for this result anymore; skip formatting
+        if cancel_check is not None and cancel_check():
+            return None
+
+        return self._format_prediction(predictions[0], class_names)
+
+    def predict_batch(self, img_arrays, batch_size=config.BATCH_SIZE):
+        """
+        Predict breeds for many preprocessed images in batched forward passes
+
+        Args:
+            img_arrays: Array of shape (N, IMG_SIZE, IMG_SIZE, 3), or a list of
+                (1, IMG_SIZE, IMG_SIZE, 3) arrays as returned by preprocess_image_from_bytes
+            batch_size: Images per forward pass
+
+        Returns:
+            list: One prediction dict per image, in input order
+        """
+        if isinstance(img_arrays, (list, tuple)):
+            if not img_arrays:
+                return []
+            img_arrays = np.concatenate(img_arrays, axis=0)
+
+        if self.model is None:
+            return [self._get_stub_response() for _ in range(len(img_arrays))]
+
+        predictions, class_names = self._predict_probs(img_arrays, batch_size=batch_size)
+        return [self._format_prediction(row, class_names) for row in predictions]
+
+    def _format_prediction(self, predictions, class_names=None):
         """
         Format prediction results
         
         Args:
             predictions: Raw model predictions (probabilities)
+            class_names: Column names of predictions (defaults to the model's classes)
             
         Returns:
             dict: Formatted prediction
         """
+        class_names = class_names or self.class_names
+        
         # Get top prediction
         top_idx = np.argmax(predictions)
         confidence = float(predictions[top_idx])
-        class_name = self.class_names[top_idx]
+        class_name = class_names[top_idx]
         
         # Parse pet type and breed
         pet_info = self.pet_types.get(class_name, {
@@ -154,7 +293,7 @@ class PetClassifier:
         top_3_indices = np.argsort(predictions)[-3:][::-1]
         top_3_predictions = [
             {
-                'breed': self.pet_types.get(self.class_names[idx], {}).get('breed', ''),
+                'breed': self.pet_types.get(class_names[idx], {}).get('breed', ''),
                 'confidence': float(predictions[idx])
             }
             for idx in top_3_indices
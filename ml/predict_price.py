@@ -9,6 +9,7 @@ import tensorflow as tf
 import numpy as np
 import joblib
 import config
+from model_export import is_fast_format_current, load_fast_format
 
 class PricePredictorSingleton:
     """Singleton pattern to load model once"""
@@ -24,8 +25,12 @@ class PricePredictorSingleton:
     def get_model(self):
         """Load model if not already loaded"""
         if self._model is None:
-            print(f"Loading price model from {config.PRICE_MODEL_PATH}...")
-            self._model = tf.keras.models.load_model(config.PRICE_MODEL_PATH)
+            if is_fast_format_current(config.FAST_PRICE_MODEL_DIR, config.PRICE_MODEL_PATH):
+                print(f"Loading price model from {config.FAST_PRICE_MODEL_DIR} (fast format)...")
+                self._model = load_fast_format(config.FAST_PRICE_MODEL_DIR)
+            else:
+                print(f"Loading price model from {config.PRICE_MODEL_PATH}...")
+                self._model = tf.keras.models.load_model(config.PRICE_MODEL_PATH)
             print("✓ Price model loaded")
         return self._model
     
@@ -37,28 +42,8 @@ class PricePredictorSingleton:
             print("✓ Encoders loaded")
         return self._encoders
 
-def predict_price(image_array=None, pet_type='Dog', breed='Unknown', age_months=12, weight_kg=10, health_status=1, vaccinated=1, country='USA'):
-    """
-    Predict price for a pet (Metadata Only)
-    
-    Args:
-        image_array: Ignored (kept for compatibility)
-        pet_type: 'Dog' or 'Cat'
-        breed: Breed name (e.g., 'Golden Retriever', 'Persian')
-        age_months: Age in months (2-60)
-        weight_kg: Weight in kg
-        health_status: 0 (normal), 1 (good), 2 (excellent)
-        vaccinated: 0 (no) or 1 (yes)
-        country: Country of origin (e.g., 'USA', 'Iran', 'Thailand')
-    
-    Returns:
-        float: Predicted price in $
-    """
-    # Get singleton instance
-    predictor = PricePredictorSingleton()
-    model = predictor.get_model()
-    encoders = predictor.get_encoders()
-    
+def _encode_metadata(encoders, pet_type, breed, age_months, weight_kg, health_status, vaccinated, country):
+    """Encode one row of metadata into the model's 7 normalized features"""
     type_encoder = encoders['type_encoder']
     breed_encoder = encoders['breed_encoder']
     country_encoder = encoders.get('country_encoder')
@@ -90,8 +75,7 @@ def predict_price(image_array=None, pet_type='Dog', breed='Unknown', age_months=
         print(f"Warning: Unknown country '{country}', using USA as fallback")
         country_encoded = country_encoder.transform(['USA'])[0] if 'USA' in country_encoder.classes_ else 0
     
-    # Prepare metadata with country (7 features)
-    metadata = np.array([[
+    return [
         type_encoded,
         breed_encoded,
         age_months / 60.0,      # Normalize to 0-1
@@ -99,16 +83,55 @@ def predict_price(image_array=None, pet_type='Dog', breed='Unknown', age_months=
         health_status / 2.0,    # Normalize to 0-1
         vaccinated,
         country_encoded
-    ]], dtype=np.float32)
+    ]
+
+def predict_price(image_array=None, pet_type='Dog', breed='Unknown', age_months=12, weight_kg=10, health_status=1, vaccinated=1, country='USA'):
+    """
+    Predict price for a pet (Metadata Only)
     
-    # Predict (Metadata only)
-    prediction = model.predict(metadata, verbose=0)
-    price = float(prediction[0][0])
+    Args:
+        image_array: Ignored (kept for compatibility)
+        pet_type: 'Dog' or 'Cat'
+        breed: Breed name (e.g., 'Golden Retriever', 'Persian')
+        age_months: Age in months (2-60)
+        weight_kg: Weight in kg
+        health_status: 0 (normal), 1 (good), 2 (excellent)
+        vaccinated: 0 (no) or 1 (yes)
+        country: Country of origin (e.g., 'USA', 'Iran', 'Thailand')
+    
+    Returns:
+        float: Predicted price in $
+    """
+    return predict_prices_batch([
+        (pet_type, breed, age_months, weight_kg, health_status, vaccinated, country)
+    ])[0]
+
+def predict_prices_batch(rows, batch_size=256):
+    """
+    Predict prices for many pets in one forward pass per batch
+    
+    Args:
+        rows: Iterable of (pet_type, breed, age_months, weight_kg, health_status, vaccinated, country)
+        batch_size: Rows per forward pass
     
-    # Ensure price is positive
-    price = max(0, price)
+    Returns:
+        list: Predicted prices in $, in input order
+    """
+    # Get singleton instance
+    predictor = PricePredictorSingleton()
+    model = predictor.get_model()
+    encoders = predictor.get_encoders()
+    
+    # Prepare metadata with country (7 features per row)
+    metadata = np.array([_encode_metadata(encoders, *row) for row in rows], dtype=np.float32)
+    if len(metadata) == 0:
+        return []
+    
+    # Predict (Metadata only)
+    prediction = model.predict(metadata, batch_size=batch_size, verbose=0)
     
-    return price
+    # Ensure prices are positive
+    return [max(0, float(p[0])) for p in prediction]
 
 def predict_price_from_path(image_path, pet_type, breed, age_months, weight_kg, health_status, vaccinated, country='USA'):
     """
@@ -0,0 +1,195 @@
+"""
+Training throughput profiler: input pipeline vs compute
+
+Keras runs the tf.data get_next inside the compiled train step, so one
+step's wall time is input wait plus compute and cannot be split directly.
+ProfilerCallback measures both sides separately once, after the first epoch
+(tracing and XLA compilation done):
+
+- compute: the train step timed on one batch held in memory (no decode);
+  weights, optimizer and metric state are restored afterwards
+- input pipeline: batches pulled from the training dataset alone
+
+and combines them with every step's wall time:
+
+    input wait per step = median step time - compute per step
+
+Per epoch it prints images/sec and the split; at the end of the fit it
+appends a summary to `results` (saved under 'profile' in the history JSON)
+with `bound` = 'input' (optimize decode/resize: shards, cache, IMG_SIZE) or
+'compute' (optimize the model step: --bf16, --xla, smaller backbone).
+
+Optionally records a TF profiler trace of a few steps of the first epoch
+(open logs/profile/ in TensorBoard's Profile tab).
+"""
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+import config
+
+# Share of the step spent waiting for input above which the pipeline is the bottleneck
+INPUT_BOUND_FRACTION = 0.25
+TRACE_START_STEP = 5
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+class ProfilerCallback(keras.callbacks.Callback):
+    """
+    Per-step timing with a one-off compute and pipeline probe
+
+    Args:
+        phase: Name recorded in the summary (e.g. 'phase2')
+        train_ds: The batched training dataset passed to fit
+        batch_size: Images per batch
+        results: List the summary dict is appended to
+        trace_steps: Steps to trace with the TF profiler (0 = off)
+    """
+
+    def __init__(self, phase, train_ds, batch_size, results, trace_steps=config.PROFILE_TRACE_STEPS):
+        super().__init__()
+        self.phase = phase
+        self.train_ds = train_ds
+        self.batch_size = batch_size
+        self.results = results
+        self.trace_steps = trace_steps
+        self.trace_dir = os.path.join('logs', 'profile', phase)
+
+    def on_train_begin(self, logs=None):
+        self.epochs = []
+        self.compute_seconds = None
+        self.pipeline_seconds = None
+        self.tracing = False
+        self.traced = False
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.step_times = []
+        self.gaps = []
+        self.last_end = None
+        self.epoch_started = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        now = time.perf_counter()
+        if self.last_end is not None:
+            self.gaps.append(now - self.last_end)
+        self.step_started = now
+        # Trace once, a few steps into the first epoch (past the one-off tracing/compilation step)
+        if self.trace_steps and not self.traced and not self.tracing and batch == TRACE_START_STEP:
+            tf.profiler.experimental.start(self.trace_dir)
+            self.tracing = True
+            self.trace_until = batch + self.trace_steps
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.last_end = time.perf_counter()
+        self.step_times.append(self.last_end - self.step_started)
+        if self.tracing and batch + 1 >= self.trace_until:
+            self._stop_trace()
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.tracing:
+            self._stop_trace()
+        if not self.step_times:
+            return
+        train_seconds = self.last_end - self.epoch_started
+        if self.compute_seconds is None and self.pipeline_seconds is None:
+            self._probe()
+        step = _percentile(self.step_times, 50)
+        entry = {
+            'epoch': epoch + 1,
+            'steps': len(self.step_times),
+            'images_per_sec': round(len(self.step_times) * self.batch_size / train_seconds, 1),
+            'step_seconds_p50': round(step, 4),
+            'step_seconds_p95': round(_percentile(self.step_times, 95), 4),
+            'host_overhead_seconds_per_step': round(_percentile(self.gaps, 50) or 0.0, 5)
+        }
+        self.epochs.append(entry)
+        split = ""
+        if self.compute_seconds is not None:
+            wait = max(0.0, step - self.compute_seconds)
+            split = f" | compute {self.compute_seconds * 1000:.0f} ms, input wait {wait * 1000:.0f} ms per step"
+        print(f"   [profile] {entry['images_per_sec']} images/sec, step p50 {step * 1000:.0f} ms{split}")
+
+    def on_train_end(self, logs=None):
+        if self.tracing:
+            self._stop_trace()
+        if not self.epochs:
+            return
+        # The first epoch includes tracing/XLA compilation; summarize steady state when available
+        steady = self.epochs[1:] or self.epochs
+        step = float(np.median([entry['step_seconds_p50'] for entry in steady]))
+        summary = {
+            'phase': self.phase,
+            'epochs': len(self.epochs),
+            'images_per_sec': round(float(np.mean([entry['images_per_sec'] for entry in steady])), 1),
+            'step_seconds': round(step, 4),
+            'compute_seconds_per_step': None,
+            'input_wait_seconds_per_step': None,
+            'input_wait_fraction': None,
+            'pipeline_images_per_sec': None,
+            'bound': 'unknown',
+            'trace_dir': self.trace_dir if self.traced else None,
+            'per_epoch': self.epochs
+        }
+        if self.pipeline_seconds:
+            summary['pipeline_images_per_sec'] = round(self.batch_size / self.pipeline_seconds, 1)
+        if self.compute_seconds is not None:
+            wait = max(0.0, step - self.compute_seconds)
+            summary['compute_seconds_per_step'] = round(self.compute_seconds, 4)
+            summary['input_wait_seconds_per_step'] = round(wait, 4)
+            summary['input_wait_fraction'] = round(wait / step, 3) if step else None
+            summary['bound'] = 'input' if step and wait / step > INPUT_BOUND_FRACTION else 'compute'
+        elif self.pipeline_seconds:
+            # No compute probe: the pipeline alone barely outpaces training -> input bound
+            summary['bound'] = 'input' if self.pipeline_seconds > 0.8 * step else 'compute'
+        self.results.append(summary)
+        wait = f"{summary['input_wait_fraction']:.0%}" if summary['input_wait_fraction'] is not None else "?"
+        print(f"   [profile] {self.phase}: {summary['bound']}-bound (input wait {wait} of each step, "
+              f"pipeline alone {summary['pipeline_images_per_sec']} images/sec)")
+
+    def _stop_trace(self):
+        tf.profiler.experimental.stop()
+        self.tracing = False
+        self.traced = True
+        print(f"   [profile] TF profiler trace written to {self.trace_dir}")
+
+    def _probe(self):
+        """Time the input pipeline alone, then the train step alone on an in-memory batch"""
+        started = time.perf_counter()
+        batches = 0
+        batch = None
+        for batch in self.train_ds.take(config.PROFILE_PIPELINE_BATCHES):
+            batches += 1
+        if batches:
+            self.pipeline_seconds = (time.perf_counter() - started) / batches
+        if batch is None or config.PROFILE_PROBE_STEPS <= 0:
+            return
+
+        optimizer_variables = self.model.optimizer.variables
+        if callable(optimizer_variables):
+            optimizer_variables = optimizer_variables()
+        variables = list(self.model.variables) + list(optimizer_variables)
+        saved = [v.numpy() for v in variables]
+        try:
+            iterator = iter(tf.data.Dataset.from_tensors(batch).repeat())
+            self.model.train_function(iterator)  # Warm-up outside the timing
+            started = time.perf_counter()
+            for _ in range(config.PROFILE_PROBE_STEPS):
+                outputs = self.model.train_function(iterator)
+            tf.nest.map_structure(lambda t: t.numpy() if hasattr(t, 'numpy') else t, outputs)
+            self.compute_seconds = (time.perf_counter() - started) / config.PROFILE_PROBE_STEPS
+        except Exception as e:
+            print(f"   [profile] Compute probe unavailable ({type(e).__name__}: {e}); reporting pipeline rate only")
+        finally:
+            for variable, value in zip(variables, saved):
+                variable.assign(value)
+            self.model.reset_metrics()
+
+
+def profiler_callbacks(enabled, phase, train_ds, results, batch_size=config.BATCH_SIZE):
+    """[ProfilerCallback] if enabled, otherwise []"""
+    return [ProfilerCallback(phase, train_ds, batch_size, results)] if enabled else []
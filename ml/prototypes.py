@@ -0,0 +1,221 @@
+"""
+Few-shot breed onboarding with class prototypes (nearest centroid)
+
+A new breed can be recognised as soon as its images are uploaded, without
+retraining: the served model's backbone embeds the images, and their
+L2-normalised mean (the prototype) is stored in models/prototypes.json.
+
+At prediction time PetClassifier scores the image's features against every
+prototype. For each prototype class the cosine similarity is turned into a
+probability with a per-class threshold calibrated on its own support images:
+
+    q_c = sigmoid((cos(f, prototype_c) - threshold_c) / PROTOTYPE_TEMPERATURE)
+
+The prototype classes get q (scaled down if they sum above 1) and the softmax
+classes share the remaining mass. Once the served model has the breed in its
+class mapping the prototype is ignored. The training scripts do not delete
+prototypes: a running backend keeps its loaded model until restarted and still
+needs them. `prune` removes them by hand once the backend serves the new model.
+Prototypes are tied to the backbone weights they were computed with.
+
+Usage:
+    python prototypes.py add Dog/Beagle path/to/images_dir
+    python prototypes.py list
+    python prototypes.py prune            # drop prototypes covered by the served model (after a backend restart)
+"""
+import os
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+
+import json
+import time
+
+import numpy as np
+import config
+
+SUPPORT_PERCENTILE = 10  # Threshold: 90% of support images score above it
+
+
+def load_prototypes(path=config.PROTOTYPES_PATH):
+    """
+    Returns:
+        dict: {'classes': {class_name: entry}} (empty if no file)
+    """
+    if not os.path.exists(path):
+        return {'classes': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def save_prototypes(data, path=config.PROTOTYPES_PATH):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _l2_normalize(x, axis=-1):
+    return x / np.maximum(np.linalg.norm(x, axis=axis, keepdims=True), 1e-12)
+
+
+def compute_prototype(backbone, image_arrays, batch_size=config.BATCH_SIZE):
+    """
+    Embed support images and build a prototype entry
+
+    Args:
+        backbone: Backbone of the served model
+        image_arrays: List of (1, IMG_SIZE, IMG_SIZE, 3) arrays (preprocess_image_from_bytes)
+        batch_size: Images per forward pass
+
+    Returns:
+        dict: centroid, threshold, support similarity stats
+    """
+    images = np.concatenate(image_arrays, axis=0)
+    feats = np.concatenate([
+        np.asarray(backbone(images[i:i + batch_size], training=False))
+        for i in range(0, len(images), batch_size)
+    ], axis=0)
+    feats = _l2_normalize(feats)
+    centroid = _l2_normalize(feats.mean(axis=0))
+    sims = feats @ centroid
+
+    if len(sims) >= 5:
+        threshold = float(np.percentile(sims, SUPPORT_PERCENTILE))
+    else:
+        threshold = float(sims.min()) - 0.05
+
+    return {
+        'centroid': centroid.astype(float).round(6).tolist(),
+        'threshold': threshold,
+        'support_size': int(len(sims)),
+        'support_mean_similarity': float(sims.mean()),
+        'created_at': time.time()
+    }
+
+
+def add_prototype(model, class_name, image_paths, path=config.PROTOTYPES_PATH):
+    """
+    Compute and store the prototype of a (new) class from image files
+
+    Args:
+        model: Served classifier (full model)
+        class_name: 'Type/Breed'
+        image_paths: Support image files
+
+    Returns:
+        dict: Stored entry (without the centroid)
+    """
+    from data_loader import preprocess_image_from_bytes
+    from embedding_store import backbone_fingerprint
+    from model import get_backbone
+
+    arrays = []
+    for image_path in image_paths:
+        try:
+            with open(image_path, 'rb') as f:
+                arrays.append(preprocess_image_from_bytes(f.read()))
+        except Exception as e:
+            print(f"Warning: Skipping unreadable image {image_path}: {e}")
+    if not arrays:
+        raise ValueError(f"No readable images for prototype '{class_name}'")
+
+    started = time.perf_counter()
+    backbone = get_backbone(model)
+    entry = compute_prototype(backbone, arrays)
+    entry['backbone'] = backbone_fingerprint(backbone)
+
+    data = load_prototypes(path)
+    data['classes'][class_name] = entry
+    save_prototypes(data, path)
+
+    summary = {k: v for k, v in entry.items() if k != 'centroid'}
+    print(f"✓ Prototype for {class_name} from {len(arrays)} images in {time.perf_counter() - started:.1f}s")
+    return summary
+
+
+def prune_prototypes(model_class_names, path=config.PROTOTYPES_PATH):
+    """Drop prototypes of classes the softmax head now covers; returns the removed names"""
+    data = load_prototypes(path)
+    removed = [name for name in data['classes'] if name in set(model_class_names)]
+    if removed:
+        for name in removed:
+            del data['classes'][name]
+        save_prototypes(data, path)
+        print(f"✓ Pruned prototypes now covered by the model: {removed}")
+    return removed
+
+
+class PrototypeHead:
+    """Active prototypes for one model: classes outside its softmax, same backbone"""
+
+    def __init__(self, data, model_class_names, fingerprint, temperature=config.PROTOTYPE_TEMPERATURE):
+        known = set(model_class_names)
+        entries = [
+            (name, entry) for name, entry in sorted(data.get('classes', {}).items())
+            if name not in known and entry.get('backbone') == fingerprint
+        ]
+        self.class_names = [name for name, _ in entries]
+        self.temperature = temperature
+        if entries:
+            self.centroids = np.array([entry['centroid'] for _, entry in entries], dtype=np.float32)
+            self.thresholds = np.array([entry['threshold'] for _, entry in entries], dtype=np.float32)
+
+    def __len__(self):
+        return len(self.class_names)
+
+    def combine(self, probs, feats):
+        """
+        Args:
+            probs: Softmax output (N, C)
+            feats: Pooled backbone features (N, D)
+
+        Returns:
+            np.ndarray: (N, C + P) probabilities over model classes then prototype classes
+        """
+        sims = _l2_normalize(np.asarray(feats, dtype=np.float32)) @ self.centroids.T
+        q = 1.0 / (1.0 + np.exp(-(sims - self.thresholds) / self.temperature))
+        total = q.sum(axis=1, keepdims=True)
+        q = q / np.maximum(total, 1.0)
+        known = np.asarray(probs) * (1.0 - q.sum(axis=1, keepdims=True))
+        return np.concatenate([known, q], axis=1)
+
+
+if __name__ == '__main__':
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'list'
+
+    if command == 'list':
+        data = load_prototypes()
+        print("=" * 50)
+        print(f"Prototypes ({config.PROTOTYPES_PATH})")
+        print("=" * 50)
+        for name, entry in sorted(data['classes'].items()):
+            print(f"  {name}: {entry['support_size']} images, threshold {entry['threshold']:.3f}, "
+                  f"backbone {entry['backbone']}")
+        if not data['classes']:
+            print("  (none)")
+
+    elif command == 'add' and len(sys.argv) >= 4:
+        from tensorflow import keras
+        from dataset_manifest import IMAGE_EXTENSIONS
+
+        class_name = sys.argv[2]
+        paths = []
+        for arg in sys.argv[3:]:
+            if os.path.isdir(arg):
+                paths.extend(os.path.join(arg, f) for f in sorted(os.listdir(arg))
+                             if f.lower().endswith(IMAGE_EXTENSIONS))
+            else:
+                paths.append(arg)
+        from releases import current_release
+        model = keras.models.load_model(current_release().model_path, compile=False)
+        print(add_prototype(model, class_name, paths))
+
+    elif command == 'prune':
+        from releases import current_release
+        with open(current_release().class_mapping_path, 'r') as f:
+            prune_prototypes(json.load(f)['classes'])
+
+    else:
+        print("Usage: python prototypes.py [list | add <Type/Breed> <images...> | prune]")
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""
+Served classifier releases and the pointer that selects one
+
+Promotion installs everything the classifier is served from into one
+directory per release:
+
+    releases/<run_id>/pet_classifier.keras
+    releases/<run_id>/class_mapping.json
+    releases/<run_id>/trained_files.json      (if the run keeps a baseline)
+    releases/<run_id>/pet_classifier_fast/    fast-format export
+
+The directory is built under a temporary name and renamed into place, then
+models/current.json ({"release": "<run_id>"}) is replaced with a single
+os.replace. A reader resolves the pointer once (current_release()) and takes
+every file from that directory, so it sees the old release or the new one,
+never a mix. Older releases are kept for rollback (KEEP_RELEASES).
+
+Without a pointer (a model trained before releases existed) the files directly
+under models/ are served.
+
+Usage:
+    python releases.py               # show the served release
+    python releases.py list          # releases on disk, newest first
+"""
+import json
+import os
+import shutil
+import time
+
+import config
+
+
+class Release:
+    """Paths of one served classifier: model, class mapping, training baseline and fast export"""
+
+    def __init__(self, directory, release_id=None):
+        self.directory = directory
+        self.release_id = release_id
+        self.model_path = os.path.join(directory, 'pet_classifier.keras')
+        self.class_mapping_path = os.path.join(directory, 'class_mapping.json')
+        self.trained_files_path = os.path.join(directory, 'trained_files.json')
+        self.fast_dir = os.path.join(directory, 'pet_classifier_fast')
+
+    @classmethod
+    def legacy(cls):
+        """The files directly under models/ (no release pointer yet)"""
+        release = cls(config.MODEL_DIR)
+        release.model_path = config.MODEL_PATH
+        release.trained_files_path = config.TRAINED_FILES_PATH
+        release.fast_dir = config.FAST_MODEL_DIR
+        return release
+
+    def exists(self):
+        return os.path.exists(self.model_path) and os.path.exists(self.class_mapping_path)
+
+    def __repr__(self):
+        return f"Release({self.release_id or 'legacy'}: {self.directory})"
+
+
+def current_release():
+    """
+    The release the pointer selects, resolved once
+
+    Returns:
+        Release: Falls back to Release.legacy() without a (valid) pointer
+    """
+    try:
+        with open(config.SERVED_POINTER_PATH, 'r') as f:
+            release_id = json.load(f)['release']
+    except (OSError, ValueError, KeyError):
+        return Release.legacy()
+    release = Release(os.path.join(config.RELEASES_DIR, release_id), release_id)
+    if not release.exists():
+        print(f"⚠️  {config.SERVED_POINTER_PATH} points to missing release {release_id}; serving models/ directly")
+        return Release.legacy()
+    return release
+
+
+def install_release(release_id, model_path, class_mapping_path, trained_files_path=None, model=None):
+    """
+    Build releases/<release_id>/ from staged files (not served until activate())
+
+    An existing complete release of the same id is reused as is, so promoting
+    an older run again is a pointer swap.
+
+    Args:
+        model: The model already in memory, for the fast export (loaded otherwise)
+
+    Returns:
+        Release
+    """
+    release = Release(os.path.join(config.RELEASES_DIR, release_id), release_id)
+    if release.exists():
+        return release
+
+    from model_export import refresh_fast_export
+    tmp_dir = f"{release.directory}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    staged = Release(tmp_dir, release_id)
+    os.makedirs(tmp_dir)
+    # copyfile, not copy2: a fresh mtime keeps the fast export current relative to the model
+    shutil.copyfile(model_path, staged.model_path)
+    shutil.copyfile(class_mapping_path, staged.class_mapping_path)
+    if trained_files_path and os.path.exists(trained_files_path):
+        shutil.copyfile(trained_files_path, staged.trained_files_path)
+    if model is None:
+        from tensorflow import keras
+        model = keras.models.load_model(staged.model_path)
+    refresh_fast_export(model, staged.fast_dir)
+    shutil.rmtree(release.directory, ignore_errors=True)  # Incomplete leftover of an earlier attempt
+    os.replace(tmp_dir, release.directory)
+    return release
+
+
+def activate(release):
+    """Serve a release: one atomic replace of the pointer file"""
+    tmp_path = f"{config.SERVED_POINTER_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'release': release.release_id, 'activated_at': time.time()}, f)
+    os.replace(tmp_path, config.SERVED_POINTER_PATH)
+
+
+def list_releases():
+    """Release ids on disk, newest first"""
+    if not os.path.isdir(config.RELEASES_DIR):
+        return []
+    releases = [Release(os.path.join(config.RELEASES_DIR, name), name)
+                for name in os.listdir(config.RELEASES_DIR) if not name.endswith('.tmp')]
+    releases = [release for release in releases if release.exists()]
+    return sorted(releases, key=lambda release: os.path.getmtime(release.directory), reverse=True)
+
+
+def cleanup_releases(keep=config.KEEP_RELEASES):
+    """Delete releases beyond the newest `keep`; the served one always stays"""
+    served = current_release().release_id
+    for release in [release for release in list_releases() if release.release_id != served][keep:]:
+        # A backend still holding an older release has it in memory already
+        shutil.rmtree(release.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'list':
+        served = current_release().release_id
+        for release in list_releases():
+            print(f"{'*' if release.release_id == served else ' '} {release.release_id}")
+    else:
+        print(current_release())
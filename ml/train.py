@@ -23,13 +23,33 @@ else:
 
 import config
 from data_loader import create_data_generators, get_class_weights
-from model import create_model, unfreeze_and_fine_tune, get_callbacks
+from dataset_manifest import get_manifest, training_snapshot
+from model import create_model, unfreeze_and_fine_tune, get_callbacks, get_backbone
+from precision import TrainingModes
+from training_runs import TrainingRun
+from releases import current_release
+from profiling import profiler_callbacks
 import json
+import shutil
+import sys
 
 
-def train():
+def train(use_embedding_cache=config.USE_EMBEDDING_CACHE, mixed_precision=config.MIXED_PRECISION,
+          jit_compile=config.XLA_JIT, seed=42, resume=None, promote=True, profile=config.PROFILE_TRAINING):
     """
     Main training function
+    
+    Args:
+        use_embedding_cache: Train phase 1 (frozen backbone) on cached features
+        mixed_precision: Train on images with a bfloat16 mixed-precision policy
+        jit_compile: XLA-compile the training step
+        seed: Base random seed (a resumed run keeps its own)
+        resume: 'latest' or a run id to continue from its last checkpoint
+        promote: Make the trained model the served one at the end
+        profile: Record input wait vs compute of the image-based fits
+    
+    Returns:
+        bool: False if training failed or the promotion gate rejected the model
     """
     print("=" * 50)
     print("Pet Breed Classification - Training")
@@ -48,69 +68,110 @@ def train():
         print("  └── Cat/")
         print("      ├── Persian/")
         print("      └── Siamese/")
-        return
+        return False
     
-    if not os.path.exists(config.VAL_DIR) or not os.listdir(config.VAL_DIR):
+    # With USE_SPLIT_MANIFEST validation images come from the training folder
+    if not config.USE_SPLIT_MANIFEST and (not os.path.exists(config.VAL_DIR) or not os.listdir(config.VAL_DIR)):
         print(f"ERROR: Validation data not found in {config.VAL_DIR}")
         print("Please create a validation set with the same structure as training data")
-        return
+        return False
     
     # Create data generators
     print("\n📁 Loading data...")
     train_gen, val_gen, class_names = create_data_generators()
+    trained_files = training_snapshot(get_manifest(config.TRAIN_DIR))  # Baseline for fine_tune.py --incremental
     
     # Get number of classes
     num_classes = len(class_names)
     print(f"\n✓ Detected {num_classes} classes (breeds)")
     
+    # Staging directory for checkpoints and the candidate model (the served model is untouched until promotion)
+    run = None
+    if resume:
+        run = TrainingRun.find('train', run_id=None if resume == 'latest' else resume)
+        if run is None:
+            print("⚠️  No unfinished training run to resume; starting a new one")
+        elif run.state['class_names'] != class_names:
+            print(f"ERROR: The classes on disk changed since run {run.run_id} started; it cannot be resumed")
+            return False
+    if run is None:
+        run = TrainingRun.create('train', seed, class_names)
+    resumed_model, resumed_phase, resumed_epoch, phase_done = run.resume_point()
+    run.seed_epoch(resumed_epoch)
+    
     # Calculate class weights for imbalanced data
     class_weights = get_class_weights(train_gen)
-    
-    # Save class names for inference
-    class_mapping = {
-        'classes': class_names,
-        'num_classes': num_classes
-    }
-    with open(os.path.join(config.MODEL_DIR, 'class_mapping.json'), 'w') as f:
-        json.dump(class_mapping, f, indent=2)
-    print(f"✓ Saved class mapping to {config.MODEL_DIR}/class_mapping.json")
-    
-    # Create model
-    print("\n🏗️  Building model...")
-    model, base_model = create_model(num_classes)
-    model.summary()
+    modes = TrainingModes(mixed_precision, jit_compile)
+    profile_results = []
     
     # Get callbacks
-    callbacks = get_callbacks()
+    callbacks = get_callbacks(run)
     
     # Phase 1: Train only classification head
     print("\n" + "=" * 50)
     print("Phase 1: Training Classification Head")
     print("=" * 50)
     
-    history = model.fit(
-        train_gen,
-        epochs=config.EPOCHS,
-        validation_data=val_gen,
-        class_weight=class_weights,
-        callbacks=callbacks,
-        verbose=1
-    )
+    if resumed_phase == 'phase2' or (resumed_phase == 'phase1' and phase_done):
+        print("✓ Done in the resumed run")
+        model = resumed_model
+        phase1_epochs = resumed_epoch if resumed_phase == 'phase1' else len(run.state['logs'].get('phase1', []))
+    elif use_embedding_cache:
+        # Backbone is frozen, so the head can learn from cached features (cheap: restarted on resume)
+        print("\n🏗️  Building model...")
+        model, base_model = create_model(num_classes)
+        model.summary()
+        from embedding_store import fit_head_on_cached_features
+        history = fit_head_on_cached_features(
+            model,
+            epochs=config.EPOCHS,
+            learning_rate=config.LEARNING_RATE,
+            class_weights=class_weights
+        )
+        phase1_epochs = len(history.history['loss'])
+        run.complete_phase('phase1', model, phase1_epochs, history)
+    else:
+        if resumed_phase == 'phase1':
+            model = resumed_model
+        else:
+            print("\n🏗️  Building model...")
+            model, base_model = create_model(num_classes)
+            model.summary()
+        model = modes.apply(model)
+        history = model.fit(
+            train_gen,
+            epochs=config.EPOCHS,
+            validation_data=val_gen,
+            class_weight=class_weights,
+            callbacks=callbacks + [modes.callback('phase1'), run.callback('phase1')]
+                      + profiler_callbacks(profile, 'phase1', train_gen, profile_results),
+            initial_epoch=resumed_epoch if resumed_phase == 'phase1' else 0,
+            verbose=1
+        )
+        phase1_epochs = len(run.state['logs'].get('phase1', []))
+        run.complete_phase('phase1', model, phase1_epochs)
     
     # Phase 2: Fine-tune entire model
     print("\n" + "=" * 50)
     print("Phase 2: Fine-Tuning Full Model")
     print("=" * 50)
     
-    model = unfreeze_and_fine_tune(model, base_model, num_classes)
+    if resumed_phase == 'phase2':
+        # Already unfrozen and compiled, with its optimizer state
+        initial_epoch = resumed_epoch
+    else:
+        model = unfreeze_and_fine_tune(model, get_backbone(model), num_classes)
+        initial_epoch = phase1_epochs
+    model = modes.apply(model)
     
-    history_fine = model.fit(
+    model.fit(
         train_gen,
         epochs=config.FINE_TUNE_EPOCHS,
         validation_data=val_gen,
         class_weight=class_weights,
-        callbacks=callbacks,
-        initial_epoch=len(history.history['loss']),
+        callbacks=callbacks + [modes.callback('phase2'), run.callback('phase2')]
+                  + profiler_callbacks(profile, 'phase2', train_gen, profile_results),
+        initial_epoch=initial_epoch,
         verbose=1
     )
     
@@ -123,35 +184,65 @@ def train():
     print(f"\n✓ Final Validation Accuracy: {results[1]:.4f}")
     print(f"✓ Final Validation Top-3 Accuracy: {results[2]:.4f}")
     
-    # Save final model
-    model.save(config.MODEL_PATH)
-    print(f"\n✅ Model saved to {config.MODEL_PATH}")
+    # Stage the final model (always float32), then promote it to serving
+    model = modes.restore(model)
+    run.finish(model, class_names, trained_files)
+    promoted = promote and run.promote(model)
     
-    # Save training history
+    # Save training history (accumulated across resumes)
     history_dict = {
-        'phase1': {k: [float(v) for v in vals] for k, vals in history.history.items()},
-        'phase2': {k: [float(v) for v in vals] for k, vals in history_fine.history.items()}
+        'run_id': run.run_id,
+        'phase1': run.history('phase1'),
+        'phase2': run.history('phase2'),
+        'throughput': modes.throughput,
+        'profile': profile_results
     }
-    with open(os.path.join(config.MODEL_DIR, 'training_history.json'), 'w') as f:
+    with open(os.path.join(run.directory, 'training_history.json'), 'w') as f:
         json.dump(history_dict, f, indent=2)
-    print(f"✓ Training history saved to {config.MODEL_DIR}/training_history.json")
+    if promoted:
+        shutil.copyfile(os.path.join(run.directory, 'training_history.json'),
+                        os.path.join(config.MODEL_DIR, 'training_history.json'))
+    print(f"✓ Training history saved to {run.directory}/training_history.json")
     
     print("\n" + "=" * 50)
     print("Training Complete! 🎉")
     print("=" * 50)
-    print(f"\nYour model is ready to use at: {config.MODEL_PATH}")
-    print("You can now restart the backend to use the trained model for predictions.")
+    if promoted:
+        print(f"\nYour model is ready to use at: {current_release().model_path}")
+        print("You can now restart the backend to use the trained model for predictions.")
+    else:
+        print(f"\nCandidate staged at {run.model_path} (not served)")
+        print(f"Promote it with: python training_runs.py promote {run.run_id}")
+    return promoted or not promote
 
 
 if __name__ == '__main__':
     # Set random seeds for reproducibility
+    import argparse
     import numpy as np
     import random
     
+    parser = argparse.ArgumentParser(description='Train the pet breed classifier')
+    parser.add_argument('--no-cache', action='store_true', help='Run phase 1 on images instead of cached features')
+    parser.add_argument('--bf16', action=argparse.BooleanOptionalAction, default=config.MIXED_PRECISION,
+                        help='bfloat16 mixed precision (falls back to float32 if unsupported)')
+    parser.add_argument('--xla', action=argparse.BooleanOptionalAction, default=config.XLA_JIT,
+                        help='XLA jit_compile for model.fit (falls back if unavailable)')
+    parser.add_argument('--profile', action=argparse.BooleanOptionalAction, default=config.PROFILE_TRAINING,
+                        help='Measure input-pipeline wait vs compute per step (see profiling.py)')
+    parser.add_argument('--resume', nargs='?', const='latest', default=None, metavar='RUN_ID',
+                        help='Continue the latest (or the given) unfinished run from its last checkpoint')
+    parser.add_argument('--no-promote', action='store_true',
+                        help='Leave the trained model staged in models/runs/ instead of serving it')
+    args = parser.parse_args()
+    
     SEED = 42
     random.seed(SEED)
     np.random.seed(SEED)
     tf.random.set_seed(SEED)
     
     # Run training
-    train()
+    ok = train(use_embedding_cache=config.USE_EMBEDDING_CACHE and not args.no_cache,
+               mixed_precision=args.bf16, jit_compile=args.xla, seed=SEED, resume=args.resume,
+               promote=not args.no_promote, profile=args.profile)
+    sys.exit(0 if ok else 1)
@@ -27,18 +27,28 @@ if gpus:
 else:
     print("⚠️  No GPU detected - training will use CPU")
 
-def load_and_prepare_data():
-    """Load CSV and prepare features"""
+def load_and_prepare_data(data_path=None):
+    """
+    Load the dataset and prepare features
+
+    Args:
+        data_path: CSV file, or a Parquet file/directory (generate_price_dataset.py --format parquet)
+    """
     print("\n📁 Loading dataset...")
-    csv_path = os.path.join(config.DATA_DIR, 'price_training_data.csv')
+    data_path = data_path or os.path.join(config.DATA_DIR, 'price_training_data.csv')
     
-    if not os.path.exists(csv_path):
+    if not os.path.exists(data_path):
         raise FileNotFoundError(
-            f"Dataset not found at {csv_path}.\n"
+            f"Dataset not found at {data_path}.\n"
             "Please run: python ml/generate_price_dataset.py"
         )
     
-    df = pd.read_csv(csv_path)
+    if os.path.isdir(data_path) or data_path.endswith('.parquet'):
+        df = pd.read_parquet(data_path)
+        # Categorical columns from Parquet -> plain strings for the encoders
+        df = df.astype({col: str for col in ('type', 'breed', 'country')})
+    else:
+        df = pd.read_csv(data_path)
     print(f"Loaded {len(df)} samples")
     
     # Encode categorical features
@@ -128,14 +138,19 @@ def create_dataset(df, batch_size=32, shuffle=True):
     
     return dataset
 
-def train():
-    """Main training function"""
+def train(data_path=None):
+    """
+    Main training function
+
+    Args:
+        data_path: Dataset to train on (default: ml/data/price_training_data.csv)
+    """
     print("=" * 60)
     print("Price Prediction Model (Metadata Only) - Training")
     print("=" * 60)
     
     # Load data
-    df, type_encoder, breed_encoder, country_encoder = load_and_prepare_data()
+    df, type_encoder, breed_encoder, country_encoder = load_and_prepare_data(data_path)
     
     # Split data
     train_df, val_df = train_test_split(df, test_size=0.2, random_state=42)
@@ -215,6 +230,12 @@ def train():
     print("\nYou can now use the model for predictions!")
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Train the price prediction model')
+    parser.add_argument('--data', default=None,
+                        help='CSV or Parquet dataset (default: ml/data/price_training_data.csv)')
+    args = parser.parse_args()
+    
     # Set random seeds
     import random
     SEED = 42
@@ -222,4 +243,4 @@ if __name__ == '__main__':
     np.random.seed(SEED)
     tf.random.set_seed(SEED)
     
-    train()
+    train(args.data)
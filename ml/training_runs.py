@@ -0,0 +1,306 @@
+"""
+Per-run staging area, crash-safe checkpoints and atomic promotion
+
+Every training script run gets its own directory under models/runs/:
+
+    runs/<script>-<timestamp>/state.json        status, seed, class names, last checkpoint position, epoch logs
+    runs/<script>-<timestamp>/checkpoint.keras  latest epoch: weights + optimizer state
+    runs/<script>-<timestamp>/best.keras        best epoch by val_accuracy (ModelCheckpoint)
+    runs/<script>-<timestamp>/model.keras       final float32 candidate, with class_mapping.json
+                                                and trained_files.json next to it
+
+Nothing under models/ that the API serves is touched while training. A run
+checkpoints at the end of every epoch (write to a temp file, then rename), so
+a crash loses at most the current epoch; `--resume` (train.py, fine_tune.py,
+add_breed.py) continues at the start of the interrupted epoch, with the saved
+optimizer state and epoch counter (positions within an epoch are not
+recorded). The RNG is re-seeded from (seed, epoch) at each epoch start, so a
+resumed epoch draws the same augmentation/dropout randomness as an
+uninterrupted one.
+
+Promotion is a separate step: the candidate is installed as a release
+directory under models/releases/ and served by swapping one pointer file
+(releases.py), so a loader sees either the old or the new model with its own
+class mapping. The training scripts promote at the end unless --no-promote is
+given; `python training_runs.py promote <run>` promotes a staged run later.
+With PROMOTION_GATE (or `promote --gate`) the candidate must first pass the
+evaluation budgets of evaluate.py against the served model.
+
+Usage:
+    python training_runs.py list
+    python training_runs.py promote train-20250101-120000
+    python training_runs.py promote --gate
+"""
+import json
+import os
+import shutil
+import time
+
+from tensorflow import keras
+import config
+from dataset_manifest import save_training_snapshot
+from releases import activate, cleanup_releases, install_release
+
+RUNNING = 'running'
+TRAINED = 'trained'
+PROMOTED = 'promoted'
+
+
+def _write_json_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class TrainingRun:
+    """Staging directory and state of one training script run"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.run_id = os.path.basename(directory)
+        self.state_path = os.path.join(directory, 'state.json')
+        self.checkpoint_path = os.path.join(directory, 'checkpoint.keras')
+        self.best_path = os.path.join(directory, 'best.keras')
+        self.model_path = os.path.join(directory, 'model.keras')
+        self.class_mapping_path = os.path.join(directory, 'class_mapping.json')
+        self.trained_files_path = os.path.join(directory, 'trained_files.json')
+        with open(self.state_path, 'r') as f:
+            self.state = json.load(f)
+
+    @classmethod
+    def create(cls, script, seed, class_names, runs_dir=config.RUNS_DIR):
+        """
+        Start a new run
+
+        Args:
+            script: Training script name without .py (e.g. 'train')
+            seed: Base random seed of the run
+            class_names: Class order of the run's data (checked on resume)
+        """
+        cleanup_runs(runs_dir)
+        run_id = f"{script}-{time.strftime('%Y%m%d-%H%M%S')}"
+        directory = os.path.join(runs_dir, run_id)
+        suffix = 1
+        while os.path.exists(directory):
+            suffix += 1
+            directory = os.path.join(runs_dir, f"{run_id}-{suffix}")
+        os.makedirs(directory)
+        _write_json_atomic(os.path.join(directory, 'state.json'), {
+            'script': script,
+            'status': RUNNING,
+            'seed': seed,
+            'class_names': class_names,
+            'created_at': time.time(),
+            'checkpoint': None,
+            'completed_phases': [],
+            'logs': {}
+        })
+        print(f"📦 Training run {os.path.basename(directory)} (staging: {directory})")
+        return cls(directory)
+
+    @classmethod
+    def find(cls, script=None, run_id=None, status=RUNNING, runs_dir=config.RUNS_DIR):
+        """
+        The newest run matching script/status, or the run with this id
+
+        Returns:
+            TrainingRun or None
+        """
+        if run_id:
+            directory = os.path.join(runs_dir, run_id)
+            return cls(directory) if os.path.exists(os.path.join(directory, 'state.json')) else None
+        for run in list_runs(runs_dir):
+            if (script is None or run.state['script'] == script) and (status is None or run.state['status'] == status):
+                return run
+        return None
+
+    def save_state(self):
+        _write_json_atomic(self.state_path, self.state)
+
+    def seed_epoch(self, epoch):
+        """Deterministic RNG state for an epoch, the same whether or not the run was resumed"""
+        keras.utils.set_random_seed(self.state['seed'] + epoch)
+
+    def checkpoint(self, model, phase, epoch, logs=None):
+        """
+        Save weights + optimizer state after an epoch, then record the position
+
+        Args:
+            model: Compiled model being trained
+            phase: Phase name (e.g. 'phase1')
+            epoch: Epochs finished (absolute, as passed to initial_epoch on resume)
+            logs: Epoch metrics
+        """
+        tmp_path = os.path.join(self.directory, f"checkpoint.{os.getpid()}.tmp.keras")
+        model.save(tmp_path)
+        os.replace(tmp_path, self.checkpoint_path)
+        if logs is not None:
+            self.state['logs'].setdefault(phase, []).append({k: float(v) for k, v in logs.items()})
+        self.state['checkpoint'] = {
+            'phase': phase,
+            'epoch': epoch,
+            'saved_at': time.time()
+        }
+        self.save_state()
+
+    def complete_phase(self, phase, model, epoch, history=None):
+        """
+        Checkpoint the end of a phase
+
+        Args:
+            epoch: Epochs finished (absolute)
+            history: Keras History of a phase that did not checkpoint per epoch
+                (e.g. head training on cached features), to keep its logs
+        """
+        if history is not None and phase not in self.state['logs']:
+            values = history.history
+            self.state['logs'][phase] = [
+                {k: float(v[i]) for k, v in values.items()} for i in range(len(values.get('loss', [])))
+            ]
+        self.state['completed_phases'].append(phase)
+        self.checkpoint(model, phase, epoch)
+
+    def resume_point(self):
+        """
+        Returns:
+            tuple: (model or None, phase or None, epoch, phase completed)
+        """
+        position = self.state['checkpoint']
+        if position is None or not os.path.exists(self.checkpoint_path):
+            return None, None, 0, False
+        model = keras.models.load_model(self.checkpoint_path)
+        print(f"↩️  Resuming {self.run_id}: {position['phase']} after epoch {position['epoch']}")
+        return model, position['phase'], position['epoch'], position['phase'] in self.state['completed_phases']
+
+    def history(self, phase):
+        """{metric: [per-epoch values]} of a phase, across resumes"""
+        logs = self.state['logs'].get(phase, [])
+        return {k: [entry[k] for entry in logs if k in entry] for k in (logs[0] if logs else {})}
+
+    def best_metric(self, name='val_accuracy'):
+        """Best value of a metric over every logged epoch (None before the first)"""
+        values = [entry[name] for logs in self.state['logs'].values() for entry in logs if name in entry]
+        return max(values) if values else None
+
+    def callback(self, phase):
+        """Per-epoch checkpoint callback for model.fit"""
+        return RunCheckpointCallback(self, phase)
+
+    def finish(self, model, class_names, trained_files=None):
+        """
+        Stage the final float32 model and its metadata as the run's candidate
+
+        Args:
+            model: Float32 model (after TrainingModes.restore)
+            class_names: Output order of the model
+            trained_files: dataset_manifest.training_snapshot result, if the script keeps one
+        """
+        model.save(self.model_path)
+        _write_json_atomic(self.class_mapping_path, {'classes': class_names, 'num_classes': len(class_names)})
+        if trained_files is not None:
+            save_training_snapshot(trained_files, self.trained_files_path)
+        # The candidate supersedes the per-epoch checkpoint
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        self.state['status'] = TRAINED
+        self.state['finished_at'] = time.time()
+        self.save_state()
+        print(f"✓ Candidate model staged at {self.model_path}")
+
+    def promote(self, model=None, gate=config.PROMOTION_GATE):
+        """
+        Make this run's candidate the served model
+
+        The model, class mapping, trained_files.json and a fresh fast-format
+        export are installed as release <run_id>, which then replaces the
+        served one with a single pointer swap (releases.py).
+
+        Args:
+            model: The candidate already in memory (loaded from model.keras otherwise)
+            gate: Evaluate the candidate first and keep it staged if it exceeds a budget
+
+        Returns:
+            bool: True if promoted
+        """
+        if self.state['status'] not in (TRAINED, PROMOTED):
+            raise RuntimeError(f"Run {self.run_id} has no finished model (status: {self.state['status']})")
+        if gate:
+            from evaluate import gate_run
+            passed = gate_run(self)
+            self.state['evaluation'] = {'passed': passed, 'report': os.path.join(self.directory, 'evaluation.json')}
+            self.save_state()
+            if not passed:
+                print(f"\n❌ {self.run_id} not promoted: evaluation budget exceeded (the served model is unchanged)")
+                return False
+        release = install_release(self.run_id, self.model_path, self.class_mapping_path,
+                                  self.trained_files_path, model)
+        activate(release)
+        cleanup_releases()
+        self.state['status'] = PROMOTED
+        self.state['promoted_at'] = time.time()
+        self.save_state()
+        print(f"\n✅ Promoted {self.run_id} to {release.directory}")
+        return True
+
+
+class RunCheckpointCallback(keras.callbacks.Callback):
+    """Seed each epoch from the run and checkpoint after it"""
+
+    def __init__(self, run, phase):
+        super().__init__()
+        self.run = run
+        self.phase = phase
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.run.seed_epoch(epoch)
+
+    def on_epoch_end(self, epoch, logs=None):
+        self.run.checkpoint(self.model, self.phase, epoch + 1, logs)
+
+
+def list_runs(runs_dir=config.RUNS_DIR):
+    """All runs, newest first"""
+    if not os.path.isdir(runs_dir):
+        return []
+    runs = []
+    for name in os.listdir(runs_dir):
+        if os.path.exists(os.path.join(runs_dir, name, 'state.json')):
+            try:
+                runs.append(TrainingRun(os.path.join(runs_dir, name)))
+            except (OSError, ValueError):
+                continue
+    return sorted(runs, key=lambda run: run.state['created_at'], reverse=True)
+
+
+def cleanup_runs(runs_dir=config.RUNS_DIR, keep=config.KEEP_RUNS):
+    """Delete finished runs beyond the newest `keep` (unfinished runs stay resumable)"""
+    finished = [run for run in list_runs(runs_dir) if run.state['status'] != RUNNING]
+    for run in finished[keep:]:
+        shutil.rmtree(run.directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Inspect and promote staged training runs')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List runs, newest first')
+    promote_parser = subparsers.add_parser('promote', help="Make a run's candidate the served model")
+    promote_parser.add_argument('run_id', nargs='?', default=None, help='Default: newest trained run')
+    promote_parser.add_argument('--gate', action=argparse.BooleanOptionalAction, default=config.PROMOTION_GATE,
+                                help='Only promote if the candidate passes evaluate.py budgets')
+    args = parser.parse_args()
+
+    if args.command == 'list':
+        for run in list_runs():
+            position = run.state['checkpoint']
+            where = f"{position['phase']} epoch {position['epoch']}" if position else '-'
+            print(f"{run.run_id:<32} {run.state['status']:<9} {where}")
+    else:
+        run = TrainingRun.find(run_id=args.run_id, status=None if args.run_id else TRAINED)
+        if run is None:
+            print("❌ No such run (or no trained run to promote)")
+            raise SystemExit(1)
+        if not run.promote(gate=args.gate):
+            raise SystemExit(1)